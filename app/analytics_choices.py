@@ -0,0 +1,343 @@
+"""
+Typed, normalized copy of what each query_events row asked for and got back.
+
+    query_choices        one row per choice: zone, month, day, group size
+    query_choice_odds    one row per choice and data year: odds, comparable
+                         date and, in sequential mode, the first-choice odds
+    query_partial_years  one row per data year flagged in partial_years
+    dim_*                dictionaries for repeated text (zones, sessions,
+                         browsers, device types, OS names); query_events
+                         points at them through the *_key columns
+
+query_events also gets typed permit_year, mode and data_years columns.
+
+Questions like "how often is Colchuck on 07-15 requested" become an indexed
+join instead of json_extract over every row. AnalyticsWriter fills these
+tables along with each batch of query_events rows, and stores the
+dictionary-coded text only as keys. When the rows rebuild an event's
+inputs_json and results_json exactly, those are stored empty as well;
+read_events puts everything back for /debug/analytics and the export.
+Rows logged before migrations 4 and 5 are converted by backfill.
+"""
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Dictionary tables, keyed by what they encode
+DIMENSIONS = ("zone", "session", "browser", "device_type", "os")
+
+# query_events column -> (dictionary, key column)
+EVENT_KEYS = {
+    "session_id": ("session", "session_key"),
+    "browser": ("browser", "browser_key"),
+    "device_type": ("device_type", "device_type_key"),
+    "os": ("os", "os_key"),
+}
+
+# Positions in an INSERT_QUERY_EVENT parameter tuple
+_COLUMN_POS = {"session_id": 0, "device_type": 6, "browser": 7, "os": 8}
+_INPUTS_POS, _RESULTS_POS = 12, 13
+
+# query_events columns up to results_json, as in an INSERT_QUERY_EVENT tuple
+_ROW_COLUMNS = ("session_id", "user_id", "event_time_utc", "event_type", "country", "region",
+                "device_type", "browser", "os", "referrer", "sim_version",
+                "query_index_in_session", "inputs_json", "results_json")
+
+NORMALIZED_SCHEMA = [
+    *(f"""CREATE TABLE IF NOT EXISTS dim_{dim} (
+            id    INTEGER PRIMARY KEY,
+            value TEXT NOT NULL UNIQUE
+        )""" for dim in DIMENSIONS),
+    *(f"ALTER TABLE query_events ADD COLUMN {key} INTEGER REFERENCES dim_{dim} (id)"
+      for dim, key in EVENT_KEYS.values()),
+    """CREATE TABLE IF NOT EXISTS query_choices (
+        event_id   INTEGER NOT NULL REFERENCES query_events (id),
+        position   INTEGER NOT NULL,             -- 1, 2, 3 as requested
+        zone_key   INTEGER NOT NULL REFERENCES dim_zone (id),
+        month      INTEGER NOT NULL,
+        day        INTEGER NOT NULL,
+        group_size INTEGER NOT NULL,
+        PRIMARY KEY (event_id, position)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS query_choice_odds (
+        event_id          INTEGER NOT NULL,
+        position          INTEGER NOT NULL,
+        data_year         INTEGER NOT NULL,
+        odds              REAL,                  -- null when the year had no estimate
+        first_choice_odds REAL,                  -- sequential mode only
+        comp_date         TEXT,                  -- MM-DD-YYYY in the data year
+        PRIMARY KEY (event_id, position, data_year),
+        FOREIGN KEY (event_id, position) REFERENCES query_choices (event_id, position)
+    ) WITHOUT ROWID""",
+    """CREATE INDEX IF NOT EXISTS idx_query_choices_zone_date
+        ON query_choices (zone_key, month, day)""",
+    """CREATE INDEX IF NOT EXISTS idx_query_choice_odds_year
+        ON query_choice_odds (data_year)""",
+    *(f"CREATE INDEX IF NOT EXISTS idx_query_events_{key} ON query_events ({key})"
+      for _, key in EVENT_KEYS.values()),
+]
+
+# Typed columns, in INSERT_QUERY_EVENT order after server_latency_ms
+TYPED_COLUMNS = ("permit_year", "mode", "data_years")
+
+TYPED_SCHEMA = [
+    "ALTER TABLE query_events ADD COLUMN permit_year INTEGER",
+    "ALTER TABLE query_events ADD COLUMN mode TEXT",
+    # Comma-separated, in request order, e.g. "2021,2020"
+    "ALTER TABLE query_events ADD COLUMN data_years TEXT",
+    """CREATE TABLE IF NOT EXISTS query_partial_years (
+        event_id  INTEGER NOT NULL REFERENCES query_events (id),
+        data_year INTEGER NOT NULL,
+        reason    TEXT NOT NULL,                 -- "missing", "timeout", "error", "unknown"
+        PRIMARY KEY (event_id, data_year)
+    ) WITHOUT ROWID""",
+]
+
+
+class Dictionaries:
+    """value -> id for every dim_* table, cached for one connection's lifetime."""
+
+    def __init__(self):
+        self._ids: Dict[str, Dict[str, int]] = {dim: {} for dim in DIMENSIONS}
+
+    def key(self, conn: sqlite3.Connection, dim: str, value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+        ids = self._ids[dim]
+        key = ids.get(value)
+        if key is None:
+            conn.execute(f"INSERT OR IGNORE INTO dim_{dim} (value) VALUES (?)", (value,))
+            key = conn.execute(f"SELECT id FROM dim_{dim} WHERE value = ?", (value,)).fetchone()[0]
+            ids[value] = key
+        return key
+
+    def clear(self) -> None:
+        """Forget cached ids, e.g. after a rolled-back transaction."""
+        for ids in self._ids.values():
+            ids.clear()
+
+
+def _loads(text: Optional[str]) -> Any:
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return None
+
+
+class Normalized(NamedTuple):
+    """One query_events row's share of the normalized tables."""
+    typed: Tuple               # TYPED_COLUMNS values
+    choices: List[Tuple]       # (position, zone, month, day, group_size)
+    odds: List[Tuple]          # (position, data_year, odds, first_choice_odds, comp_date)
+    partial: List[Tuple]       # (data_year, reason)
+    lossless: bool             # rebuild() gives back inputs_json and results_json exactly
+
+
+NOT_NORMALIZED = Normalized((None, None, None), [], [], [], False)
+
+
+def _typed(inputs: Dict[str, Any]) -> Tuple:
+    permit_year, mode, years = inputs.get("permit_year"), inputs.get("mode"), inputs.get("data_years")
+    return (
+        permit_year if isinstance(permit_year, int) else None,
+        mode if isinstance(mode, str) else None,
+        ",".join(map(str, years))
+        if isinstance(years, list) and all(isinstance(y, int) for y in years) else None,
+    )
+
+
+def normalize(row: Sequence) -> Normalized:
+    """The normalized rows of an INSERT_QUERY_EVENT parameter tuple (an /estimate_odds event)."""
+    inputs, results = _loads(row[_INPUTS_POS]), _loads(row[_RESULTS_POS])
+    if not isinstance(inputs, dict) or not isinstance(inputs.get("choices"), list):
+        return NOT_NORMALIZED
+    choices, odds, partial = [], [], []
+    result_entries = results.get("choices", []) if isinstance(results, dict) else []
+    for position, c in enumerate(inputs["choices"], start=1):
+        try:
+            choices.append((position, c["zone"], c["month"], c["day"], c["group_size"]))
+        except (KeyError, TypeError):
+            continue
+        if position > len(result_entries) or not isinstance(result_entries[position - 1], dict):
+            continue
+        entry = result_entries[position - 1]
+        first = entry.get("first_choice_odds_by_year") or {}
+        comp = entry.get("comp_dates_by_year") or {}
+        for year, value in (entry.get("odds_by_year") or {}).items():
+            odds.append((position, int(year), value, first.get(year), comp.get(year)))
+    if isinstance(results, dict) and isinstance(results.get("partial_years"), dict):
+        partial = [(int(year), reason) for year, reason in results["partial_years"].items()]
+
+    event = Normalized(_typed(inputs), choices, odds, partial, False)
+    if None in event.typed:
+        return event
+    try:
+        inputs_json, results_json = rebuild(event)
+    except (TypeError, ValueError):
+        return event
+    return event._replace(lossless=(inputs_json, results_json) == (row[_INPUTS_POS], row[_RESULTS_POS]))
+
+
+def rebuild(event: Normalized) -> Tuple[str, str]:
+    """
+    inputs_json and results_json as /estimate_odds logs them (json.dumps of
+    the inputs, the OddsResponse body) from an event's normalized rows.
+    """
+    permit_year, mode, data_years = event.typed
+    years = [int(y) for y in data_years.split(",") if y]
+    order = {year: i for i, year in enumerate(years)}
+
+    def by_year(row: Sequence) -> int:
+        return order.get(row[0], len(order))
+
+    odds: Dict[int, List[Tuple]] = {}
+    for position, *values in event.odds:
+        odds.setdefault(position, []).append(values)
+
+    entries = []
+    for position, zone, month, day, group_size in event.choices:
+        rows = sorted(odds.get(position, []), key=by_year)
+        entry = {
+            "index": position, "zone": zone, "month": month, "day": day, "group_size": group_size,
+            "display_date": f"{month:02d}-{day:02d}-{permit_year}",
+            "odds_by_year": {str(y): value for y, value, _, _ in rows},
+            "comp_dates_by_year": {str(y): comp for y, _, _, comp in rows},
+        }
+        if any(first is not None for _, _, first, _ in rows):
+            entry["first_choice_odds_by_year"] = {str(y): first for y, _, first, _ in rows}
+        entries.append(entry)
+
+    inputs = {
+        "permit_year": permit_year,
+        "data_years": years,
+        "mode": mode,
+        "choices": [{"zone": zone, "month": month, "day": day, "group_size": group_size}
+                    for _, zone, month, day, group_size in event.choices],
+    }
+    results = {
+        "years": years,
+        "mode": mode,
+        "choices": entries,
+        "partial_years": {str(y): reason for y, reason in sorted(event.partial, key=by_year)},
+    }
+    return json.dumps(inputs), json.dumps(results, separators=(",", ":"))
+
+
+def stored_row(row: Sequence, event: Normalized) -> Tuple:
+    """
+    An INSERT_QUERY_EVENT parameter tuple as stored: without the text the
+    dictionary keys encode and, when rebuild() gives them back, without the
+    JSON blobs. session_id, inputs_json and results_json are NOT NULL, so
+    they are stored empty.
+    """
+    stored = list(row)
+    stored[_COLUMN_POS["session_id"]] = ""
+    for column in ("device_type", "browser", "os"):
+        stored[_COLUMN_POS[column]] = None
+    if event.lossless:
+        stored[_INPUTS_POS] = stored[_RESULTS_POS] = ""
+    return tuple(stored)
+
+
+def event_keys(conn: sqlite3.Connection, row: Sequence, dicts: Dictionaries) -> Tuple:
+    """Dictionary keys (EVENT_KEYS order) of an INSERT_QUERY_EVENT parameter tuple."""
+    return tuple(dicts.key(conn, dim, row[_COLUMN_POS[col]]) for col, (dim, _) in EVENT_KEYS.items())
+
+
+def insert_choices(conn: sqlite3.Connection, events: Iterable[Tuple[int, Normalized]],
+                   dicts: Dictionaries) -> None:
+    """
+    Write the query_choices, query_choice_odds and query_partial_years rows
+    of (event id, normalize() result) pairs. Runs in the caller's transaction.
+    """
+    choices, odds, partial = [], [], []
+    for event_id, event in events:
+        for position, zone, month, day, group_size in event.choices:
+            choices.append((event_id, position, dicts.key(conn, "zone", zone), month, day, group_size))
+        odds.extend((event_id, *o) for o in event.odds)
+        partial.extend((event_id, *p) for p in event.partial)
+    conn.executemany("INSERT OR REPLACE INTO query_choices VALUES (?, ?, ?, ?, ?, ?)", choices)
+    conn.executemany("INSERT OR REPLACE INTO query_choice_odds VALUES (?, ?, ?, ?, ?, ?)", odds)
+    conn.executemany("INSERT OR REPLACE INTO query_partial_years VALUES (?, ?, ?)", partial)
+
+
+def backfill(conn: sqlite3.Connection, after_id: int, upto_id: int) -> int:
+    """
+    Normalize the query_events rows with after_id < id <= upto_id as
+    AnalyticsWriter does new ones (see analytics_schema.run_backfills).
+    Rows already stored without their blobs are skipped; keys already set
+    are kept, so a range can be run again. Returns the row count.
+    """
+    dicts = Dictionaries()
+    keys = [key for _, key in EVENT_KEYS.values()]
+    rows = conn.execute(
+        f"""SELECT id, {', '.join(keys)}, {', '.join(_ROW_COLUMNS)} FROM query_events
+            WHERE id > ? AND id <= ? AND inputs_json != ''""",
+        (after_id, upto_id)).fetchall()
+    updates, events = [], []
+    for event_id, *values in rows:
+        old_keys, row = values[:len(keys)], values[len(keys):]
+        new_keys = tuple(key if key is not None else dicts.key(conn, dim, row[_COLUMN_POS[col]])
+                         for key, (col, (dim, _)) in zip(old_keys, EVENT_KEYS.items()))
+        event = normalize(row)
+        stored = stored_row(row, event)
+        updates.append((*new_keys, *(stored[_COLUMN_POS[col]] for col in EVENT_KEYS),
+                        stored[_INPUTS_POS], stored[_RESULTS_POS], *event.typed, event_id))
+        events.append((event_id, event))
+    columns = [*keys, *EVENT_KEYS, "inputs_json", "results_json", *TYPED_COLUMNS]
+    conn.executemany(f"UPDATE query_events SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                     updates)
+    insert_choices(conn, events, dicts)
+    return len(rows)
+
+
+# --- Reading events back ---
+
+def _normalized_rows(conn: sqlite3.Connection, event_ids: List[int],
+                     chunk: int = 500) -> Dict[int, Tuple[List, List, List]]:
+    """event id -> (choices, odds, partial) as in Normalized."""
+    found: Dict[int, Tuple[List, List, List]] = {event_id: ([], [], []) for event_id in event_ids}
+    queries = (
+        """SELECT c.event_id, c.position, z.value, c.month, c.day, c.group_size
+           FROM query_choices c JOIN dim_zone z ON z.id = c.zone_key
+           WHERE c.event_id IN ({}) ORDER BY c.event_id, c.position""",
+        """SELECT event_id, position, data_year, odds, first_choice_odds, comp_date
+           FROM query_choice_odds WHERE event_id IN ({})""",
+        """SELECT event_id, data_year, reason FROM query_partial_years WHERE event_id IN ({})""",
+    )
+    for start in range(0, len(event_ids), chunk):
+        ids = event_ids[start:start + chunk]
+        marks = ", ".join("?" * len(ids))
+        for i, sql in enumerate(queries):
+            for event_id, *values in conn.execute(sql.format(marks), ids):
+                found[event_id][i].append(tuple(values))
+    return found
+
+
+def read_events(conn: sqlite3.Connection, columns: Sequence[str], where: str = "1 = 1",
+                params: Sequence = (), order: str = "id", limit: int = -1) -> List[Tuple]:
+    """
+    query_events rows (just `columns`, in that order) as they were logged:
+    dictionary-coded text looked up and empty blobs rebuilt from the
+    normalized rows. `where` and `order` are applied to query_events itself.
+    """
+    values = [f"COALESCE(dim_{EVENT_KEYS[c][0]}.value, e.{c})" if c in EVENT_KEYS else f"e.{c}"
+              for c in columns]
+    joins = " ".join(f"LEFT JOIN dim_{dim} ON dim_{dim}.id = e.{key}"
+                     for dim, key in EVENT_KEYS.values())
+    rows = conn.execute(
+        f"""SELECT e.id, e.inputs_json = '', {', '.join(f'e.{c}' for c in TYPED_COLUMNS)},
+                   {', '.join(values)}
+            FROM (SELECT * FROM query_events WHERE {where} ORDER BY {order} LIMIT ?) AS e {joins}
+            ORDER BY e.{order}""",
+        (*params, limit)).fetchall()
+
+    normalized = _normalized_rows(conn, [row[0] for row in rows if row[1]])
+    out = []
+    for event_id, compact, permit_year, mode, data_years, *values in rows:
+        if compact:
+            event = Normalized((permit_year, mode, data_years), *normalized[event_id], True)
+            blobs = dict(zip(("inputs_json", "results_json"), rebuild(event)))
+            values = [blobs.get(c, v) for c, v in zip(columns, values)]
+        out.append(tuple(values))
+    return out
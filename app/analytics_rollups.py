@@ -0,0 +1,270 @@
+"""
+Pre-aggregated views of query_events, and a streaming export of its rows.
+
+The rollup tables are kept current by AnalyticsWriter: every batch of
+query_events rows is folded into them in the same transaction, so
+dashboards read a few small tables instead of parsing inputs_json on every
+view. Rows logged before the tables existed are folded in afterwards, in
+id-ranged batches, by analytics_schema.run_backfills.
+
+    rollup_zone_date_hour   queries per hour, zone and requested month/day
+    rollup_choice_sets      how often each exact choice set was requested
+    rollup_latency          server_latency_ms histogram per hour and event type
+"""
+import csv
+import io
+import json
+import sqlite3
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .analytics_choices import read_events
+
+# Upper bounds (ms) of the latency histogram; slower events land in OVERFLOW_MS
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+OVERFLOW_MS = 2 ** 31 - 1
+
+ROLLUP_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS rollup_zone_date_hour (
+        hour_utc TEXT NOT NULL,                  -- e.g. 2025-12-12T03
+        zone     TEXT NOT NULL,
+        month    INTEGER NOT NULL,
+        day      INTEGER NOT NULL,
+        queries  INTEGER NOT NULL,
+        PRIMARY KEY (hour_utc, zone, month, day)
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_rollup_zone_date_hour_zone
+        ON rollup_zone_date_hour (zone, month, day)""",
+    """CREATE TABLE IF NOT EXISTS rollup_choice_sets (
+        choice_set    TEXT PRIMARY KEY,          -- JSON [[zone, month, day, group_size], ...]
+        choices       INTEGER NOT NULL,
+        queries       INTEGER NOT NULL,
+        last_seen_utc TEXT NOT NULL
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_rollup_choice_sets_queries
+        ON rollup_choice_sets (queries)""",
+    """CREATE TABLE IF NOT EXISTS rollup_latency (
+        hour_utc   TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        bucket_ms  INTEGER NOT NULL,             -- histogram upper bound
+        events     INTEGER NOT NULL,
+        PRIMARY KEY (hour_utc, event_type, bucket_ms)
+    )""",
+]
+
+# Positions of the columns the rollups read in an INSERT_QUERY_EVENT parameter tuple
+EVENT_COLUMNS = (2, 3, 12, 16)
+
+
+def _choice_sets(inputs: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+    """Choice sets of one logged request: one for /estimate_odds, many for a batch."""
+    if "choices" in inputs:
+        return [inputs["choices"]]
+    return inputs.get("choice_sets") or []
+
+
+def apply_rows(conn: sqlite3.Connection, rows: Iterable[Sequence]) -> None:
+    """
+    Fold (event_time_utc, event_type, inputs_json, server_latency_ms) rows
+    of query_events into the rollup tables. Runs in the caller's transaction.
+    """
+    zone_dates: Counter = Counter()
+    choice_sets: Counter = Counter()
+    sizes: Dict[str, int] = {}
+    last_seen: Dict[str, str] = {}
+    latency: Counter = Counter()
+
+    for event_time, event_type, inputs_json, server_latency_ms in rows:
+        hour = event_time[:13]
+        if server_latency_ms is not None:
+            i = bisect_left(LATENCY_BUCKETS_MS, server_latency_ms)
+            bucket = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else OVERFLOW_MS
+            latency[(hour, event_type, bucket)] += 1
+        try:
+            inputs = json.loads(inputs_json)
+            sets = _choice_sets(inputs) if isinstance(inputs, dict) else []
+            for choices in sets:
+                key = json.dumps([[c["zone"], c["month"], c["day"], c["group_size"]]
+                                  for c in choices], separators=(",", ":"))
+                choice_sets[key] += 1
+                sizes[key] = len(choices)
+                last_seen[key] = max(last_seen.get(key, ""), event_time)
+                for c in choices:
+                    zone_dates[(hour, c["zone"], c["month"], c["day"])] += 1
+        except (ValueError, TypeError, KeyError):
+            # Test/debug events and malformed inputs only count for latency
+            continue
+
+    conn.executemany(
+        """INSERT INTO rollup_zone_date_hour VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (hour_utc, zone, month, day)
+           DO UPDATE SET queries = queries + excluded.queries""",
+        [(*k, n) for k, n in zone_dates.items()])
+    conn.executemany(
+        """INSERT INTO rollup_choice_sets VALUES (?, ?, ?, ?)
+           ON CONFLICT (choice_set)
+           DO UPDATE SET queries = queries + excluded.queries,
+                         last_seen_utc = MAX(last_seen_utc, excluded.last_seen_utc)""",
+        [(k, sizes[k], n, last_seen[k]) for k, n in choice_sets.items()])
+    conn.executemany(
+        """INSERT INTO rollup_latency VALUES (?, ?, ?, ?)
+           ON CONFLICT (hour_utc, event_type, bucket_ms)
+           DO UPDATE SET events = events + excluded.events""",
+        [(*k, n) for k, n in latency.items()])
+
+
+def backfill(conn: sqlite3.Connection, after_id: int, upto_id: int) -> int:
+    """
+    Fold the query_events rows with after_id < id <= upto_id into the rollups
+    (see analytics_schema.run_backfills). Returns the row count.
+    """
+    rows = conn.execute(
+        """SELECT event_time_utc, event_type, inputs_json, server_latency_ms
+           FROM query_events WHERE id > ? AND id <= ?""",
+        (after_id, upto_id)).fetchall()
+    apply_rows(conn, rows)
+    return len(rows)
+
+
+# --- Reading the rollups ---
+
+def _until_bound(until: str, width: Optional[int] = None) -> Tuple[str, str]:
+    """
+    (operator, value) for an inclusive until compared as an ISO string. A bare
+    date sorts before every timestamp on that day, so it becomes "< next day";
+    a timestamp is cut to width characters and compared with "<=".
+    """
+    if len(until) == 10:
+        return "<", (date.fromisoformat(until) + timedelta(days=1)).isoformat()
+    return "<=", until[:width]
+
+
+def _hour_filter(since: Optional[str], until: Optional[str]) -> Tuple[str, List[str]]:
+    """WHERE clause on hour_utc; since/until are ISO timestamps or dates (UTC, inclusive)."""
+    clauses, params = ["1 = 1"], []
+    if since:
+        clauses.append("hour_utc >= ?")
+        params.append(since[:13])
+    if until:
+        op, bound = _until_bound(until, 13)
+        clauses.append(f"hour_utc {op} ?")
+        params.append(bound)
+    return " AND ".join(clauses), params
+
+
+def zone_date_counts(conn: sqlite3.Connection, since: Optional[str] = None,
+                     until: Optional[str] = None, zone: Optional[str] = None,
+                     by_hour: bool = False, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Queries per zone and requested date (and hour), most requested first."""
+    where, params = _hour_filter(since, until)
+    if zone:
+        where += " AND zone = ?"
+        params.append(zone)
+    hour = "hour_utc, " if by_hour else ""
+    cur = conn.execute(
+        f"""SELECT {hour}zone, month, day, SUM(queries) AS queries
+            FROM rollup_zone_date_hour WHERE {where}
+            GROUP BY {hour}zone, month, day
+            ORDER BY queries DESC LIMIT ?""",
+        (*params, limit))
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+def top_choice_sets(conn: sqlite3.Connection, limit: int = 20) -> List[Dict[str, Any]]:
+    rows = conn.execute(
+        """SELECT choice_set, queries, last_seen_utc FROM rollup_choice_sets
+           ORDER BY queries DESC LIMIT ?""", (limit,)).fetchall()
+    return [
+        {
+            "choices": [dict(zip(("zone", "month", "day", "group_size"), c)) for c in json.loads(cs)],
+            "queries": queries,
+            "last_seen_utc": last_seen,
+        }
+        for cs, queries, last_seen in rows
+    ]
+
+
+def latency_percentiles(conn: sqlite3.Connection, since: Optional[str] = None,
+                        until: Optional[str] = None,
+                        quantiles: Sequence[float] = (0.5, 0.95, 0.99)) -> Dict[str, Dict[str, Any]]:
+    """
+    server_latency_ms percentiles per event type, as histogram bucket upper
+    bounds (None for the overflow bucket).
+    """
+    where, params = _hour_filter(since, until)
+    hist: Dict[str, List[Tuple[int, int]]] = {}
+    for event_type, bucket, events in conn.execute(
+            f"""SELECT event_type, bucket_ms, SUM(events) FROM rollup_latency WHERE {where}
+                GROUP BY event_type, bucket_ms ORDER BY event_type, bucket_ms""", params):
+        hist.setdefault(event_type, []).append((bucket, events))
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for event_type, buckets in hist.items():
+        total = sum(n for _, n in buckets)
+        stats: Dict[str, Any] = {"events": total}
+        for q in quantiles:
+            seen = 0
+            for bound, n in buckets:
+                seen += n
+                if seen >= q * total:
+                    break
+            stats[f"p{q * 100:g}_ms"] = bound if bound != OVERFLOW_MS else None
+        out[event_type] = stats
+    return out
+
+
+# --- Streaming export ---
+
+EXPORT_COLUMNS = (
+    "id", "session_id", "user_id", "event_time_utc", "event_type", "country", "region",
+    "device_type", "browser", "os", "referrer", "sim_version", "query_index_in_session",
+    "inputs_json", "results_json", "latency_ms", "status", "server_latency_ms",
+)
+
+
+def export_events(conn: sqlite3.Connection, fmt: str = "ndjson", since: Optional[str] = None,
+                  until: Optional[str] = None, event_type: Optional[str] = None,
+                  chunk_rows: int = 1000) -> Iterator[str]:
+    """
+    query_events rows in id order, as logged (see analytics_choices.read_events),
+    as CSV or NDJSON text chunks of about chunk_rows rows. Pages by id, so
+    memory stays flat and no read transaction is held open while the client
+    consumes the stream.
+    """
+    clauses, params = ["id > ?"], []
+    if since:
+        clauses.append("event_time_utc >= ?")
+        params.append(since)
+    if until:
+        op, bound = _until_bound(until)
+        clauses.append(f"event_time_utc {op} ?")
+        params.append(bound)
+    if event_type:
+        clauses.append("event_type = ?")
+        params.append(event_type)
+    where = " AND ".join(clauses)
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n") if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(EXPORT_COLUMNS)
+    last_id = 0
+    while True:
+        rows = read_events(conn, EXPORT_COLUMNS, where, (last_id, *params), "id", chunk_rows)
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        if writer is not None:
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                buf.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))))
+                buf.write("\n")
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
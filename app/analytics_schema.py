@@ -0,0 +1,218 @@
+"""
+Versioned schema migrations for analytics.db.
+
+Applied versions are recorded in a schema_version table. migrate() is
+cheap once the file is current (one SELECT), and safe to call from several
+workers starting at once: pending migrations run inside a BEGIN IMMEDIATE
+transaction, so the first worker applies them and the others wait on the
+lock and then find nothing left to do.
+
+Migrations only change the schema. Filling new tables from the rows
+already logged is queued in pending_backfills and done by run_backfills,
+in small batches after the server is up (see backfill_in_background) or
+from the command line:
+
+    python -m app.analytics_schema odds_database/analytics.db
+"""
+import argparse
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import analytics_choices, analytics_rollups
+
+
+def _statements(sql: str) -> List[str]:
+    """Split a script into statements (executescript would commit mid-migration)."""
+    statements, current = [], ""
+    for line in sql.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    return statements
+
+
+def _initial_schema(conn: sqlite3.Connection, schema_path: Path) -> None:
+    with schema_path.open("r", encoding="utf-8") as f:
+        for statement in _statements(f.read()):
+            conn.execute(statement)
+
+
+def _server_latency_column(conn: sqlite3.Connection, schema_path: Path) -> None:
+    # Files created before the column existed keep their old query_events table
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(query_events)")}
+    if "server_latency_ms" not in columns:
+        conn.execute("ALTER TABLE query_events ADD COLUMN server_latency_ms INTEGER")
+
+
+def _queue_backfill(conn: sqlite3.Connection, name: str) -> None:
+    """Have run_backfills fold the rows logged so far into a migration's new tables."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS pending_backfills (
+                        name    TEXT PRIMARY KEY,    -- see BACKFILLS
+                        last_id INTEGER NOT NULL,    -- query_events rows up to here are done
+                        end_id  INTEGER NOT NULL)    -- the writer covers the rows after this""")
+    end_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM query_events").fetchone()[0]
+    if end_id:
+        conn.execute("INSERT OR REPLACE INTO pending_backfills VALUES (?, 0, ?)", (name, end_id))
+
+
+def _rollup_tables(conn: sqlite3.Connection, schema_path: Path) -> None:
+    for statement in analytics_rollups.ROLLUP_SCHEMA:
+        conn.execute(statement)
+    _queue_backfill(conn, "rollups")
+
+
+def _normalized_choices(conn: sqlite3.Connection, schema_path: Path) -> None:
+    for statement in analytics_choices.NORMALIZED_SCHEMA:
+        conn.execute(statement)
+    _queue_backfill(conn, "choices")
+
+
+def _typed_columns(conn: sqlite3.Connection, schema_path: Path) -> None:
+    for statement in analytics_choices.TYPED_SCHEMA:
+        conn.execute(statement)
+    # Rows normalized by an older migration 4 still carry their blobs
+    _queue_backfill(conn, "choices")
+
+
+# (version, description, apply(conn, schema_path)), in order
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection, Path], None]]] = [
+    (1, "query_events table and indexes from schema.sql", _initial_schema),
+    (2, "query_events.server_latency_ms", _server_latency_column),
+    (3, "rollup tables; query_events backfill queued", _rollup_tables),
+    (4, "query_choices, query_choice_odds and dictionary keys; backfill queued", _normalized_choices),
+    (5, "query_events typed columns and query_partial_years; backfill queued", _typed_columns),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# pending_backfills name -> backfill(conn, after_id, upto_id), which folds
+# those query_events rows into the tables a migration added. They run in the
+# order they were queued: "rollups" reads inputs_json, which "choices" empties.
+BACKFILLS: Dict[str, Callable[[sqlite3.Connection, int, int], int]] = {
+    "rollups": analytics_rollups.backfill,
+    "choices": analytics_choices.backfill,
+}
+
+
+def _current_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_utc TEXT NOT NULL)""")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(db_path: Path, schema_path: Path, timeout: float = 30.0) -> List[int]:
+    """Bring db_path up to LATEST_VERSION. Returns the versions applied by this call."""
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    try:
+        if _current_version(conn) >= LATEST_VERSION:
+            return []
+        applied: List[int] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock; another worker may have migrated
+            current = _current_version(conn)
+            for version, description, apply in MIGRATIONS:
+                if version <= current:
+                    continue
+                apply(conn, schema_path)
+                conn.execute("INSERT INTO schema_version VALUES (?, ?, ?)",
+                             (version, description, datetime.now(timezone.utc).isoformat()))
+                applied.append(version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return applied
+    finally:
+        conn.close()
+
+
+def pending_backfills(conn: sqlite3.Connection) -> Dict[str, Dict[str, int]]:
+    """{name: {"last_id", "end_id"}} of the backfills not finished yet."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'pending_backfills'").fetchone():
+        return {}
+    return {name: {"last_id": last_id, "end_id": end_id} for name, last_id, end_id in
+            conn.execute("SELECT name, last_id, end_id FROM pending_backfills ORDER BY rowid")}
+
+
+def run_backfills(db_path: Path, batch_size: int = 2000, pause: float = 0.05,
+                  stop: Optional[threading.Event] = None, timeout: float = 30.0) -> Dict[str, int]:
+    """
+    Work through pending_backfills, batch_size query_events ids per short
+    transaction, pausing between batches so the AnalyticsWriter is not
+    locked out. Each batch re-reads its position under the write lock and
+    records the new one before committing, so several workers can run this
+    at once and an interrupted run resumes where it stopped. Returns the
+    rows backfilled per name.
+    """
+    done: Dict[str, int] = {}
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    try:
+        while (stop is None or not stop.is_set()) and pending_backfills(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("""SELECT name, last_id, end_id FROM pending_backfills
+                                      ORDER BY rowid LIMIT 1""").fetchone()
+                if row is not None:
+                    name, last_id, end_id = row
+                    upto_id = min(last_id + batch_size, end_id)
+                    done[name] = done.get(name, 0) + BACKFILLS[name](conn, last_id, upto_id)
+                    if upto_id >= end_id:
+                        conn.execute("DELETE FROM pending_backfills WHERE name = ?", (name,))
+                    else:
+                        conn.execute("UPDATE pending_backfills SET last_id = ? WHERE name = ?",
+                                     (upto_id, name))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if stop is not None:
+                stop.wait(pause)
+            else:
+                time.sleep(pause)
+        return done
+    finally:
+        conn.close()
+
+
+def backfill_in_background(db_path: Path, stop: threading.Event) -> threading.Thread:
+    """run_backfills on a daemon thread until done or `stop` is set; errors are logged."""
+    def run():
+        try:
+            done = run_backfills(db_path, stop=stop)
+            if done:
+                print("Analytics backfill:", ", ".join(f"{n} {name} rows" for name, n in done.items()))
+        except Exception:
+            print("Analytics backfill failed; it resumes on the next start:",
+                  traceback.format_exc(limit=3))
+
+    thread = threading.Thread(target=run, name="analytics-backfill", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Migrate analytics.db and run its pending backfills to completion.")
+    parser.add_argument("db_path", type=Path)
+    parser.add_argument("--schema", type=Path,
+                        default=Path(__file__).resolve().parent.parent / "schema.sql")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    applied = migrate(args.db_path, args.schema)
+    print(f"applied migrations: {applied or 'none'}")
+    for name, n in run_backfills(args.db_path, args.batch_size, pause=0).items():
+        print(f"backfilled {n} rows into {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .analytics_choices import Dictionaries, event_keys, insert_choices, normalize, stored_row
+from .analytics_rollups import EVENT_COLUMNS, apply_rows
+
+INSERT_QUERY_EVENT = """
+    INSERT INTO query_events (
+        session_id, user_id,
+        event_time_utc, event_type,
+        country, region, device_type, browser, os, referrer,
+        sim_version, query_index_in_session,
+        inputs_json, results_json,
+        latency_ms, status, server_latency_ms,
+        permit_year, mode, data_years,
+        session_key, browser_key, device_type_key, os_key
+    ) VALUES (
+        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+    )
+"""
+
+
+class _Flush:
+    """Queue marker: set `done` once everything queued before it is written."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class AnalyticsWriter:
+    """
+    Background writer for query_events rows.
+
+    Requests hand rows to submit(), which never blocks: a single thread owns
+    one long-lived WAL-mode connection and inserts queued rows in batched
+    transactions once `batch_size` rows are waiting or `flush_interval`
+    seconds have passed. When the queue is full new rows are dropped and
+    counted instead of slowing the request down. Each batch is also folded
+    into the rollup tables (see analytics_rollups) and the normalized choice
+    tables (see analytics_choices) in the same transaction; the text and
+    JSON those tables hold is not stored again in query_events.
+    """
+
+    def __init__(self, db_path: Path, max_queue: int = 10000,
+                 batch_size: int = 200, flush_interval: float = 0.5):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._dicts = Dictionaries()
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, row: Tuple) -> bool:
+        """
+        Queue one query_events row (the INSERT_QUERY_EVENT parameters up to
+        server_latency_ms; the writer adds the typed columns and dictionary
+        keys). False if it was dropped.
+        """
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every row queued so far has been written (or failed)."""
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        marker = _Flush()
+        # Markers must not be dropped, so this one may block briefly
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write everything still queued, then stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "dropped": self.dropped,
+                "written": self.written,
+                "batches": self.batches,
+                "failed": self.failed,
+                "last_error": self.last_error,
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL only syncs at checkpoints, not on every commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, conn: sqlite3.Connection, rows: List[Tuple]) -> None:
+        if not rows:
+            return
+        try:
+            with conn:
+                # One execute per row for the ids the child tables refer to
+                events = []
+                for row in rows:
+                    event = normalize(row)
+                    keys = event_keys(conn, row, self._dicts)
+                    params = (*stored_row(row, event), *event.typed, *keys)
+                    events.append((conn.execute(INSERT_QUERY_EVENT, params).lastrowid, event))
+                apply_rows(conn, ([row[i] for i in EVENT_COLUMNS] for row in rows))
+                insert_choices(conn, events, self._dicts)
+            with self._lock:
+                self.written += len(rows)
+                self.batches += 1
+        except Exception as e:
+            # Dictionary ids inserted by the rolled-back transaction are gone
+            self._dicts.clear()
+            with self._lock:
+                self.failed += len(rows)
+                self.last_error = str(e)
+            print("Analytics logging failed:", e)
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                rows: List[Tuple] = []
+                markers: List[_Flush] = []
+                stop = False
+                deadline = time.monotonic() + self.flush_interval
+
+                # Gather a batch: until it is full, the interval passes, or
+                # someone asks for a flush/stop
+                while True:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    if isinstance(item, _Flush):
+                        markers.append(item)
+                        break
+                    rows.append(item)
+                    if len(rows) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+
+                self._write(conn, rows)
+                for marker in markers:
+                    marker.done.set()
+                if stop:
+                    break
+
+            # Rows queued behind the stop marker
+            rest: List[Tuple] = []
+            markers = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, _Flush):
+                    markers.append(item)
+                elif item is not _STOP:
+                    rest.append(item)
+            self._write(conn, rest)
+            for marker in markers:
+                marker.done.set()
+        finally:
+            conn.close()
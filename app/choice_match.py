@@ -0,0 +1,331 @@
+import itertools
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import record_passes
+
+# Window-widening search limits, as in odds_engine.EstC2Odds / EstC3Odds
+MAX_PASSES = 10
+MAX_MATCHES = 30
+
+
+class _Candidates:
+    """
+    Precomputed historical choice sets for one data year.
+
+    Odds are stored as uint16 codes into `values` (the sorted distinct avgodds
+    of the year), so window tests on codes are exact comparisons against the
+    original float values. Rows are sorted by their window columns, packed
+    into one int64 key, so each pass binary-searches one run of the key per
+    combination of leading-column codes instead of scanning rows; `pos` keeps
+    the row order of the SQL join, which decides ties between equally close
+    rows and the order the oversized fallback sums in.
+    """
+
+    # Above this many leading-code combinations (very wide windows) a pass
+    # slices on the first column and filters the rest instead
+    MAX_RUNS = 20000
+
+    def __init__(self, values: np.ndarray, cols: List[np.ndarray], nkey: int):
+        """cols are given in the SQL join's row order."""
+        pos = np.arange(len(cols[0]), dtype=np.int32)
+        order = np.lexsort(cols[:nkey][::-1])
+        self.values = values
+        self.cols = [c[order] for c in cols]
+        self.pos = pos[order]
+        self.nkey = nkey
+        self.key = np.zeros(len(pos), dtype=np.int64)
+        for c in self.cols[:nkey]:
+            self.key = self.key * len(values) + c
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Every array of the (already sorted) candidates, for from_arrays."""
+        arrays = {"values": self.values, "pos": self.pos, "key": self.key}
+        arrays.update((f"col{i}", c) for i, c in enumerate(self.cols))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], nkey: int) -> "_Candidates":
+        """Candidates over arrays from arrays(), e.g. views of shared memory, without copying."""
+        self = cls.__new__(cls)
+        self.values = arrays["values"]
+        self.cols = [arrays[f"col{i}"] for i in range(sum(1 for k in arrays if k.startswith("col")))]
+        self.pos = arrays["pos"]
+        self.nkey = nkey
+        self.key = arrays["key"]
+        return self
+
+    def window(self, targets: Tuple[float, ...], moes: Tuple[float, ...]) -> np.ndarray:
+        """Indices of rows with every window column strictly inside its window (unordered)."""
+        bounds = []
+        for t, m in zip(targets, moes):
+            lo = np.searchsorted(self.values, t - m, side="right")
+            hi = np.searchsorted(self.values, t + m, side="left")
+            if hi <= lo:
+                return np.zeros(0, dtype=np.int64)
+            bounds.append((int(lo), int(hi)))
+
+        nvalues = len(self.values)
+        runs = math.prod(hi - lo for lo, hi in bounds[:-1])
+        if runs > self.MAX_RUNS:
+            scale = nvalues ** (self.nkey - 1)
+            start = np.searchsorted(self.key, bounds[0][0] * scale, side="left")
+            stop = np.searchsorted(self.key, bounds[0][1] * scale, side="left")
+            idx = np.arange(start, stop)
+            for col, (lo, hi) in zip(self.cols[1:], bounds[1:]):
+                c = col[idx]
+                idx = idx[(c >= lo) & (c < hi)]
+            return idx
+
+        # Key prefix of every combination of leading-column codes
+        base = np.zeros(1, dtype=np.int64)
+        for lo, hi in bounds[:-1]:
+            base = (base[:, None] * nvalues + np.arange(lo, hi, dtype=np.int64)).ravel()
+        base = base * nvalues
+        lo, hi = bounds[-1]
+        starts = np.searchsorted(self.key, base + lo, side="left")
+        lens = np.searchsorted(self.key, base + hi, side="left") - starts
+        offsets = starts - (np.cumsum(lens) - lens)
+        return np.arange(int(lens.sum()), dtype=np.int64) + np.repeat(offsets, lens)
+
+    def canonical(self, idx: np.ndarray) -> np.ndarray:
+        """idx in the SQL join's row order."""
+        return idx[np.argsort(self.pos[idx], kind="stable")]
+
+    def odds(self, col: int, idx: np.ndarray) -> np.ndarray:
+        return self.values[self.cols[col][idx]]
+
+    def upper_bound(self, target: float, moe: float, result_col: int) -> float:
+        """
+        Largest result-column odds among rows whose first window column is
+        within moe of target: at least anything _search can return when that
+        column's window never grows past moe. 0.0 if there are none.
+        """
+        cache = self.__dict__.setdefault("_max_result", {})
+        by_code = cache.get(result_col)
+        if by_code is None:
+            # Highest result code per window-column code (-1 where none); rows
+            # are sorted by the key, so each code's rows are one run
+            by_code = np.full(len(self.values), -1, dtype=np.int64)
+            codes, starts = np.unique(self.cols[0], return_index=True)
+            if len(codes):
+                by_code[codes] = np.maximum.reduceat(self.cols[result_col], starts)
+            cache[result_col] = by_code
+        lo = np.searchsorted(self.values, target - moe, side="left")
+        hi = np.searchsorted(self.values, target + moe, side="right")
+        best = int(by_code[lo:hi].max(initial=-1))
+        return float(self.values[best]) if best >= 0 else 0.0
+
+    def mean(self, col: int, idx: np.ndarray) -> float:
+        # Summed one by one in the SQL join's row order, as the SQL loop does
+        # (cumsum adds left to right; sum() would add pairwise)
+        vals = self.odds(col, self.canonical(idx))
+        return float(np.cumsum(vals)[-1]) / len(vals)
+
+
+def _widest(moe: float, scale) -> float:
+    """The widest a window starting at moe can get in _search (plus rounding slack)."""
+    return moe * scale[0] ** (MAX_PASSES - 1) + 1e-9
+
+
+def _search(cands: _Candidates, targets, moes, scale, error, result_col, shape):
+    """
+    The window-widening loop shared by EstC2Odds and EstC3Odds: shrink the
+    windows while there are more than MAX_MATCHES rows, widen them while
+    there are none, and pick the lowest-error row once 1..MAX_MATCHES match.
+    If no pass lands in that range, average the smallest oversized match.
+    """
+    moes = list(moes)
+    lowest = None
+    lowest_count = 0
+    k = 1
+    while k < MAX_PASSES + 1:
+        idx = cands.window(targets, moes)
+        n = len(idx)
+
+        if n > 0 and lowest is None:
+            lowest, lowest_count = idx, n
+
+        if n == 1:
+            record_passes(shape, k)
+            return float(cands.odds(result_col, idx)[0])
+        elif 1 < n <= MAX_MATCHES:
+            record_passes(shape, k)
+            # The first of equally close rows wins, as in the SQL loop
+            idx = cands.canonical(idx)
+            err = error(idx)
+            return float(cands.odds(result_col, idx)[int(np.argmin(err))])
+        elif n > MAX_MATCHES:
+            moes = [m * scale[1] for m in moes]
+            if n < lowest_count:
+                lowest, lowest_count = idx, n
+        else:
+            moes = [m * scale[0] for m in moes]
+        k = k + 1
+
+    record_passes(shape, MAX_PASSES)
+    if lowest is None:
+        raise LookupError("No comparable choice sets found")
+    return cands.mean(result_col, lowest)
+
+
+class ChoiceSetMatcher:
+    """
+    Nearest-historical-choice-set search for one data year, built from a
+    YearOdds snapshot. est_c2_odds / est_c3_odds return the same values as
+    odds_engine.EstC2Odds / EstC3Odds without running any SQL joins.
+
+    Candidate rows are the results of the EstC2Odds join,
+    (c1odds, c2a1odds, c2odds), and of the EstC3Odds join,
+    (c3odds, c3a1odds, c2odds, c1odds), over the whole year, in the row
+    order those joins sort by (rowids and avgodds, see odds_engine).
+    """
+
+    # Starting windows and (widen, shrink) factors of each search
+    C2_MOES, C3_MOES = (0.01, 0.02), (0.01, 0.01, 0.01)
+    SCALE = (1.5, 0.5)
+
+    # Window-column count of the c2 / c3 candidates
+    NKEY = {"c2": 2, "c3": 3}
+
+    def __init__(self, year_odds):
+        allodds = set()
+        for rows in year_odds.wins.values():
+            allodds.update(row[3] for row in rows)
+        values = np.array(sorted(allodds), dtype=np.float64)
+
+        row_ids = year_odds.row_ids
+        if row_ids is None:
+            # Without table positions, assume each group's rows are contiguous
+            counter = itertools.count()
+            row_ids = {key: [next(counter) for _ in rows] for key, rows in year_odds.wins.items()}
+
+        # (codes, row ids) of each group's rows, by (avgodds, table position)
+        c1, c2, c3 = {}, {}, defaultdict(list)
+        for key, rows in year_odds.wins.items():
+            codes = np.searchsorted(values, [row[3] for row in rows]).astype(np.uint16)
+            ids = np.asarray(row_ids[key], dtype=np.int64)
+            order = np.lexsort((ids, codes))
+            group = (codes[order], ids[order])
+            if key[0] == 1:
+                c1[key[1:3]] = group
+            elif key[0] == 2:
+                c2[key[1:5]] = group
+            elif key[0] == 3:
+                c3[key[1:5]].append((key[5:7], group[0]))
+
+        def concat(blocks, width):
+            # blocks sorted by their leading C1/C2 row id, as the joins are
+            blocks.sort(key=lambda b: b[0])
+            return [np.concatenate([b[1][i] for b in blocks]) if blocks
+                    else np.zeros(0, dtype=np.uint16) for i in range(width)]
+
+        # EstC2Odds join: for each C1/C2 row, C2-as-C1 row x C1 row x C1/C2 row
+        # of the same pair
+        blocks = []
+        for (z1, d1, z2, d2), (d, dids) in c2.items():
+            a = c1.get((z2, d2))
+            c = c1.get((z1, d1))
+            if a is None or c is None:
+                continue
+            a, c = a[0], c[0]
+            na, nc, nd = len(a), len(c), len(d)
+            block = (np.tile(np.repeat(c, nd), na), np.repeat(a, nc * nd), np.tile(d, na * nc))
+            blocks.extend((rid, block) for rid in dids.tolist())
+        c1col, c2a1col, c2col = concat(blocks, 3)
+        # Window columns first: (c2a1odds, c1odds, c2odds)
+        self.c2 = _Candidates(values, [c2a1col, c1col, c2col], nkey=2)
+
+        # EstC3Odds join: for each C1/C2 row, the C1/C2/C3 rows extending its
+        # pair (by 3rd zone and date) x their C3-as-C1 rows x the C1 row
+        blocks = []
+        for pair, extensions in c3.items():
+            c = c2.get(pair)
+            d = c1.get(pair[:2])
+            if c is None or d is None:
+                continue
+            d = d[0]
+            parts = ([], [], [])
+            for zd3, b in sorted(extensions, key=lambda e: e[0]):
+                a = c1.get(zd3)
+                if a is None:
+                    continue
+                a = a[0]
+                na, nb, nd = len(a), len(b), len(d)
+                parts[0].append(np.tile(np.repeat(b, nd), na))
+                parts[1].append(np.repeat(a, nb * nd))
+                parts[2].append(np.tile(d, na * nb))
+            if not parts[0]:
+                continue
+            c3part, c3a1part, c1part = (np.concatenate(p) for p in parts)
+            for code, rid in zip(*c):
+                blocks.append((int(rid), (c3part, c3a1part,
+                                          np.full(len(c3part), code, dtype=np.uint16), c1part)))
+        c3col, c3a1col, c2col, c1col = concat(blocks, 4)
+        # Window columns first: (c3a1odds, c2odds, c1odds, c3odds)
+        self.c3 = _Candidates(values, [c3a1col, c2col, c1col, c3col], nkey=3)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """All candidate arrays as {"c2/col0": ..., "c3/key": ...}."""
+        return {f"{name}/{k}": a for name in self.NKEY
+                for k, a in getattr(self, name).arrays().items()}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "ChoiceSetMatcher":
+        """A matcher over arrays from arrays() (e.g. shared memory) instead of building one."""
+        self = cls.__new__(cls)
+        for name, nkey in cls.NKEY.items():
+            prefix = name + "/"
+            part = {k[len(prefix):]: a for k, a in arrays.items() if k.startswith(prefix)}
+            setattr(self, name, _Candidates.from_arrays(part, nkey))
+        return self
+
+    # Estimating Choice 2 odds
+    def est_c2_odds(self, C2aC1odds: float, c1odds: float) -> float:
+        cands = self.c2
+
+        def error(idx):
+            return np.round(((c1odds - cands.odds(1, idx)) * 1000) ** 2
+                            + ((C2aC1odds - cands.odds(0, idx)) * 1000) ** 2, 0)
+
+        return _search(cands, (C2aC1odds, c1odds), self.C2_MOES, self.SCALE,
+                       error, result_col=2, shape="EstC2Odds")
+
+    def c2_upper_bound(self, C2aC1odds: float) -> float:
+        """An upper bound on est_c2_odds(C2aC1odds, c1odds) for every c1odds."""
+        return self.c2.upper_bound(C2aC1odds, _widest(self.C2_MOES[0], self.SCALE), 2)
+
+    # Estimating Choice 3 odds
+    def est_c3_odds(self, C3aC1odds: float, c2odds: float, c1odds: float) -> float:
+        cands = self.c3
+
+        def error(idx):
+            return np.round(((c1odds - cands.odds(2, idx)) * 1000) ** 2
+                            + np.rint((c2odds - cands.odds(1, idx)) * 1000) ** 2
+                            + np.rint((C3aC1odds - cands.odds(0, idx)) * 1000) ** 2, 0)
+
+        return _search(cands, (C3aC1odds, c2odds, c1odds), self.C3_MOES, self.SCALE,
+                       error, result_col=3, shape="EstC3Odds")
+
+    def c3_upper_bound(self, C3aC1odds: float) -> float:
+        """An upper bound on est_c3_odds(C3aC1odds, c2odds, c1odds) for every c2odds, c1odds."""
+        return self.c3.upper_bound(C3aC1odds, _widest(self.C3_MOES[0], self.SCALE), 3)
+
+
+_build_lock = threading.Lock()
+
+
+def matcher_for(year_odds) -> ChoiceSetMatcher:
+    """Build (once) and return the ChoiceSetMatcher attached to a YearOdds."""
+    matcher = getattr(year_odds, "_matcher", None)
+    if matcher is None:
+        with _build_lock:
+            matcher = getattr(year_odds, "_matcher", None)
+            if matcher is None:
+                matcher = ChoiceSetMatcher(year_odds)
+                year_odds._matcher = matcher
+    return matcher
@@ -0,0 +1,87 @@
+"""
+Dense first-choice odds table for one data year's core zone.
+
+In the core zone a choice's odds depend on group size, and only some group
+sizes are observed on each date; coreodds1 used to fetch a date's rows and
+interpolate (or extrapolate with the coregs factors) on every lookup.
+CoreOddsTable runs interpolate_core_odds once per [date id, group size
+1..8] cell when a year is loaded, so a lookup is a single array index, and
+records how each cell was obtained:
+
+    observed      a row with exactly that group size
+    interpolated  observed group sizes on both sides
+    extrapolated  observed group sizes on one side only, scaled by coregs
+    None          no core zone rows for the date
+"""
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from .odds_engine import interpolate_core_odds
+
+GROUP_SIZES = list(range(1, 9))
+
+# Cell sources, indexed by the codes in CoreOddsTable.sources
+SOURCES = (None, "observed", "interpolated", "extrapolated")
+NO_DATA, OBSERVED, INTERPOLATED, EXTRAPOLATED = range(len(SOURCES))
+
+
+def core_odds_source(rows, g) -> int:
+    """Which rule interpolate_core_odds(rows, g) applies, as a SOURCES code."""
+    lower = higher = False
+    for gs, _ in rows:
+        if gs == g:
+            return OBSERVED
+        lower = lower or 0 < gs < g
+        higher = higher or g < gs < 9
+    if lower and higher:
+        return INTERPOLATED
+    return EXTRAPOLATED if lower or higher else NO_DATA
+
+
+class CoreOddsTable:
+    """
+    odds[date_id, group_size - 1] for the core zone (NaN where there is no
+    estimate) and the matching sources[date_id, group_size - 1] codes.
+    """
+
+    def __init__(self, odds: np.ndarray, sources: np.ndarray):
+        self.odds_table = odds
+        self.sources = sources
+
+    @classmethod
+    def build(cls, wins, corezoneid: Optional[int], date_ids: Iterable[int]) -> "CoreOddsTable":
+        """From a YearOdds wins mapping, for every date id in date_ids."""
+        date_ids = list(date_ids)
+        size = max(date_ids, default=-1) + 1
+        odds = np.full((size, len(GROUP_SIZES)), np.nan)
+        sources = np.zeros((size, len(GROUP_SIZES)), dtype=np.uint8)
+        if corezoneid is None:
+            return cls(odds, sources)
+        for did in date_ids:
+            rows = [(row[0], row[3]) for row in wins.get((1, corezoneid, did), ())]
+            if not rows:
+                continue
+            for j, g in enumerate(GROUP_SIZES):
+                try:
+                    value = interpolate_core_odds(rows, g)
+                except TypeError:
+                    # Null avgodds; coreodds1 callers treat it as no estimate
+                    value = None
+                if value is not None:
+                    odds[did, j] = value
+                    sources[did, j] = core_odds_source(rows, g)
+        return cls(odds, sources)
+
+    def odds(self, d: int, g: int) -> Optional[float]:
+        """Same value as interpolate_core_odds on date d's rows; None where it has none."""
+        if not 0 <= d < len(self.odds_table):
+            return None
+        value = self.odds_table[d, g - 1]
+        return None if np.isnan(value) else float(value)
+
+    def source_rows(self, date_ids: Iterable[int]) -> List[List[Optional[str]]]:
+        """Source names for each date id's group sizes 1..8 (all None for ids < 0)."""
+        empty = [None] * len(GROUP_SIZES)
+        return [[SOURCES[code] for code in self.sources[did]]
+                if 0 <= did < len(self.sources) else list(empty) for did in date_ids]
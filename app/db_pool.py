@@ -0,0 +1,131 @@
+"""
+Shared read-only SQLite connections for the request path.
+
+/stats and the SQL odds path used to open and close a connection per
+request. read_only_pool keeps one connection per thread and file instead
+(FastAPI runs sync endpoints on a long-lived thread pool, so they are
+reused), opened with mode=ro&immutable=1 so SQLite skips locking and
+change detection. Because an immutable connection would not notice a file
+being replaced, every checkout compares the file's size and mtime with
+those at open time and reopens on a change; connections idle for longer
+than health_check_s also run a `SELECT 1` first.
+
+At most max_connections stay open across all threads; beyond that a
+checkout gets a one-off connection that is closed after use.
+"""
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+
+def connect_read_only(path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Open path read-only and immutable (no locking or change checks)."""
+    uri = Path(path).resolve().as_uri() + "?mode=ro&immutable=1"
+    return sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread)
+
+
+def _stamp(path: str) -> Tuple[int, int]:
+    """(size, mtime_ns) of path; raises FileNotFoundError if it is missing."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class _Pooled:
+    def __init__(self, conn: sqlite3.Connection, stamp: Tuple[int, int]):
+        self.conn = conn
+        self.stamp = stamp
+        self.checked = time.monotonic()
+
+
+class ReadOnlyPool:
+    """Thread-local read-only connections, keyed by file path."""
+
+    def __init__(self, max_connections: int = 64, health_check_s: float = 30.0):
+        self.max_connections = max_connections
+        self.health_check_s = health_check_s
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._counts = {"opened": 0, "reused": 0, "reopened": 0, "overflow": 0, "failed_checks": 0}
+
+    def _count(self, event: str) -> None:
+        with self._lock:
+            self._counts[event] += 1
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        conn.close()
+        with self._lock:
+            self._open -= 1
+
+    def _healthy(self, pooled: _Pooled) -> bool:
+        if time.monotonic() - pooled.checked < self.health_check_s:
+            return True
+        try:
+            pooled.conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            self._count("failed_checks")
+            return False
+        pooled.checked = time.monotonic()
+        return True
+
+    @contextmanager
+    def connection(self, path: str) -> Iterator[sqlite3.Connection]:
+        """
+        A read-only connection to path for the calling thread. Raises
+        FileNotFoundError if the file does not exist.
+        """
+        stamp = _stamp(path)
+        conns: Dict[str, _Pooled] = self._local.__dict__.setdefault("conns", {})
+        pooled = conns.get(path)
+        if pooled is not None:
+            if pooled.stamp == stamp and self._healthy(pooled):
+                self._count("reused")
+                yield pooled.conn
+                return
+            # Replaced on disk or broken: drop it (its finalizer closes it)
+            self._count("reopened")
+            del conns[path]
+            pooled = None
+
+        with self._lock:
+            room = self._open < self.max_connections
+            if room:
+                self._open += 1
+                self._counts["opened"] += 1
+            else:
+                self._counts["overflow"] += 1
+        if not room:
+            conn = connect_read_only(path)
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        try:
+            # Only this thread uses it, but its finalizer may run on another
+            conn = connect_read_only(path, check_same_thread=False)
+        except BaseException:
+            with self._lock:
+                self._open -= 1
+            raise
+        pooled = _Pooled(conn, stamp)
+        # Closes the connection when the entry is dropped, or with its thread
+        weakref.finalize(pooled, self._release, conn)
+        conns[path] = pooled
+        yield conn
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"open": self._open, **self._counts}
+
+
+read_only_pool = ReadOnlyPool(
+    max_connections=int(os.getenv("DB_POOL_MAX_CONNECTIONS", "64")),
+    health_check_s=float(os.getenv("DB_POOL_HEALTH_CHECK_S", "30")),
+)
@@ -0,0 +1,86 @@
+"""
+Dedicated, bounded executor for odds engine work called from async endpoints.
+
+Engine calls run on their own thread pool instead of Starlette's shared
+one, so a burst of odds requests cannot starve /health, /ready or the
+analytics endpoints. Admission is limited to max_inflight calls (running
+plus queued); past that, run() raises EngineOverloaded straight away, which
+the endpoint turns into a 503 with Retry-After, instead of letting the
+queue and latency grow without bound. Each call also has a timeout; the
+engine thread cannot be interrupted, so a timed-out call keeps its slot
+until it actually finishes.
+
+A thread pool rather than a process pool: the engine reads the in-memory
+OddsIndex and result cache, which worker processes would each have to load
+and fill on their own.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import REGISTRY
+
+ENGINE_REJECTED = REGISTRY.counter(
+    "odds_engine_rejected_total", "Engine calls refused by the concurrency limiter or timed out")
+
+
+class EngineOverloaded(RuntimeError):
+    """max_inflight engine calls are already running or queued."""
+
+
+class EngineTimeout(TimeoutError):
+    """An engine call did not finish within the executor's timeout."""
+
+
+class EngineExecutor:
+    def __init__(self, workers: int, max_inflight: int, timeout_s: float):
+        self.workers = workers
+        self.max_inflight = max_inflight
+        self.timeout_s = timeout_s
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the engine pool in the caller's context."""
+        with self._lock:
+            if self._inflight >= self.max_inflight:
+                ENGINE_REJECTED.inc(reason="overloaded")
+                raise EngineOverloaded(f"{self._inflight} odds requests already in progress")
+            self._inflight += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="odds-engine")
+            pool = self._pool
+        # Copy the context so spans still land in the current request's timings
+        ctx = contextvars.copy_context()
+        try:
+            future = pool.submit(ctx.run, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout_s)
+        except asyncio.TimeoutError:
+            ENGINE_REJECTED.inc(reason="timeout")
+            raise EngineTimeout(f"Odds estimate took longer than {self.timeout_s:g}s") from None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"inflight": self._inflight, "max_inflight": self.max_inflight,
+                    "workers": self.workers}
+
+    def shutdown(self) -> None:
+        """Stop the pool; the next run() starts a fresh one."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
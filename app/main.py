@@ -1,6 +1,14 @@
-from fastapi import FastAPI, Request
+import asyncio
+import threading
+import time
+
+# Cold-start time (see GET /ready) is measured from here
+PROCESS_START = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import os
 from pydantic import BaseModel
 from datetime import date, datetime, timezone
@@ -8,11 +16,49 @@ import sqlite3
 import json
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
-from .odds_engine import Choice, estimate_odds_for_choice_set
-
-
-app = FastAPI()
+from typing import Annotated, Dict, List, Literal
+from .analytics_choices import read_events
+from .analytics_rollups import export_events, latency_percentiles, top_choice_sets, zone_date_counts
+from .analytics_schema import backfill_in_background, migrate, pending_backfills
+from .analytics_writer import AnalyticsWriter
+from .db_pool import read_only_pool
+from .engine_executor import EngineExecutor, EngineOverloaded, EngineTimeout
+from .choice_match import matcher_for
+from .metrics import REGISTRY, begin_request, end_request, request_elapsed_ms, span
+from .odds_cache import OddsCache
+from .odds_catalog import UnknownZoneError
+from .odds_engine import Choice, estimate_odds_for_choice_set, estimate_odds_for_choice_sets
+from .odds_grid import odds_grid
+from .odds_index import OddsIndex
+from .optimizer import optimize, season_window
+from .shared_odds import SharedOddsIndex
+from .single_flight import SingleFlight
+from .warmup import Warmup
+from .year_fanout import NOT_LOADED, YearFanout
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-worker start-up and shutdown. Only the cheap, required steps run
+    before the server accepts requests; the odds data loads in the
+    background and GET /ready reports when it is done.
+    """
+    DB_DIR.mkdir(exist_ok=True)
+    migrate(ANALYTICS_DB_PATH, SCHEMA_PATH)
+    analytics_writer.start()
+    warmup.start(warmup_steps(), started=PROCESS_START)
+    # Rows logged before the latest migrations fill its new tables off the startup path
+    backfill_stop = threading.Event()
+    backfill_in_background(ANALYTICS_DB_PATH, backfill_stop)
+    yield
+    backfill_stop.set()
+    engine_executor.shutdown()
+    year_fanout.shutdown()
+    analytics_writer.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow our web page to make requests to this backend (for now, allow everything)
 app.add_middleware(
@@ -21,37 +67,122 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Server-Timing"],
 )
 
-DB_PATH = Path("stats.db")
+# Set SERVER_TIMING=1 to return per-stage timings in an X-Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    timings, token = begin_request()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if SERVER_TIMING:
+            response.headers["X-Server-Timing"] = timings.server_timing()
+        return response
+    finally:
+        route = request.scope.get("route")
+        end_request(token, getattr(route, "path", "unmatched"), request.method, status)
 
 # Paths
 BASE_DIR = Path(__file__).resolve().parent.parent   # project root (where index.html & schema.sql live)
+# Legacy /stats lookups; relative to the project root, not the process CWD
+DB_PATH = Path(os.getenv("STATS_DB_PATH") or BASE_DIR / "stats.db")
 DB_DIR = BASE_DIR / "odds_database"
-DB_DIR.mkdir(exist_ok=True)
 
 ANALYTICS_DB_PATH = DB_DIR / "analytics.db"
+GRID_CACHE_DIR = DB_DIR / "grid_cache"
 SCHEMA_PATH = BASE_DIR / "schema.sql"
 
 
-def init_logging_db():
-    """Create the analytics.db file and ensure query_events table exists."""
-    conn = sqlite3.connect(ANALYTICS_DB_PATH)
-    try:
-        with SCHEMA_PATH.open("r", encoding="utf-8") as f:
-            schema_sql = f.read()
-        conn.executescript(schema_sql)
-        conn.commit()
-    finally:
-        conn.close()
+# query_events rows are written off the request path in batches; the
+# analytics.db schema is migrated and the writer started by lifespan()
+analytics_writer = AnalyticsWriter(ANALYTICS_DB_PATH)
+
+# Folder where your odds_YYYY.db files live
+# Use environment variable if set, otherwise fall back to the repo's folder
+ODDS_DB_DIR = os.getenv("ODDS_DB_DIR") or str(BASE_DIR / "odds_databases")
+
+# Every odds_YYYY.db is loaded once by the warm-up; POST /debug/reload_odds
+# picks up new files. Under `python -m app.shared_odds ... -- uvicorn ...`
+# the workers attach the publisher's shared-memory tables instead.
+ODDS_SHARED_POINTER = os.getenv("ODDS_SHARED_POINTER")
+if ODDS_SHARED_POINTER:
+    odds_index = SharedOddsIndex(ODDS_SHARED_POINTER)
+else:
+    odds_index = OddsIndex(ODDS_DB_DIR, load=False)
+
+# Threads reading data years in parallel during warm-up
+WARMUP_WORKERS = int(os.getenv("WARMUP_WORKERS", "4"))
+# The C2/C3 choice-set matchers are built up front too, so no mode="sequential"
+# request pays for one (a few seconds per year); ODDS_PREWARM=0 builds them lazily
+ODDS_PREWARM = os.getenv("ODDS_PREWARM", "1").lower() in ("1", "true", "yes")
+# Warm-ups slower than this are flagged in /ready and logged
+STARTUP_BUDGET_S = float(os.getenv("STARTUP_BUDGET_S", "5"))
+# How long an odds request waits for a warm-up still in progress
+ODDS_READY_WAIT_S = float(os.getenv("ODDS_READY_WAIT_S", "30"))
+
+warmup = Warmup(budget_s=STARTUP_BUDGET_S)
+
+
+def warmup_steps():
+    steps = [("odds_index", lambda: odds_index.reload(workers=WARMUP_WORKERS))]
+    if ODDS_PREWARM:
+        steps.append(("matchers", lambda: [matcher_for(odds_index.year(y)) for y in odds_index.years]))
+    return steps
+
 
+def require_odds() -> None:
+    """Wait for the odds warm-up; 503 with Retry-After if it doesn't finish in time."""
+    if not warmup.wait(ODDS_READY_WAIT_S):
+        raise HTTPException(status_code=503, detail=f"Odds data not loaded ({warmup.state})",
+                            headers={"Retry-After": "5"})
 
-# Run this once when the app starts
-init_logging_db()
+
+async def require_odds_async() -> None:
+    """require_odds for async endpoints; only waits off the event loop during warm-up."""
+    if not warmup.ready:
+        await asyncio.to_thread(require_odds)
+
+
+# /estimate_odds engine calls run on this pool, not Starlette's shared one
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+# Running plus queued engine calls before new ones get a 503
+ENGINE_MAX_INFLIGHT = int(os.getenv("ENGINE_MAX_INFLIGHT", "64"))
+ENGINE_TIMEOUT_S = float(os.getenv("ENGINE_TIMEOUT_S", "10"))
+
+engine_executor = EngineExecutor(ENGINE_WORKERS, ENGINE_MAX_INFLIGHT, ENGINE_TIMEOUT_S)
+
+# A request's data years are looked up in parallel on this pool (shared by
+# all requests; 0 or 1 looks them up one after another)
+ODDS_YEAR_WORKERS = int(os.getenv("ODDS_YEAR_WORKERS", "8"))
+# A data year not done by then is left out and flagged in partial_years
+ODDS_YEAR_TIMEOUT_S = float(os.getenv("ODDS_YEAR_TIMEOUT_S", "3"))
+
+year_fanout = YearFanout(ODDS_YEAR_WORKERS, ODDS_YEAR_TIMEOUT_S)
+
+# POST /estimate_odds/batch runs and streams its choice sets this many at a time
+BATCH_CHUNK_SETS = int(os.getenv("BATCH_CHUNK_SETS", "50"))
+
+# POST /optimize searches this long unless the request asks for less (or
+# more, up to the maximum); keep it under ENGINE_TIMEOUT_S
+OPTIMIZE_TIME_BUDGET_S = float(os.getenv("OPTIMIZE_TIME_BUDGET_S", "2"))
+OPTIMIZE_MAX_TIME_BUDGET_S = float(os.getenv("OPTIMIZE_MAX_TIME_BUDGET_S", "5"))
+
+
+# Repeat /estimate_odds queries are answered from here until the odds data changes
+odds_cache = OddsCache()
+
+# Identical /estimate_odds queries arriving while one is computed share its result
+odds_single_flight = SingleFlight("estimate_odds")
 
 def log_query_event(
     inputs: dict,
-    results: dict,
+    results: dict | bytes,
     status: str = "success",
     event_type: str = "get_table",
     session_id: str | None = None,
@@ -65,51 +196,45 @@ def log_query_event(
     region: str | None = None,
     referrer: str | None = None,
     latency_ms: int | None = None,
+    server_latency_ms: int | None = None,
 ) -> None:
-    """Insert a single query log row into the analytics database."""
+    """
+    Queue a single query log row for the analytics database. The row is
+    written by the background analytics_writer; if its queue is full the
+    row is dropped and counted rather than delaying the response.
+
+    server_latency_ms defaults to the time since the current request started.
+    results may be given already serialized, as JSON bytes.
+    """
     # Ensure we never violate NOT NULL on session_id
     if session_id is None:
         session_id = "anonymous"
         
     event_time_utc = datetime.now(timezone.utc).isoformat()
-
-    conn = sqlite3.connect(ANALYTICS_DB_PATH)
-    try:
-        conn.execute(
-            """
-            INSERT INTO query_events (
-                session_id, user_id,
-                event_time_utc, event_type,
-                country, region, device_type, browser, os, referrer,
-                sim_version, query_index_in_session,
-                inputs_json, results_json,
-                latency_ms, status
-            ) VALUES (
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
-            )
-            """,
-            (
-                session_id,
-                user_id,
-                event_time_utc,
-                event_type,
-                country,
-                region,
-                device_type,
-                browser,
-                os_name,
-                referrer,
-                sim_version,
-                query_index_in_session,
-                json.dumps(inputs),
-                json.dumps(results),
-                latency_ms,
-                status,
-            ),
+    if server_latency_ms is None:
+        server_latency_ms = request_elapsed_ms()
+
+    analytics_writer.submit(
+        (
+            session_id,
+            user_id,
+            event_time_utc,
+            event_type,
+            country,
+            region,
+            device_type,
+            browser,
+            os_name,
+            referrer,
+            sim_version,
+            query_index_in_session,
+            json.dumps(inputs),
+            results.decode() if isinstance(results, bytes) else json.dumps(results),
+            latency_ms,
+            status,
+            server_latency_ms,
         )
-        conn.commit()
-    finally:
-        conn.close()
+    )
 
 
 # Path to the repo root (where index.html lives)
@@ -144,7 +269,10 @@ class ChoiceInput(BaseModel):
 class OddsRequest(BaseModel):
     permit_year: int = 2025
     data_years: List[int] = [2020, 2021, 2022, 2023, 2024]  # or your four years
-    choices: List[ChoiceInput]  # up to 3
+    choices: List[ChoiceInput] = Field(max_length=3)
+    # "independent": every choice priced as a first choice
+    # "sequential": choice 2 given choice 1, choice 3 given choices 1 and 2
+    mode: Literal["independent", "sequential"] = "independent"
 
     # Optional metadata from the frontend
     session_id: str | None = None
@@ -154,9 +282,107 @@ class OddsRequest(BaseModel):
     os_name: str | None = None
     latency_ms: int | None = None
 
+class BatchOddsRequest(BaseModel):
+    permit_year: int = 2025
+    data_years: List[int] = [2020, 2021, 2022, 2023, 2024]
+    choice_sets: List[Annotated[List[ChoiceInput], Field(max_length=3)]] = Field(max_length=1000)
+
+    # Optional metadata from the frontend
+    session_id: str | None = None
+    query_index: int | None = None
+    device_type: str | None = None
+    browser: str | None = None
+    os_name: str | None = None
+    latency_ms: int | None = None
+
+class OptimizeRequest(BaseModel):
+    zones: List[str] = Field(min_length=1)
+    # Permit dates from start to end, inclusive
+    start_month: int = Field(ge=1, le=12)
+    start_day: int = Field(ge=1, le=31)
+    end_month: int = Field(ge=1, le=12)
+    end_day: int = Field(ge=1, le=31)
+    group_size: int = Field(ge=1, le=8)
+    permit_year: int = 2025
+    data_years: List[int] = [2020, 2021, 2022, 2023, 2024]
+    max_choices: int = Field(3, ge=1, le=3)
+    top_k: int = Field(5, ge=1, le=50)
+    time_budget_s: float | None = Field(None, gt=0)
+
+    # Optional metadata from the frontend
+    session_id: str | None = None
+
+class OptimizeResponse(BaseModel):
+    permit_year: int
+    years: List[int]
+    group_size: int
+    sets: List[dict]
+    search: dict
+    partial_years: Dict[int, str] = {}
+
+class ChoiceOdds(BaseModel):
+    index: int
+    zone: str
+    month: int
+    day: int
+    group_size: int
+    display_date: str
+    odds_by_year: Dict[int, float]
+    comp_dates_by_year: Dict[int, str | None]
+    # Sequential mode only: the choice's odds as a first choice
+    first_choice_odds_by_year: Dict[int, float] | None = None
+
 class OddsResponse(BaseModel):
     years: List[int]
-    choices: List[dict]  # keep loose for now; can tighten later
+    mode: str = "independent"
+    choices: List[ChoiceOdds]
+    # Data years left at 0 odds: "missing" (no database), "timeout" or "error"
+    partial_years: Dict[int, str] = {}
+
+    def to_json(self) -> bytes:
+        """The JSON body; fields a mode does not use are left out."""
+        return self.model_dump_json(exclude_none=True).encode()
+
+# Accept this media type on /estimate_odds for the columnar layout below
+COLUMNAR_MEDIA_TYPE = "application/vnd.odds.columnar+json"
+
+class ChoiceInfo(BaseModel):
+    index: int
+    zone: str
+    month: int
+    day: int
+    group_size: int
+    display_date: str
+
+class ColumnarOddsResponse(BaseModel):
+    """
+    OddsResponse as years x choices arrays: odds[i][j] is choice j's odds in
+    years[i]. Smaller to send and cheaper to read into a table or chart.
+    """
+    years: List[int]
+    mode: str
+    choices: List[ChoiceInfo]
+    odds: List[List[float]]
+    comp_dates: List[List[str | None]]
+    first_choice_odds: List[List[float]] | None = None
+    partial_years: Dict[int, str] = {}
+
+    @classmethod
+    def from_response(cls, response: OddsResponse) -> "ColumnarOddsResponse":
+        choices = response.choices
+        sequential = any(c.first_choice_odds_by_year is not None for c in choices)
+        return cls(
+            years=response.years,
+            mode=response.mode,
+            choices=[ChoiceInfo(index=c.index, zone=c.zone, month=c.month, day=c.day,
+                                group_size=c.group_size, display_date=c.display_date)
+                     for c in choices],
+            odds=[[c.odds_by_year.get(y, 0.0) for c in choices] for y in response.years],
+            comp_dates=[[c.comp_dates_by_year.get(y) for c in choices] for y in response.years],
+            first_choice_odds=[[(c.first_choice_odds_by_year or {}).get(y, 0.0) for c in choices]
+                               for y in response.years] if sequential else None,
+            partial_years=response.partial_years,
+        )
 
 
 # --- Helper function to query the database ---
@@ -168,25 +394,21 @@ def get_success_rate_from_db(zone: str, date_str: str, group_size: int) -> float
     Returns:
         float between 0 and 1 if found, or None if no matching row.
     """
-    if not DB_PATH.exists():
+    try:
+        with read_only_pool.connection(str(DB_PATH)) as conn:
+            row = conn.execute(
+                """
+                SELECT success_rate
+                FROM stats
+                WHERE zone = ?
+                  AND date = ?
+                  AND group_size = ?
+                """,
+                (zone, date_str, group_size),
+            ).fetchone()
+    except FileNotFoundError:
         return None
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT success_rate
-        FROM stats
-        WHERE zone = ?
-          AND date = ?
-          AND group_size = ?
-        """,
-        (zone, date_str, group_size),
-    )
-    row = cur.fetchone()
-    conn.close()
-
     if row is None:
         return None
 
@@ -196,10 +418,20 @@ def get_success_rate_from_db(zone: str, date_str: str, group_size: int) -> float
 # --- API endpoints ---
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness (unlike /health, which only says the process is up): 200 once
+    the warm-up has loaded the odds data, 503 while it is running or if it
+    failed. Includes the cold-start time and per-step durations.
+    """
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+
 @app.post("/stats", response_model=StatsResponse)
 def get_stats(request: StatsRequest):
     """
@@ -236,8 +468,28 @@ def get_stats(request: StatsRequest):
         note="Result retrieved from local stats.db file.",
     )
 
-@app.post("/estimate_odds", response_model=OddsResponse)
-def estimate_odds(payload: OddsRequest, request: Request):
+def _run_engine(payload: OddsRequest, choices: List[Choice]) -> dict:
+    with span("engine"):
+        return estimate_odds_for_choice_set(
+            permit_year=payload.permit_year,
+            choices=choices,
+            data_years=payload.data_years,
+            db_dir=ODDS_DB_DIR,
+            index=odds_index,
+            cache=odds_cache,
+            mode=payload.mode,
+            fanout=year_fanout,
+        )
+
+
+@app.post("/estimate_odds", response_model=OddsResponse,
+          responses={200: {"content": {COLUMNAR_MEDIA_TYPE: {}}}})
+async def estimate_odds(payload: OddsRequest, request: Request):
+    """
+    Odds for each choice in each data year. Send
+    "Accept: application/vnd.odds.columnar+json" for the years x choices
+    arrays of ColumnarOddsResponse instead.
+    """
     # Convert Pydantic models to dataclass Choices
     choices = [
         Choice(
@@ -249,14 +501,11 @@ def estimate_odds(payload: OddsRequest, request: Request):
         for c in payload.choices
     ]
 
-    # Folder where your odds_YYYY.db files live
-    # Use environment variable if set, otherwise fall back to local folder
-    db_dir = os.getenv("ODDS_DB_DIR") or r"C:\permit-stats-backend-starter\odds_databases"
-
     # ---- Build "inputs" dict for logging ----
     inputs = {
         "permit_year": payload.permit_year,
         "data_years": payload.data_years,
+        "mode": payload.mode,
         "choices": [
             {
                 "zone": c.zone,
@@ -268,13 +517,19 @@ def estimate_odds(payload: OddsRequest, request: Request):
         ],
     }
 
-    # ---- Run the odds engine (your existing logic) ----
-    result = estimate_odds_for_choice_set(
-        permit_year=payload.permit_year,
-        choices=choices,
-        data_years=payload.data_years,
-        db_dir=db_dir,
-    )
+    # ---- Run the odds engine on its own executor, once per identical query ----
+    await require_odds_async()
+    key = (payload.permit_year, tuple(payload.data_years), payload.mode,
+           tuple((c.zone, c.month, c.day, c.group_size) for c in choices))
+    try:
+        result = await odds_single_flight.do(
+            key, lambda: engine_executor.run(_run_engine, payload, choices))
+    except UnknownZoneError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except EngineOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except EngineTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
 
     # ---- Extract metadata from payload & request ----
     session_id = payload.session_id
@@ -286,38 +541,240 @@ def estimate_odds(payload: OddsRequest, request: Request):
     sim_version = "v1.0.0"  # bump this when you change the algorithm
     referrer = request.headers.get("referer")
 
+    # ---- Serialize once; the JSON bytes are both the body and the logged results ----
+    with span("response"):
+        response = OddsResponse.model_validate(result)
+        body = response.to_json()
+
     # ---- Log this "Get Table" event into analytics.db (best-effort) ----
+    try:
+        with span("analytics_log"):
+            log_query_event(
+                inputs=inputs,
+                results=body,
+                status="success" if all(r == NOT_LOADED for r in result["partial_years"].values())
+                else "partial",
+                event_type="get_table",
+                session_id=session_id,
+                user_id=None,
+                sim_version=sim_version,
+                query_index_in_session=query_index_in_session,
+                device_type=device_type,
+                browser=browser,
+                os_name=os_name,
+                country=None,
+                region=None,
+                referrer=referrer,
+                latency_ms=latency_ms,
+            )
+    except Exception as e:
+        # Do not break the main functionality if analytics fails
+        print("Analytics logging failed:", e)
+
+    if COLUMNAR_MEDIA_TYPE in request.headers.get("accept", ""):
+        with span("response"):
+            body = ColumnarOddsResponse.from_response(response).model_dump_json(
+                exclude_none=True).encode()
+        return Response(body, media_type=COLUMNAR_MEDIA_TYPE, headers={"Vary": "Accept"})
+    return Response(body, media_type="application/json", headers={"Vary": "Accept"})
+
+
+@app.post("/estimate_odds/batch")
+async def estimate_odds_batch(payload: BatchOddsRequest, request: Request):
+    """
+    Score many choice sets in one call. The sets are run on the engine
+    executor BATCH_CHUNK_SETS at a time; the odds engine groups each chunk's
+    work by data year, so each year's data is read once per chunk.
+
+    Streams one NDJSON line per choice set, in request order, as soon as its
+    chunk is done:
+        {"index": 0, "years": [...], "choices": [...]}
+    or, for a set with an unknown zone (or whose chunk failed mid-stream):
+        {"index": 3, "error": "Unknown zone ..."}
+    """
+    choice_sets = [
+        [
+            Choice(
+                zone=c.zone,
+                month=c.month,
+                day=c.day,
+                group_size=c.group_size
+            )
+            for c in choice_set
+        ]
+        for choice_set in payload.choice_sets
+    ]
+
+    def run_chunk(chunk):
+        with span("engine"):
+            return estimate_odds_for_choice_sets(
+                permit_year=payload.permit_year,
+                choice_sets=chunk,
+                data_years=payload.data_years,
+                db_dir=ODDS_DB_DIR,
+                index=odds_index,
+                cache=odds_cache,
+                fanout=year_fanout,
+            )
+
+    chunks = [choice_sets[i:i + BATCH_CHUNK_SETS]
+              for i in range(0, len(choice_sets), BATCH_CHUNK_SETS)]
+
+    # The first chunk runs before the response starts, so an overloaded or
+    # timed-out engine is still a 503/504 rather than a broken stream
+    await require_odds_async()
+    try:
+        first = await engine_executor.run(run_chunk, chunks[0]) if chunks else []
+    except EngineOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except EngineTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    async def lines():
+        index = 0
+        errors = 0
+        try:
+            for n, chunk in enumerate(chunks):
+                try:
+                    results = first if n == 0 else await engine_executor.run(run_chunk, chunk)
+                except (EngineOverloaded, EngineTimeout) as e:
+                    results = [e] * len(chunk)
+                for r in results:
+                    if isinstance(r, Exception):
+                        errors += 1
+                        yield json.dumps({"index": index, "error": str(r)}) + "\n"
+                    else:
+                        yield json.dumps({"index": index, **r}) + "\n"
+                    index += 1
+        finally:
+            log_batch_event(payload, request, errors)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def log_batch_event(payload: BatchOddsRequest, request: Request, errors: int) -> None:
+    """Log one "Get Table" batch event (best-effort)."""
+    inputs = {
+        "permit_year": payload.permit_year,
+        "data_years": payload.data_years,
+        "choice_sets": [
+            [
+                {
+                    "zone": c.zone,
+                    "month": c.month,
+                    "day": c.day,
+                    "group_size": c.group_size,
+                }
+                for c in choice_set
+            ]
+            for choice_set in payload.choice_sets
+        ],
+    }
     try:
         log_query_event(
             inputs=inputs,
-            results=result,
-            status="success",
-            event_type="get_table",
-            session_id=session_id,
+            results={"choice_sets": len(payload.choice_sets), "errors": errors},
+            status="success" if not errors else "partial",
+            event_type="get_table_batch",
+            session_id=payload.session_id,
             user_id=None,
-            sim_version=sim_version,
-            query_index_in_session=query_index_in_session,
-            device_type=device_type,
-            browser=browser,
-            os_name=os_name,
+            sim_version="v1.0.0",
+            query_index_in_session=payload.query_index,
+            device_type=payload.device_type,
+            browser=payload.browser,
+            os_name=payload.os_name,
             country=None,
             region=None,
-            referrer=referrer,
-            latency_ms=latency_ms,
+            referrer=request.headers.get("referer"),
+            latency_ms=payload.latency_ms,
         )
     except Exception as e:
         # Do not break the main functionality if analytics fails
         print("Analytics logging failed:", e)
 
-    # ---- Return the response as before ----
-    return OddsResponse(**result)
+
+@app.post("/optimize", response_model=OptimizeResponse)
+async def optimize_choices(payload: OptimizeRequest, request: Request):
+    """
+    Best ordered sets of up to max_choices choices from zones x the date
+    window, ranked by the chance of winning with any of them (sequential
+    odds summed per data year, averaged over the years). Searches for at
+    most time_budget_s; search.complete is false if it stopped early, in
+    which case sets are the best found so far.
+    """
+    try:
+        dates = season_window(payload.permit_year, (payload.start_month, payload.start_day),
+                              (payload.end_month, payload.end_day))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not dates:
+        raise HTTPException(status_code=422, detail="The date window ends before it starts")
+    budget = min(payload.time_budget_s or OPTIMIZE_TIME_BUDGET_S, OPTIMIZE_MAX_TIME_BUDGET_S)
+
+    await require_odds_async()
+    try:
+        with span("optimize"):
+            result = await engine_executor.run(
+                optimize, odds_index, payload.zones, dates, payload.group_size,
+                payload.permit_year, payload.data_years, payload.max_choices, payload.top_k, budget)
+    except (UnknownZoneError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except EngineOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except EngineTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    # ---- Log one "optimize" event (best-effort) ----
+    try:
+        log_query_event(
+            inputs=payload.model_dump(exclude={"session_id"}),
+            results={"sets": len(result["sets"]), **result["search"],
+                     "best": result["sets"][0]["combined_odds"] if result["sets"] else None},
+            event_type="optimize",
+            session_id=payload.session_id,
+            user_id=None,
+            sim_version="v1.0.0",
+            query_index_in_session=None,
+            device_type=None,
+            browser=None,
+            os_name=None,
+            country=None,
+            region=None,
+            referrer=request.headers.get("referer"),
+            latency_ms=None,
+        )
+    except Exception as e:
+        # Do not break the main functionality if analytics fails
+        print("Analytics logging failed:", e)
+
+    return OptimizeResponse(**result)
+
+
+@app.get("/odds/grid")
+def get_odds_grid(zone: str, permit_year: int = 2025):
+    """
+    Full-season first-choice odds for one zone: every date in the permit
+    season times group sizes 1-8, for every loaded data year.
+
+    odds_by_year[year][i][j] is the odds for dates[i] with group size
+    group_sizes[j]; each cell matches /estimate_odds for that single choice.
+    sources_by_year[year][i][j] says how it was obtained: "observed", or
+    "interpolated"/"extrapolated" from other group sizes in the core zone,
+    or null where there is no data.
+    """
+    require_odds()
+    try:
+        return odds_grid(odds_index, zone, permit_year, GRID_CACHE_DIR)
+    except UnknownZoneError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 
 @app.get("/debug/analytics")
 def debug_analytics(limit: int = 10):
     """
     Debug endpoint to inspect analytics.db.
-    Returns the most recent rows from query_events, including metadata.
+    Returns the most recent rows from query_events, including metadata,
+    as logged (see analytics_choices.read_events).
     """
     if not ANALYTICS_DB_PATH.exists():
         return {
@@ -325,35 +782,28 @@ def debug_analytics(limit: int = 10):
             "path": str(ANALYTICS_DB_PATH),
         }
 
+    columns = (
+        "id",
+        "event_time_utc",
+        "event_type",
+        "status",
+        "session_id",
+        "query_index_in_session",
+        "device_type",
+        "browser",
+        "os",
+        "referrer",
+        "sim_version",
+        "latency_ms",
+        "server_latency_ms",
+        "inputs_json",
+        "results_json",
+    )
     conn = sqlite3.connect(ANALYTICS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
 
     try:
-        cur.execute(
-            """
-            SELECT
-                id,
-                event_time_utc,
-                event_type,
-                status,
-                session_id,
-                query_index_in_session,
-                device_type,
-                browser,
-                os,
-                referrer,
-                sim_version,
-                latency_ms,
-                inputs_json,
-                results_json
-            FROM query_events
-            ORDER BY id DESC
-            LIMIT ?
-            """,
-            (limit,),
-        )
-        rows = [dict(row) for row in cur.fetchall()]
+        rows = [dict(zip(columns, row))
+                for row in read_events(conn, columns, order="id DESC", limit=limit)]
     except sqlite3.OperationalError as e:
         return {
             "error": "SQLite error while querying query_events",
@@ -365,11 +815,138 @@ def debug_analytics(limit: int = 10):
 
     return {
         "db_path": str(ANALYTICS_DB_PATH),
+        "writer": analytics_writer.metrics(),
         "row_count": len(rows),
         "rows": rows,
     }
 
 
+def _analytics_conn() -> sqlite3.Connection:
+    if not ANALYTICS_DB_PATH.exists():
+        raise HTTPException(status_code=404, detail=f"analytics.db not found at {ANALYTICS_DB_PATH}")
+    # check_same_thread=False: a StreamingResponse may pull chunks on different threads
+    return sqlite3.connect(ANALYTICS_DB_PATH, check_same_thread=False)
+
+
+@app.get("/analytics/export")
+def analytics_export(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: str | None = None,
+    until: str | None = None,
+    event_type: str | None = None,
+):
+    """
+    Stream query_events rows (optionally filtered by event_time_utc range and
+    event type) as NDJSON or CSV, in chunks and in constant memory.
+    since/until are UTC ISO timestamps or dates, inclusive; a date-only
+    until includes that whole day.
+    """
+    conn = _analytics_conn()
+
+    def chunks():
+        try:
+            yield from export_events(conn, format, since, until, event_type)
+        finally:
+            conn.close()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        chunks(), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="query_events.{format}"'},
+    )
+
+
+@app.get("/analytics/rollups")
+def analytics_rollups(
+    since: str | None = None,
+    until: str | None = None,
+    zone: str | None = None,
+    by_hour: bool = False,
+    limit: int = Query(default=100, ge=1, le=10000),
+):
+    """
+    Dashboard numbers from the pre-aggregated rollup tables: queries per
+    zone/date (per hour with by_hour=true), the most popular choice sets and
+    server latency percentiles per event type. since/until are UTC ISO
+    timestamps or dates, inclusive and matched to the hour; a date-only
+    until includes that whole day.
+    """
+    conn = _analytics_conn()
+    try:
+        return {
+            "zone_dates": zone_date_counts(conn, since, until, zone, by_hour, limit),
+            "choice_sets": top_choice_sets(conn, limit),
+            "latency": latency_percentiles(conn, since, until),
+            # Tables still being filled from older rows, see analytics_schema
+            "pending_backfills": pending_backfills(conn),
+        }
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=503, detail=f"Rollup tables unavailable: {e}")
+    finally:
+        conn.close()
+
+
+@app.post("/debug/reload_odds")
+def debug_reload_odds():
+    """
+    Re-scan ODDS_DB_DIR and reload any new or changed odds_YYYY.db files.
+    Call this after dropping a new season's database into the folder.
+    """
+    require_odds()
+    reloaded = odds_index.reload()
+    return {
+        "db_dir": ODDS_DB_DIR,
+        "reloaded_years": reloaded,
+        "years": odds_index.years,
+    }
+
+
+def _runtime_gauges():
+    writer = analytics_writer.metrics()
+    yield ("analytics_queue_depth", "Analytics rows waiting to be written",
+           [({}, writer["queue_depth"])])
+    yield ("analytics_events", "Analytics rows by outcome since startup",
+           [({"outcome": k}, writer[k]) for k in ("written", "dropped", "failed")])
+    cache = odds_cache.stats()
+    yield ("odds_cache_entries", "Entries in the estimate_odds result caches",
+           [({"cache": name}, c["size"]) for name, c in cache.items()])
+    yield ("odds_cache_events", "estimate_odds result cache events since startup",
+           [({"cache": name, "event": event}, c[event])
+            for name, c in cache.items() for event in ("hits", "misses", "evictions", "expired")])
+    yield ("odds_loaded_years", "Data years loaded in the odds index",
+           [({}, len(odds_index.years))])
+    pool = read_only_pool.stats()
+    yield ("db_pool_open_connections", "Pooled read-only SQLite connections currently open",
+           [({}, pool["open"])])
+    yield ("db_pool_events", "Read-only connection pool checkouts by outcome since startup",
+           [({"event": k}, v) for k, v in pool.items() if k != "open"])
+    engine = engine_executor.stats()
+    yield ("odds_engine_inflight", "Engine calls running or queued on the engine executor",
+           [({}, engine["inflight"])])
+    yield ("odds_single_flight_inflight", "Distinct /estimate_odds queries being computed",
+           [({}, odds_single_flight.inflight())])
+    yield ("startup_ready", "1 once the start-up warm-up has finished",
+           [({}, int(warmup.ready))])
+    if warmup.startup_s is not None:
+        yield ("startup_seconds", "Process start to end of warm-up (so far, while warming)",
+               [({}, warmup.startup_s)])
+
+
+REGISTRY.add_collector(_runtime_gauges)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of request/stage timings and runtime gauges."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/odds_cache")
+def debug_odds_cache():
+    """Hit/miss/eviction counters of the estimate_odds result cache."""
+    return odds_cache.stats()
+
+
 @app.post("/debug/log_test")
 def debug_log_test():
     """
@@ -378,6 +955,7 @@ def debug_log_test():
     """
     sample_inputs = {"test": True, "source": "debug_log_test"}
     sample_results = {"message": "This is a test row"}
+    failed_before = analytics_writer.metrics()["failed"]
 
     try:
         log_query_event(
@@ -397,6 +975,12 @@ def debug_log_test():
             referrer=None,
             latency_ms=None,
         )
+        # Wait for the background writer so errors show up here
+        if not analytics_writer.flush():
+            return {"ok": False, "error": "analytics writer did not flush", "writer": analytics_writer.metrics()}
+        writer = analytics_writer.metrics()
+        if writer["failed"] > failed_before:
+            return {"ok": False, "error": writer["last_error"], "writer": writer}
         return {"ok": True, "message": "Row inserted into query_events"}
     except Exception as e:
         # Here we *don't* swallow the error; we return it so we can see what's wrong.
@@ -0,0 +1,255 @@
+"""
+Server-side timing spans, counters and histograms, rendered in the
+Prometheus text format by GET /metrics.
+
+Spans also accumulate into the current request's RequestTimings (a context
+variable set by the HTTP middleware in main.py), which feeds the optional
+X-Server-Timing header and the server_latency_ms column of query_events.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; from 100 µs in-memory lookups up to multi-second SQL joins
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+PASS_BUCKETS = tuple(range(1, 11))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(key)} {_fmt_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., sum, count]
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, series):
+                    le = ("le", _fmt_value(float(bound)))
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key, le)} {n}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(series[-2])}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Named metrics plus collectors: callables returning extra gauge samples
+    as (name, help, [(labels dict, value), ...]) at render time.
+    """
+
+    def __init__(self):
+        self._metrics: List[object] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, list]]]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float] = TIME_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, list]]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{_fmt_labels(_labels(labels))} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Server-side request latency by route")
+STAGE_SECONDS = REGISTRY.histogram(
+    "odds_stage_seconds", "Time spent in each odds engine / endpoint stage")
+SQL_QUERY_SECONDS = REGISTRY.histogram(
+    "odds_sql_query_seconds", "Time per odds database query, by query shape")
+SQL_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "odds_sql_queries_per_request", "Odds database queries run per request", COUNT_BUCKETS)
+LOOKUPS_PER_REQUEST = REGISTRY.histogram(
+    "odds_lookups_per_request", "Choice/year odds lookups per request, by source", COUNT_BUCKETS)
+ESTIMATE_PASSES = REGISTRY.histogram(
+    "odds_estimate_passes", "Window widening/narrowing passes per EstC2Odds/EstC3Odds call",
+    PASS_BUCKETS)
+
+
+class RequestTimings:
+    """Per-request totals: seconds per span name, query and lookup counts."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.sql_queries = 0
+        self.lookups: Dict[str, int] = {}
+        # A request's data years may be looked up on several threads at once
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def add_query(self, seconds: float) -> None:
+        with self._lock:
+            self.sql_queries += 1
+            self.spans["sql"] = self.spans.get("sql", 0.0) + seconds
+
+    def add_lookups(self, source: str, n: int) -> None:
+        with self._lock:
+            self.lookups[source] = self.lookups.get(source, 0) + n
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self) -> str:
+        """Server-Timing style header value, e.g. `engine;dur=0.42, total;dur=1.10`."""
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.spans.items()]
+        parts.append(f"queries;desc=\"{self.sql_queries} sql\"")
+        parts.append(f"total;dur={self.elapsed_ms():.3f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def begin_request() -> Tuple[RequestTimings, object]:
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token, route: str, method: str, status: int) -> None:
+    timings = _current.get()
+    _current.reset(token)
+    if timings is None:
+        return
+    REQUEST_SECONDS.observe((time.perf_counter() - timings.start), route=route, method=method,
+                            status=status)
+    if timings.sql_queries or timings.lookups:
+        SQL_QUERIES_PER_REQUEST.observe(timings.sql_queries, route=route)
+        for source, n in timings.lookups.items():
+            LOOKUPS_PER_REQUEST.observe(n, route=route, source=source)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def request_elapsed_ms() -> Optional[int]:
+    """Milliseconds since the current request started (None outside a request)."""
+    timings = _current.get()
+    return None if timings is None else int(round(timings.elapsed_ms()))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block into odds_stage_seconds and the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(stage, seconds)
+
+
+def timed_query(shape: str):
+    """Decorator for odds_engine functions that run one SQL query shape."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                SQL_QUERY_SECONDS.observe(seconds, shape=shape)
+                timings = _current.get()
+                if timings is not None:
+                    timings.add_query(seconds)
+        return inner
+    return wrap
+
+
+def count_lookups(source: str, n: int) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add_lookups(source, n)
+
+
+def record_passes(shape: str, passes: int) -> None:
+    ESTIMATE_PASSES.observe(passes, shape=shape)
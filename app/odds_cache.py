@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# get() result for a key that is not cached (None is a valid cached value)
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live, counting hits,
+    misses, evictions (capacity) and expirations (TTL).
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+class OddsCache:
+    """
+    Results of estimate_odds_for_choice_set at two granularities:
+
+    - requests: whole results keyed by (permit_year, data_years, choices)
+    - choices:  one choice's odds and comparable date for one data year
+
+    Every key includes the fingerprint (path, mtime) of the odds databases it
+    was computed from, so replacing or rebuilding an odds_YYYY.db makes the
+    old entries unreachable; they age out through LRU/TTL.
+    """
+
+    def __init__(self, request_maxsize: int = 5000, choice_maxsize: int = 50000,
+                 ttl: Optional[float] = 3600):
+        self.requests = LRUCache(request_maxsize, ttl)
+        self.choices = LRUCache(choice_maxsize, ttl)
+
+    def clear(self) -> None:
+        self.requests.clear()
+        self.choices.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests.stats(),
+            "choices": self.choices.stats(),
+        }
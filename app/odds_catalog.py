@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from .odds_files import connect_odds_db
+
+# Zone name whose odds depend on group size (see odds_engine.coreodds1)
+CORE_ZONE_NAME = "Core"
+
+
+class UnknownZoneError(LookupError):
+    """Zone name not present in the zone table of any requested data year."""
+
+
+class UnknownDateError(LookupError):
+    """Date string not present in a year's date table (outside the permit season)."""
+
+
+class YearCatalog:
+    """zone and date tables of one odds_YYYY.db."""
+
+    def __init__(self, year: int, zones: Dict[str, int], dates: Dict[str, int]):
+        self.year = year
+        self.zones = zones
+        self.dates = dates
+        self.corezoneid = zones.get(CORE_ZONE_NAME)
+        # permit_year -> comparable-date table, filled by odds_engine.comp_date_table
+        self.comp_dates: Dict[int, Dict[Tuple[int, int], Tuple[str, Optional[int]]]] = {}
+
+    @classmethod
+    def load(cls, year: int, cur: sqlite3.Cursor) -> "YearCatalog":
+        cur.execute("SELECT zonename, zone_id FROM zone")
+        zones: Dict[str, int] = {}
+        for name, zid in cur.fetchall():
+            zones.setdefault(name, zid)
+
+        cur.execute("SELECT datestr, date_id FROM date")
+        dates: Dict[str, int] = {}
+        for datestr, did in cur.fetchall():
+            dates.setdefault(datestr, did)
+
+        return cls(year, zones, dates)
+
+    # Convert zone name to zoneID
+    def zone_id(self, z: str) -> int:
+        try:
+            return self.zones[z]
+        except KeyError:
+            raise UnknownZoneError(
+                f"Unknown zone {z!r} in {self.year} data; known zones: {', '.join(self.zones)}"
+            ) from None
+
+    # Convert date string to dateID
+    def date_id(self, d: str) -> int:
+        try:
+            return self.dates[d]
+        except KeyError:
+            raise UnknownDateError(f"No date {d!r} in the {self.year} permit season") from None
+
+
+class OddsCatalog:
+    """
+    Year-aware zone/date lookups across every loaded odds_YYYY.db.
+
+    Zone ids are not stable between years (Colchuck is 5 in 2020 and 1 in
+    2021), so every lookup is keyed by data year.
+    """
+
+    def __init__(self, years: Dict[int, YearCatalog]):
+        self._years = years
+
+    def year(self, year: int) -> Optional[YearCatalog]:
+        return self._years.get(year)
+
+    def zone_id(self, year: int, name: str) -> int:
+        return self._years[year].zone_id(name)
+
+    def date_id(self, year: int, datestr: str) -> int:
+        return self._years[year].date_id(datestr)
+
+    def core_zone_id(self, year: int) -> Optional[int]:
+        return self._years[year].corezoneid
+
+    def check_zone(self, name: str, years: Iterable[int]) -> None:
+        """Raise UnknownZoneError unless some loaded year among `years` has the zone."""
+        loaded = [self._years[y] for y in years if y in self._years]
+        if loaded and not any(name in yc.zones for yc in loaded):
+            known = sorted({z for yc in loaded for z in yc.zones})
+            raise UnknownZoneError(f"Unknown zone {name!r}; known zones: {', '.join(known)}")
+
+
+_dir_cache: Dict[str, Tuple[float, YearCatalog]] = {}
+_dir_lock = threading.Lock()
+
+
+def catalog_for_paths(paths: Dict[int, str]) -> OddsCatalog:
+    """
+    OddsCatalog for {year: path to odds_YYYY.db}, reading each file's zone and
+    date tables only when the file is new or its mtime has changed.
+    """
+    years: Dict[int, YearCatalog] = {}
+    with _dir_lock:
+        for year, path in paths.items():
+            if not os.path.exists(path):
+                continue
+            mtime = os.path.getmtime(path)
+            cached = _dir_cache.get(path)
+            if cached is None or cached[0] != mtime:
+                conn = connect_odds_db(path)
+                try:
+                    cached = (mtime, YearCatalog.load(year, conn.cursor()))
+                finally:
+                    conn.close()
+                _dir_cache[path] = cached
+            years[year] = cached[1]
+    return OddsCatalog(years)
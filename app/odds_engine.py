@@ -1,11 +1,22 @@
 import os
 import sqlite3
 import datetime as dt
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 
-cur = None
-corezoneid = None
+from .metrics import count_lookups, record_passes, span, timed_query
+from .odds_cache import MISSING
+from .odds_catalog import UnknownDateError, UnknownZoneError, YearCatalog, catalog_for_paths
+from .db_pool import read_only_pool
+from .odds_files import odds_db_path
+from .year_fanout import NOT_LOADED, UNKNOWN, YEAR_PARTIAL, run_inline
+
+# estimate_odds_for_choice_set modes
+INDEPENDENT = "independent"
+SEQUENTIAL = "sequential"
+MODES = (INDEPENDENT, SEQUENTIAL)
 
 @dataclass
 class Choice:
@@ -15,29 +26,25 @@ class Choice:
     group_size: int
 
 
-# Estimating odds of a single choiceset
-# Convert zone name to zoneID
-def findzoneid(z):
-    cur.execute('''SELECT zone.zone_id
-            FROM zone
-            WHERE zone.zonename = ?''', (z,))
-    r = cur.fetchall()
-    return r[0][0]
+@dataclass
+class OddsContext:
+    """
+    Per-request state for one data year's odds database. Passed explicitly to
+    every lookup so concurrent requests never share a cursor or core zone.
+    """
+    cur: sqlite3.Cursor
+    corezoneid: Optional[int]
 
-# Convert date string to dateID
-def finddateid(d):
-    cur.execute('''SELECT date.date_id
-                FROM date
-                WHERE date.datestr = ?''', (d,))
-    r = cur.fetchall()
-    return r[0][0]
 
+# Estimating odds of a single choiceset
 # Building the Core zone group size scaling dictionary
 coregs = {1:4.64, 2:1.41, 3:1.15, 4:1.18, 5:1.07, 6:1.2, 7:1.03}
 
 # Find relevant records
 # Fetch exact match
-def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
+@timed_query("checkexact")
+def checkexact(ctx, cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
+    cur, corezoneid = ctx.cur, ctx.corezoneid
     if cnum == 1:
         if z1 == corezoneid:
             cur.execute('''SELECT wins.avgodds
@@ -45,7 +52,8 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         WHERE wins.choicenum = 1
                         AND wins.zoneid1 = ?
                         AND wins.dateid1 = ?
-                        AND wins.groupsize1 = ?''', (corezoneid, d1, g1))
+                        AND wins.groupsize1 = ?
+                        ORDER BY wins.rowid''', (corezoneid, d1, g1))
             r = cur.fetchall()
 
         else:
@@ -53,11 +61,12 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         FROM wins
                         WHERE wins.choicenum = 1
                         AND wins.zoneid1 = ?
-                        AND wins.dateid1 = ?''', (z1, d1))
+                        AND wins.dateid1 = ?
+                        ORDER BY wins.rowid''', (z1, d1))
             r = cur.fetchall()
 
     elif cnum == 2:
-        if z1 == corezoneid & z2 == corezoneid:
+        if z1 == corezoneid and z2 == corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -66,9 +75,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.zoneid2 = ?
                         AND wins.dateid2 = ?
                         AND wins.groupsize2 = ?
-                        AND wins.choicenum = 2''', (corezoneid, d1, g1, corezoneid, d2, g2))
+                        AND wins.choicenum = 2
+                        ORDER BY wins.rowid''', (corezoneid, d1, g1, corezoneid, d2, g2))
             r = cur.fetchall()
-        elif z1 != corezoneid & z2 == corezoneid:
+        elif z1 != corezoneid and z2 == corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -76,9 +86,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.zoneid2 = ?
                         AND wins.dateid2 = ?
                         AND wins.groupsize2 = ?
-                        AND wins.choicenum = 2''', (z1, d1, corezoneid, d2, g2))
+                        AND wins.choicenum = 2
+                        ORDER BY wins.rowid''', (z1, d1, corezoneid, d2, g2))
             r = cur.fetchall()
-        elif z1 == corezoneid & z2 != corezoneid:
+        elif z1 == corezoneid and z2 != corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -86,20 +97,22 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.groupsize1 = ?
                         AND wins.zoneid2 = ?
                         AND wins.dateid2 = ?
-                        AND wins.choicenum = 2''', (corezoneid, d1, g1, z2, d2))
+                        AND wins.choicenum = 2
+                        ORDER BY wins.rowid''', (corezoneid, d1, g1, z2, d2))
             r = cur.fetchall()
-        elif z1 != corezoneid & z2 != corezoneid:
+        elif z1 != corezoneid and z2 != corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
                         AND wins.dateid1 = ?
                         AND wins.zoneid2 = ?
                         AND wins.dateid2 = ?
-                        AND wins.choicenum = 2''', (z1, d1, z2, d2))
+                        AND wins.choicenum = 2
+                        ORDER BY wins.rowid''', (z1, d1, z2, d2))
             r = cur.fetchall()
 
     elif cnum == 3:
-        if z1 == corezoneid & z2 == corezoneid & z3 == corezoneid:
+        if z1 == corezoneid and z2 == corezoneid and z3 == corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -111,9 +124,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
                         AND wins.groupsize3 = ?
-                        AND wins.choicenum = 3''', (corezoneid, d1, g1, corezoneid, d2, g2, corezoneid, d3, g3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (corezoneid, d1, g1, corezoneid, d2, g2, corezoneid, d3, g3))
             r = cur.fetchall()
-        elif z1 != corezoneid & z2 == corezoneid & z3 == corezoneid:
+        elif z1 != corezoneid and z2 == corezoneid and z3 == corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -124,9 +138,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
                         AND wins.groupsize3 = ?
-                        AND wins.choicenum = 3''', (z1, d1, corezoneid, d2, g2, corezoneid, d3, g3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (z1, d1, corezoneid, d2, g2, corezoneid, d3, g3))
             r = cur.fetchall()
-        elif z1 == corezoneid & z2 != corezoneid & z3 == corezoneid:
+        elif z1 == corezoneid and z2 != corezoneid and z3 == corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -137,9 +152,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
                         AND wins.groupsize3 = ?
-                        AND wins.choicenum = 3''', (corezoneid, d1, g1, z2, d2, corezoneid, d3, g3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (corezoneid, d1, g1, z2, d2, corezoneid, d3, g3))
             r = cur.fetchall()
-        elif z1 == corezoneid & z2 == corezoneid & z3 != corezoneid:
+        elif z1 == corezoneid and z2 == corezoneid and z3 != corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -150,9 +166,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.groupsize2 = ?
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
-                        AND wins.choicenum = 3''', (corezoneid, d1, g1, corezoneid, d2, g2, z3, d3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (corezoneid, d1, g1, corezoneid, d2, g2, z3, d3))
             r = cur.fetchall()
-        elif z1 != corezoneid & z2 != corezoneid & z3 == corezoneid:
+        elif z1 != corezoneid and z2 != corezoneid and z3 == corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -162,9 +179,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
                         AND wins.groupsize3 = ?
-                        AND wins.choicenum = 3''', (z1, d1, z2, d2, corezoneid, d3, g3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (z1, d1, z2, d2, corezoneid, d3, g3))
             r = cur.fetchall()
-        elif z1 != corezoneid & z2 == corezoneid & z3 != corezoneid:
+        elif z1 != corezoneid and z2 == corezoneid and z3 != corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -174,9 +192,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.groupsize2 = ?
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
-                        AND wins.choicenum = 3''', (z1, d1, corezoneid, d2, g2, z3, d3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (z1, d1, corezoneid, d2, g2, z3, d3))
             r = cur.fetchall()
-        elif z1 == corezoneid & z2 != corezoneid & z3 != corezoneid:
+        elif z1 == corezoneid and z2 != corezoneid and z3 != corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -186,9 +205,10 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.dateid2 = ?
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
-                        AND wins.choicenum = 3''', (corezoneid, d1, g1, z2, d2, z3, d3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (corezoneid, d1, g1, z2, d2, z3, d3))
             r = cur.fetchall()
-        elif z1 != corezoneid & z2 != corezoneid & z3 != corezoneid:
+        elif z1 != corezoneid and z2 != corezoneid and z3 != corezoneid:
             cur.execute('''SELECT wins.avgodds
                         FROM wins
                         WHERE wins.zoneid1 = ?
@@ -197,25 +217,30 @@ def checkexact(cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
                         AND wins.dateid2 = ?
                         AND wins.zoneid3 = ?
                         AND wins.dateid3 = ?
-                        AND wins.choicenum = 3''', (z1, d1, z2, d2, z3, d3))
+                        AND wins.choicenum = 3
+                        ORDER BY wins.rowid''', (z1, d1, z2, d2, z3, d3))
             r = cur.fetchall()
     return r
 
 # 1st Choice
-def fetchCore1(d, g):
+@timed_query("fetchCore1")
+def fetchCore1(ctx, d, g):
+    cur, corezoneid = ctx.cur, ctx.corezoneid
     # Gather the avg odds for group sizes in the given dateID
     cur.execute('''SELECT wins.groupsize1, wins.avgodds
                 FROM wins
                 WHERE wins.choicenum = 1
                 AND wins.zoneid1 = ?
-                AND wins.dateid1 = ?''', (corezoneid, d))
+                AND wins.dateid1 = ?
+                ORDER BY wins.rowid''', (corezoneid, d))
     r = cur.fetchall()
 
     return r
 
 # 2nd Choice
-def fetchCore2(z1, d1, g1, d2, g2, c1odds):
-    r = checkexact(2, z1, d1, g1, corezoneid, d2, g2, 0, 0, 0)
+def fetchCore2(ctx, z1, d1, g1, d2, g2, c1odds):
+    corezoneid = ctx.corezoneid
+    r = checkexact(ctx, 2, z1, d1, g1, corezoneid, d2, g2, 0, 0, 0)
 
     # Check if C1/C2 set was chosen by prior applicants
     if len(r) == 1: # C1/C2 was chosen previously
@@ -224,27 +249,35 @@ def fetchCore2(z1, d1, g1, d2, g2, c1odds):
 
     else: # C1/C2 was not chosen previously
         # Quering the odds for C2 as 1st choice
-        C2aC1odds = coreodds1(d2, g2)
-        c2odds = EstC2Odds(C2aC1odds, c1odds)
+        C2aC1odds = coreodds1(ctx, d2, g2)
+        c2odds = EstC2Odds(ctx, C2aC1odds, c1odds)
         return c2odds
 
 # 3rd Choice
-def fetchCore3(z1, d1, g1, z2, d2, g2, d3, g3, c1odds, c2odds):
+def fetchCore3(ctx, z1, d1, g1, z2, d2, g2, d3, g3, c1odds, c2odds):
+    corezoneid = ctx.corezoneid
     # Check if C1/C2 set was chosen by prior applicants
-    r = checkexact(3, z1, d1, g1, z2, d2, g2, corezoneid, d3, g3)
+    r = checkexact(ctx, 3, z1, d1, g1, z2, d2, g2, corezoneid, d3, g3)
 
     if len(r) == 1: # C1/C2/C3 was chosen previously
         c3odds = r[0][0]
 
     else: # C1/C2/C3 was not chosen previously
         # Quering the odds for C3 as 1st choice
-        C3aC1odds = coreodds1(d3, g3)
-        c3odds = EstC3Odds(C3aC1odds, c2odds, c1odds)
+        C3aC1odds = coreodds1(ctx, d3, g3)
+        c3odds = EstC3Odds(ctx, C3aC1odds, c2odds, c1odds)
 
     return c3odds
 
+# Put EstC2Odds/EstC3Odds join rows in the join's own order, given by their
+# columns from `start` on; only the few rows a result is picked from get sorted
+def _join_order(rows, start):
+    return sorted(rows, key=lambda row: row[start:])
+
 # Estimating Choice 2 odds
-def EstC2Odds(C2aC1odds, c1odds):
+@timed_query("EstC2Odds")
+def EstC2Odds(ctx, C2aC1odds, c1odds):
+    cur = ctx.cur
     c2moe = 0.01 # Range of C2 error
     c1moe = 0.02 # Range of C1 error
     k = 1
@@ -252,10 +285,14 @@ def EstC2Odds(C2aC1odds, c1odds):
     firstresult = True
 
     while k < 11 and c2match == False:
-        cur.execute('''select c1odds, c2a1odds, wins.avgodds as c2odds
-                            from (select zc1, dc1, wins.avgodds as c1odds, zc2a1, dc2a1, c2a1odds
-                            from (select zc2a1, dc2a1, c2a1odds, wins.zoneid1 as zc1, wins.dateid1 as dc1
-                            from (select wins.zoneid1 as zc2a1, wins.dateid1 as dc2a1, wins.avgodds as c2a1odds
+        # The trailing columns are the row order the un-indexed join produced;
+        # rows are put in it (see _join_order) so ties between equally close
+        # rows break the same way with or without indexes
+        cur.execute('''select c1odds, c2a1odds, wins.avgodds as c2odds,
+                            rc12, c2a1odds, rc2a1, c1odds, rc1, wins.avgodds, wins.rowid
+                            from (select zc1, dc1, wins.avgodds as c1odds, wins.rowid as rc1, zc2a1, dc2a1, c2a1odds, rc2a1, rc12
+                            from (select zc2a1, dc2a1, c2a1odds, rc2a1, wins.rowid as rc12, wins.zoneid1 as zc1, wins.dateid1 as dc1
+                            from (select wins.zoneid1 as zc2a1, wins.dateid1 as dc2a1, wins.avgodds as c2a1odds, wins.rowid as rc2a1
                             from wins
                             where wins.choicenum = 1
                             and wins.avgodds < ?
@@ -287,6 +324,7 @@ def EstC2Odds(C2aC1odds, c1odds):
             c2match = True
             c2odds
         elif len(r2) > 1 and len(r2) <= 30: # Multiple results; average the results
+            r2 = _join_order(r2, 3)
             lowodds = 0
             lowerr = 0.01
             err1 = True
@@ -318,17 +356,20 @@ def EstC2Odds(C2aC1odds, c1odds):
             c2moe = c2moe * 1.5
             k = k + 1
 
+    record_passes("EstC2Odds", min(k, 10))
     if c2match == False:
         sumr2 = 0
-        for j in lowestr2:
+        for j in _join_order(lowestr2, 3):
             sumr2 = sumr2 + j[2]
         c2odds = sumr2 / len(lowestr2)
 
     return c2odds
 
 # Estimating Choice 3 odds
-def EstC3Odds(C3aC1odds, c2odds, c1odds):
-    # Find the odds of a C1/C2/C3 set with similar odds to C3asC1, C2, & C1
+@timed_query("EstC3Odds")
+def EstC3Odds(ctx, C3aC1odds, c2odds, c1odds):
+    cur = ctx.cur
+    # Find the odds of a C1/C2/C3 set with similar odds to C3asC1, C2, and C1
     c3moe = 0.01 # Range of C3 error
     c2moe = 0.01 # Range of C2 error
     c1moe = 0.01 # Range of C1 error
@@ -337,17 +378,19 @@ def EstC3Odds(C3aC1odds, c2odds, c1odds):
     firstresult = True
 
     while k < 11 and c3match == False:
-        cur.execute('''select c3odds, c3a1odds, c2odds, c1odds
-                    from (select c3odds, zc1a, dc1a, c3a1odds, c2odds
-                    from (select wins.zoneid1 as zc1a, wins.dateid1 as dc1a, wins.zoneid2 as zc2a, wins.dateid2 as dc2a, wins.avgodds as c3odds, c3a1odds
-                    from (SELECT wins.zoneid1 as zc3a1, wins.dateid1 as dc3a1, wins.avgodds as c3a1odds
+        # The trailing columns are the row order the un-indexed join produced
+        cur.execute('''select c3odds, c3a1odds, c2odds, c1odds,
+                    rc12, zc3a1, dc3a1, c3a1odds, rc3a1, c3odds, rc123, c1odds, rc1
+                    from (select c3odds, zc1a, dc1a, c3a1odds, zc3a1, dc3a1, rc3a1, rc123, c2odds, rc12
+                    from (select wins.zoneid1 as zc1a, wins.dateid1 as dc1a, wins.zoneid2 as zc2a, wins.dateid2 as dc2a, wins.avgodds as c3odds, wins.rowid as rc123, c3a1odds, zc3a1, dc3a1, rc3a1
+                    from (SELECT wins.zoneid1 as zc3a1, wins.dateid1 as dc3a1, wins.avgodds as c3a1odds, wins.rowid as rc3a1
                     from wins
                     where wins.choicenum = 1
                     and wins.avgodds < ?
                     and wins.avgodds > ?) join wins
                     where wins.zoneid3 = zc3a1
                     and wins.dateid3 = dc3a1) join
-                    (select wins.zoneid2 as zc2, wins.dateid2 as dc2, wins.avgodds as c2odds, wins.zoneid1 as zc1b, wins.dateid1 as dc1b
+                    (select wins.zoneid2 as zc2, wins.dateid2 as dc2, wins.avgodds as c2odds, wins.zoneid1 as zc1b, wins.dateid1 as dc1b, wins.rowid as rc12
                     from wins
                     where wins.choicenum = 2
                     and wins.avgodds < ?
@@ -356,7 +399,7 @@ def EstC3Odds(C3aC1odds, c2odds, c1odds):
                     and dc2 = dc2a
                     and zc1b = zc1a
                     and dc1b = dc1a) join
-                    (select wins.zoneid1 as zc1, wins.dateid1 as dc1, wins.avgodds as c1odds
+                    (select wins.zoneid1 as zc1, wins.dateid1 as dc1, wins.avgodds as c1odds, wins.rowid as rc1
                     from wins
                     where wins.choicenum = 1
                     and wins.avgodds < ?
@@ -376,6 +419,7 @@ def EstC3Odds(C3aC1odds, c2odds, c1odds):
             c3odds = r3[0][0]
             c3match = True
         elif len(r3) > 1 and len(r3) <= 30: # Multiple results; average the results
+            r3 = _join_order(r3, 4)
             lowodds = 0
             lowerr = 0.01
             err1 = True
@@ -407,19 +451,24 @@ def EstC3Odds(C3aC1odds, c2odds, c1odds):
             c3moe = c3moe * 1.5
             k = k + 1
 
+    record_passes("EstC3Odds", min(k, 10))
     if c3match == False:
         sumr3 = 0
-        for j in lowestr3:
+        for j in _join_order(lowestr3, 4):
             sumr3 = sumr3 + j[0]
         c3odds = sumr3 / len(lowestr3)
 
     return c3odds
 
 # Find similar odds for Choice 1 Core zone
-def coreodds1(d, g):
+def coreodds1(ctx, d, g):
     # Gather the avg odds for group sizes in the given dateID
-    r = fetchCore1(d, g)
+    r = fetchCore1(ctx, d, g)
+    with span("coreodds1"):
+        return interpolate_core_odds(r, g)
 
+# Interpolate/extrapolate core zone odds from the (groupsize, avgodds) rows of one date
+def interpolate_core_odds(r, g):
     exactmatch = False
     lowergs = 0
     lowerodds = 0
@@ -495,6 +544,27 @@ def find_comp_date(permit_date, data_year):
         return down_day
     return up_day
 
+# Comparable date string for every day of the permit year, computed once
+@lru_cache(maxsize=256)
+def comp_date_strs(permit_year: int, data_year: int) -> Dict[Tuple[int, int], str]:
+    table = {}
+    day = dt.date(permit_year, 1, 1)
+    while day.year == permit_year:
+        table[(day.month, day.day)] = find_comp_date(day, data_year).strftime('%m-%d-%Y')
+        day += dt.timedelta(1)
+    return table
+
+# (month, day) -> (comparable date string, its date_id or None) for one data year
+def comp_date_table(permit_year: int, year_catalog: YearCatalog) -> Dict[Tuple[int, int], Tuple[str, Optional[int]]]:
+    table = year_catalog.comp_dates.get(permit_year)
+    if table is None:
+        table = {
+            md: (date_str, year_catalog.dates.get(date_str))
+            for md, date_str in comp_date_strs(permit_year, year_catalog.year).items()
+        }
+        year_catalog.comp_dates[permit_year] = table
+    return table
+
 # Find the number of weekday within the month
 def daterange(start_date, end_date):
     for n in range(int((end_date - start_date).days)):
@@ -527,16 +597,35 @@ def estimate_odds_for_choice_set(
     choices: List[Choice],
     data_years: List[int],
     db_dir: str,
+    index=None,
+    cache=None,
+    mode: str = INDEPENDENT,
+    fanout=None,
 ) -> Dict[str, Any]:
     """
     Simpler, robust estimator:
 
-    - Treats each provided choice independently as a first choice (C1 only).
+    - Treats each provided choice independently as a first choice (C1 only);
+      with mode="sequential" choices 2 and 3 then get their odds given the
+      choices before them (see add_sequential_odds).
     - For each choice and each data_year:
         * Uses find_comp_date(permit_year, data_year) for comparable date.
+        * Reads from `index` (an OddsIndex snapshot) when given, otherwise
+          opens odds_<data_year>.db in db_dir (or its optimized
+          odds_<data_year>.opt.db copy when present).
+        * Zone/date ids and the core zone come from the year's OddsCatalog.
         * Looks up odds via:
             - coreodds1(...) if zone is the core zone that year.
             - checkexact(1, ...) otherwise.
+    - Raises UnknownZoneError if a zone is in none of the loaded data years.
+    - With `cache` (an OddsCache), whole results and per-choice-per-year odds
+      are reused until the odds database they came from changes.
+    - With `fanout` (a YearFanout), the data years are looked up in parallel,
+      each with a timeout; otherwise one after another.
+    - A data year that is not loaded, times out or fails gets 0.0 odds and a
+      None comparable date for every choice, and is listed in partial_years.
+      So is a year whose zone or date table lacks one of the choices, which
+      gets 0.0 odds in that year.
     - Returns:
         {
           "years": [...],
@@ -552,101 +641,349 @@ def estimate_odds_for_choice_set(
               "comp_dates_by_year": {year: "MM-DD-YYYY" or None}
             },
             ...
-          ]
+          ],
+          "partial_years": {year: "missing" | "timeout" | "error" | "unknown"}
         }
     """
-    global cur, corezoneid
-
-    result_choices: List[Dict[str, Any]] = []
-
-    for idx, c in enumerate(choices, start=1):
-        # Build a display date from the permit year and the choice's month/day
-        display_date = f"{c.month:02d}-{c.day:02d}-{permit_year}"
-
-        # If the choice is clearly invalid, fill zeros
-        if (not c.zone) or (c.month < 1 or c.month > 12) or (c.day < 1 or c.day > 31):
-            odds_by_year = {dyear: 0.0 for dyear in data_years}
-            comp_dates_by_year = {dyear: None for dyear in data_years}
-            result_choices.append(
-                {
-                    "index": idx,
-                    "zone": c.zone,
-                    "month": c.month,
-                    "day": c.day,
-                    "group_size": c.group_size,
-                    "display_date": display_date,
-                    "odds_by_year": odds_by_year,
-                    "comp_dates_by_year": comp_dates_by_year,
-                }
-            )
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+
+    if cache is not None:
+        key = (
+            permit_year,
+            tuple(data_years),
+            tuple((c.zone, c.month, c.day, c.group_size) for c in choices),
+            odds_fingerprint(data_years, db_dir, index),
+            mode,
+        )
+        cached = cache.requests.get(key)
+        if cached is not MISSING:
+            return cached
+
+    result = estimate_odds_for_choice_sets(permit_year, [choices], data_years, db_dir, index, cache,
+                                           fanout)[0]
+    if isinstance(result, Exception):
+        raise result
+    if mode == SEQUENTIAL:
+        with span("sequential"):
+            add_sequential_odds(result, permit_year, choices, data_years, db_dir, index, fanout)
+    # Timed-out or failed years may well work next time; missing and unknown
+    # ones only change with the odds databases, which are in the fingerprint
+    if cache is not None and all(r in (NOT_LOADED, UNKNOWN) for r in result["partial_years"].values()):
+        cache.requests.put(key, result)
+    return result
+
+
+def odds_fingerprint(data_years: List[int], db_dir: str, index=None) -> tuple:
+    """
+    (year, path, mtime) of the odds database each data year is read from;
+    changes whenever a file is replaced, rebuilt or reloaded.
+    """
+    fingerprint = []
+    for dyear in data_years:
+        if index is not None:
+            year_odds = index.year(dyear)
+            fp = (year_odds.path, year_odds.mtime) if year_odds is not None else None
+        else:
+            path = odds_db_path(db_dir, dyear)
+            fp = (path, os.path.getmtime(path)) if path is not None else None
+        fingerprint.append((dyear, fp))
+    return tuple(fingerprint)
+
+
+def estimate_odds_for_choice_sets(
+    permit_year: int,
+    choice_sets: List[List[Choice]],
+    data_years: List[int],
+    db_dir: str,
+    index=None,
+    cache=None,
+    fanout=None,
+) -> List[Any]:
+    """
+    Batch form of estimate_odds_for_choice_set.
+
+    Work is grouped by data year: each year's database (or snapshot) is opened
+    once and every choice of every set is looked up in it. With `fanout` the
+    years run in parallel on its pool, otherwise one after another; either way
+    their odds are merged back in data_years order.
+
+    Returns one entry per choice set, in order: the dict
+    estimate_odds_for_choice_set would return, or the UnknownZoneError that
+    set raised. With `cache`, choices already looked up for a data year are
+    served from cache.choices and that year's data is only read for misses.
+    """
+    with span("catalog"):
+        if cache is not None:
+            fingerprints = dict(odds_fingerprint(data_years, db_dir, index))
+        catalog, db_paths = _catalog(data_years, db_dir, index)
+
+    results: List[Any] = []
+    # Per set: the data years some choice's zone or date is not in
+    unknown_years: List[set] = []
+    # (choice, odds_by_year, comp_dates_by_year, its set's unknown years)
+    # still to be filled in per year
+    pending = []
+
+    for choices in choice_sets:
+        result_choices: List[Dict[str, Any]] = []
+        set_pending = []
+        set_unknown = set()
+        try:
+            for idx, c in enumerate(choices, start=1):
+                # Build a display date from the permit year and the choice's month/day
+                display_date = f"{c.month:02d}-{c.day:02d}-{permit_year}"
+
+                # If the choice is clearly invalid, fill zeros
+                if (not c.zone) or (c.month < 1 or c.month > 12) or (c.day < 1 or c.day > 31):
+                    odds_by_year = {dyear: 0.0 for dyear in data_years}
+                    comp_dates_by_year = {dyear: None for dyear in data_years}
+                else:
+                    catalog.check_zone(c.zone, data_years)
+                    odds_by_year: Dict[int, float] = {}
+                    comp_dates_by_year: Dict[int, str] = {}
+                    set_pending.append((c, odds_by_year, comp_dates_by_year, set_unknown))
+
+                result_choices.append(
+                    {
+                        "index": idx,
+                        "zone": c.zone,
+                        "month": c.month,
+                        "day": c.day,
+                        "group_size": c.group_size,
+                        "display_date": display_date,
+                        "odds_by_year": odds_by_year,
+                        "comp_dates_by_year": comp_dates_by_year,
+                    }
+                )
+        except UnknownZoneError as e:
+            results.append(e)
+            unknown_years.append(set_unknown)
             continue
 
-        odds_by_year: Dict[int, float] = {}
-        comp_dates_by_year: Dict[int, str] = {}
-
-        for dyear in data_years:
-            # Set corezoneid as in your original script
-            if dyear == 2022:
-                corezoneid = 4
-            elif dyear == 2023:
-                corezoneid = 7
-            elif dyear == 2024:
-                corezoneid = 1
-            else:
-                corezoneid = 3
-
-            db_name = f"odds_{dyear}.db"
-            db_path = os.path.join(db_dir, db_name)
-            if not os.path.exists(db_path):
-                odds_by_year[dyear] = 0.0
-                comp_dates_by_year[dyear] = None
-                continue
-
-            conn = sqlite3.connect(db_path)
-            cur = conn.cursor()
-            try:
-                # Comparable date for this permit date in the given data_year
-                permit_date = dt.date(permit_year, c.month, c.day)
-                comp_date = find_comp_date(permit_date, dyear)
-                date_str = comp_date.strftime('%m-%d-%Y')
-                comp_dates_by_year[dyear] = date_str
-
-                # Look up IDs
-                zid = findzoneid(c.zone)
-                did = finddateid(date_str)
-
-                # Core vs non-core logic (C1 only)
-                if zid == corezoneid:
-                    # Use core odds function
-                    odds_value = coreodds1(did, c.group_size)
+        pending.extend(set_pending)
+        unknown_years.append(set_unknown)
+        results.append({
+            "years": data_years,
+            "choices": result_choices,
+        })
+
+    def lookup(dyear):
+        """(odds, comparable date, found in the year's tables) of every pending choice in dyear."""
+        found: Dict[int, Tuple[float, Optional[str], bool]] = {}
+        todo = [(i, c) for i, (c, _, _, _) in enumerate(pending)]
+        if cache is not None:
+            with span("cache"):
+                misses = []
+                for i, c in todo:
+                    cached = cache.choices.get(_choice_key(permit_year, dyear, fingerprints[dyear], c))
+                    if cached is MISSING:
+                        misses.append((i, c))
+                    else:
+                        found[i] = cached
+            count_lookups("cache", len(todo) - len(misses))
+            todo = misses
+        if not todo:
+            return found
+
+        count_lookups("index" if index is not None else "sql", len(todo))
+        with _year_source(dyear, catalog, db_paths, index) as source, span("lookup"):
+            for i, c in todo:
+                odds, comp_dates = {}, {}
+                known = first_choice_odds(source, catalog, dyear, permit_year, c, odds, comp_dates)
+                found[i] = (odds[dyear], comp_dates[dyear], known)
+                if cache is not None:
+                    cache.choices.put(_choice_key(permit_year, dyear, fingerprints[dyear], c),
+                                      found[i])
+        return found
+
+    loaded = [dyear for dyear in data_years if _year_loaded(dyear, catalog, index)]
+    by_year, partial = (fanout.run if fanout is not None else run_inline)(
+        loaded if pending else [], lookup)
+    for dyear in data_years:
+        if dyear not in loaded:
+            partial[dyear] = NOT_LOADED
+            YEAR_PARTIAL.inc(reason=NOT_LOADED)
+    for dyear in data_years:
+        found = by_year.get(dyear, {})
+        for i, (c, odds_by_year, comp_dates_by_year, set_unknown) in enumerate(pending):
+            odds_by_year[dyear], comp_dates_by_year[dyear], known = found.get(i, (0.0, None, True))
+            if not known:
+                set_unknown.add(dyear)
+
+    for result, set_unknown in zip(results, unknown_years):
+        if not isinstance(result, Exception):
+            result["partial_years"] = {dyear: partial.get(dyear, UNKNOWN) for dyear in data_years
+                                       if dyear in partial or dyear in set_unknown}
+    return results
+
+
+def _catalog(data_years, db_dir, index=None):
+    """(OddsCatalog, {year: path or None}) for the data years being read."""
+    if index is not None:
+        return index.catalog, {}
+    db_paths = {dyear: odds_db_path(db_dir, dyear) for dyear in data_years}
+    return catalog_for_paths({y: p for y, p in db_paths.items() if p is not None}), db_paths
+
+
+def _year_loaded(dyear, catalog, index=None) -> bool:
+    return catalog.year(dyear) is not None and (index is None or index.year(dyear) is not None)
+
+
+@contextmanager
+def _year_source(dyear, catalog, db_paths, index=None):
+    """
+    The year's YearOdds snapshot when reading from `index`, otherwise an
+    OddsContext on the calling thread's pooled connection to its database.
+    """
+    if index is not None:
+        # Serve the lookups from the in-memory snapshot
+        yield index.year(dyear)
+        return
+    with ExitStack() as stack:
+        with span("connect"):
+            conn = stack.enter_context(read_only_pool.connection(db_paths[dyear]))
+        yield OddsContext(cur=conn.cursor(), corezoneid=catalog.core_zone_id(dyear))
+
+
+def add_sequential_odds(result, permit_year, choices, data_years, db_dir, index=None, fanout=None):
+    """
+    Turn an independent estimate_odds_for_choice_set result into a
+    sequential one, in place: odds_by_year of choices 2 and 3 becomes their
+    odds given the choices before them, and each choice's independent odds
+    move to first_choice_odds_by_year.
+
+    For every data year, choice 2 takes the odds of the exact C1/C2 set if
+    prior applicants chose it, else EstC2Odds from its own first-choice odds
+    and choice 1's; choice 3 likewise from the C1/C2/C3 set or EstC3Odds.
+    This is fetchCore2/fetchCore3 generalized from the core zone to any zone.
+    Choices past the third keep their first-choice odds. Years already in
+    result["partial_years"] are skipped; a year that times out or fails here
+    is added to it, with 0.0 conditional odds.
+    """
+    result["mode"] = SEQUENTIAL
+    entries = result["choices"]
+    for entry in entries:
+        entry["first_choice_odds_by_year"] = dict(entry["odds_by_year"])
+    if len(choices) < 2:
+        return result
+
+    catalog, db_paths = _catalog(data_years, db_dir, index)
+    partial = result.setdefault("partial_years", {})
+
+    def lookup(dyear):
+        ids = [_choice_ids(catalog, dyear, permit_year, c) for c in choices[:3]]
+        first = [entry["first_choice_odds_by_year"][dyear] for entry in entries[:3]]
+        with _year_source(dyear, catalog, db_paths, index) as source:
+            return conditional_odds(source, ids, first)
+
+    years = [dyear for dyear in data_years
+             if dyear not in partial and _year_loaded(dyear, catalog, index)]
+    by_year, failed = (fanout.run if fanout is not None else run_inline)(years, lookup)
+    for dyear in years:
+        odds = by_year.get(dyear)
+        if odds is None:
+            partial[dyear] = failed[dyear]
+            odds = [entries[0]["odds_by_year"][dyear]] + [0.0] * (min(len(entries), 3) - 1)
+        for entry, value in zip(entries, odds):
+            entry["odds_by_year"][dyear] = value
+    if failed:
+        result["partial_years"] = {dyear: partial[dyear] for dyear in data_years if dyear in partial}
+    return result
+
+
+def _choice_ids(catalog, dyear, permit_year, c):
+    """(zone id, comparable date id, group size) of a choice in dyear, or None."""
+    if (not c.zone) or (c.month < 1 or c.month > 12) or (c.day < 1 or c.day > 31):
+        return None
+    entry = comp_date_table(permit_year, catalog.year(dyear)).get((c.month, c.day))
+    zid = catalog.year(dyear).zones.get(c.zone)
+    if entry is None or entry[1] is None or zid is None:
+        return None
+    return (zid, entry[1], c.group_size)
+
+
+def conditional_odds(source, ids, first):
+    """
+    Odds of up to three choices, each given the ones before it, for one data
+    year. `ids` are _choice_ids results, `first` the first-choice odds.
+    `source` is an OddsContext (SQL) or a YearOdds snapshot.
+    """
+    odds = [first[0]]
+    for n in range(2, len(ids) + 1):
+        if ids[n - 1] is None:
+            odds.append(0.0)
+            continue
+        try:
+            r = None
+            if all(i is not None for i in ids[:n]):
+                # Check if this C1/C2(/C3) set was chosen by prior applicants
+                args = [v for zdg in ids[:n] for v in zdg] + [0, 0, 0] * (3 - n)
+                if isinstance(source, OddsContext):
+                    r = checkexact(source, n, *args)
                 else:
-                    # Use exact C1 odds if available
-                    r = checkexact(1, zid, did, c.group_size, 0, 0, 0, 0, 0, 0)
-                    odds_value = r[0][0] if r else 0.0
-
-                odds_by_year[dyear] = float(odds_value)
-            except Exception:
-                # If something goes wrong, be safe and set 0 for that year
-                odds_by_year[dyear] = 0.0
-                # comp_dates_by_year[dyear] may already be set; if not, keep None
-                comp_dates_by_year.setdefault(dyear, None)
-            finally:
-                conn.close()
-
-        result_choices.append(
-            {
-                "index": idx,
-                "zone": c.zone,
-                "month": c.month,
-                "day": c.day,
-                "group_size": c.group_size,
-                "display_date": display_date,
-                "odds_by_year": odds_by_year,
-                "comp_dates_by_year": comp_dates_by_year,
-            }
-        )
+                    r = source.checkexact(n, *args)
+            if r is not None and len(r) == 1: # Set was chosen previously, as in fetchCore2/3
+                value = r[0][0]
+            # Otherwise estimate from sets with similar as-first-choice odds
+            elif isinstance(source, OddsContext):
+                value = (EstC2Odds(source, first[1], odds[0]) if n == 2
+                         else EstC3Odds(source, first[2], odds[1], odds[0]))
+            else:
+                value = (source.EstC2Odds(first[1], odds[0]) if n == 2
+                         else source.EstC3Odds(first[2], odds[1], odds[0]))
+            odds.append(float(value))
+        except Exception:
+            # If something goes wrong, be safe and set 0 for that year
+            odds.append(0.0)
+    return odds
+
+
+def _choice_key(permit_year, dyear, fingerprint, c):
+    return (permit_year, dyear, fingerprint, c.zone, c.month, c.day, c.group_size)
+
 
-    return {
-        "years": data_years,
-        "choices": result_choices,
-    }
+def first_choice_odds(source, catalog, dyear, permit_year, c, odds_by_year, comp_dates_by_year):
+    """
+    Fill odds_by_year[dyear] / comp_dates_by_year[dyear] for one choice.
+    `source` is an OddsContext (SQL) or a YearOdds snapshot.
+
+    Returns False, with 0.0 odds, if the choice's zone or date is not in the
+    year's tables; any other error propagates.
+    """
+    try:
+        # Comparable date for this permit date in the given data_year
+        entry = comp_date_table(permit_year, catalog.year(dyear)).get((c.month, c.day))
+        if entry is None:
+            raise UnknownDateError(f"No day {c.month}/{c.day} in {permit_year}")
+        date_str, did = entry
+        comp_dates_by_year[dyear] = date_str
+
+        # Look up IDs
+        zid = catalog.zone_id(dyear, c.zone)
+        if did is None:
+            raise UnknownDateError(f"No date {date_str!r} in the {dyear} permit season")
+
+        # Core vs non-core logic (C1 only)
+        if isinstance(source, OddsContext):
+            if zid == source.corezoneid:
+                # Use core odds function
+                odds_value = coreodds1(source, did, c.group_size)
+            else:
+                # Use exact C1 odds if available
+                r = checkexact(source, 1, zid, did, c.group_size, 0, 0, 0, 0, 0, 0)
+                odds_value = r[0][0] if r else 0.0
+        elif zid == source.corezoneid:
+            odds_value = source.coreodds1(did, c.group_size)
+        else:
+            r = source.checkexact(1, zid, did, c.group_size, 0, 0, 0, 0, 0, 0)
+            odds_value = r[0][0] if r else 0.0
+
+        odds_by_year[dyear] = float(odds_value)
+        return True
+    except (UnknownZoneError, UnknownDateError):
+        # Not in this year's data: 0 for that year, flagged in partial_years
+        odds_by_year[dyear] = 0.0
+        # comp_dates_by_year[dyear] may already be set; if not, keep None
+        comp_dates_by_year.setdefault(dyear, None)
+        return False
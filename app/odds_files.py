@@ -0,0 +1,65 @@
+import os
+import re
+import sqlite3
+from typing import Dict, Optional
+
+from .db_pool import connect_read_only
+
+ODDS_DB_PATTERN = re.compile(r"^odds_(\d{4})\.db$")
+
+# Read-only, indexed copy written by `python -m app.optimize_odds_db`
+OPTIMIZED_SUFFIX = ".opt.db"
+
+
+def optimized_path(path: str) -> str:
+    """odds_2021.db -> odds_2021.opt.db"""
+    return path[: -len(".db")] + OPTIMIZED_SUFFIX
+
+
+def source_path(path: str) -> str:
+    """odds_2021.opt.db -> odds_2021.db; other paths are returned unchanged."""
+    if path.endswith(OPTIMIZED_SUFFIX):
+        return path[: -len(OPTIMIZED_SUFFIX)] + ".db"
+    return path
+
+
+def prefer_optimized(path: str) -> str:
+    """
+    Use the optimized copy of an odds database when it exists and is at least
+    as new as the original, so a freshly dropped-in file is never shadowed by
+    a stale copy.
+    """
+    opt = optimized_path(path)
+    if os.path.exists(opt) and os.path.getmtime(opt) >= os.path.getmtime(path):
+        return opt
+    return path
+
+
+def odds_db_path(db_dir: str, dyear: int) -> Optional[str]:
+    """Path of the file to read for a data year, or None if there is none."""
+    path = os.path.join(db_dir, f"odds_{dyear}.db")
+    if not os.path.exists(path):
+        return None
+    return prefer_optimized(path)
+
+
+def find_odds_dbs(db_dir: str) -> Dict[int, str]:
+    """{data year: path to read} for every odds_YYYY.db in db_dir."""
+    found: Dict[int, str] = {}
+    if not os.path.isdir(db_dir):
+        return found
+    for name in os.listdir(db_dir):
+        m = ODDS_DB_PATTERN.match(name)
+        if m:
+            found[int(m.group(1))] = prefer_optimized(os.path.join(db_dir, name))
+    return found
+
+
+def connect_odds_db(path: str) -> sqlite3.Connection:
+    """
+    Open an odds database. Optimized copies never change once written, so
+    they are opened read-only and immutable (no locking or change checks).
+    """
+    if path.endswith(OPTIMIZED_SUFFIX):
+        return connect_read_only(path)
+    return sqlite3.connect(path)
@@ -0,0 +1,162 @@
+"""
+Full-season first-choice odds for one zone: every permit-season date times
+group sizes 1-8, for every loaded data year.
+
+Each cell matches what estimate_odds_for_choice_set returns for that single
+choice. Grids are cached as JSON files keyed by the zone, permit year and a
+content hash of every odds database they were computed from, so dropping in
+a new or rebuilt odds_YYYY.db invalidates them automatically.
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .core_table import GROUP_SIZES, OBSERVED, SOURCES
+from .odds_engine import comp_date_table
+
+# Bump when the grid layout or cell logic changes so old cache files are ignored
+GRID_VERSION = 2
+
+_hash_cache: Dict[str, Tuple[float, int, str]] = {}
+_hash_lock = threading.Lock()
+
+
+def file_hash(path: str) -> str:
+    """sha256 of a file's contents, recomputed only when its mtime or size changes."""
+    st = os.stat(path)
+    with _hash_lock:
+        cached = _hash_cache.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+            return cached[2]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _hash_lock:
+        _hash_cache[path] = (st.st_mtime, st.st_size, digest)
+    return digest
+
+
+def season_dates(index, permit_year: int) -> List[dt.date]:
+    """Permit-year dates for every month/day in any loaded year's date table."""
+    dates = set()
+    for dyear in index.years:
+        for datestr in index.year(dyear).catalog.dates:
+            try:
+                d = dt.datetime.strptime(datestr, "%m-%d-%Y").date()
+                dates.add(dt.date(permit_year, d.month, d.day))
+            except ValueError:
+                # Placeholder rows ("None") and Feb 29 in a non-leap permit year
+                continue
+    return sorted(dates)
+
+
+def _year_grid(year_odds, zone: str, dates: List[dt.date]
+               ) -> Tuple[np.ndarray, List[Optional[str]], List[List[Optional[str]]]]:
+    """
+    [len(dates), 8] first-choice odds for one data year, the comparable date
+    used for each row, and where each cell came from (core_table.SOURCES).
+    """
+    grid = np.zeros((len(dates), len(GROUP_SIZES)))
+    comp_dates: List[Optional[str]] = []
+    no_data = [[None] * len(GROUP_SIZES) for _ in dates]
+
+    # Comparable date ids for the whole season in one go
+    table = comp_date_table(dates[0].year, year_odds.catalog) if dates else {}
+    date_ids = np.full(len(dates), -1, dtype=np.int64)
+    for i, d in enumerate(dates):
+        date_str, did = table[(d.month, d.day)]
+        comp_dates.append(date_str)
+        date_ids[i] = -1 if did is None else did
+
+    zid = year_odds.catalog.zones.get(zone)
+    if zid is None:
+        return grid, comp_dates, no_data
+
+    known = date_ids >= 0
+    if zid == year_odds.corezoneid:
+        # Core zone: observed group sizes, interpolated/extrapolated for the rest
+        table = year_odds.core_table
+        grid[known] = np.nan_to_num(table.odds_table[date_ids[known]], nan=0.0)
+        return grid, comp_dates, table.source_rows(date_ids.tolist())
+
+    # One pass over the zone's C1 rows: a [date_id, group size] table of the
+    # first observed odds (rows are in table order, like the SQL lookups)
+    max_did = max(year_odds.catalog.dates.values(), default=0)
+    first = np.zeros(max_did + 1)
+    observed = set()
+    for did in set(date_ids.tolist()) - {-1}:
+        rows = year_odds.wins.get((1, zid, did))
+        if rows:
+            first[did] = rows[0][3]
+            observed.add(did)
+
+    # Outside the core zone group size doesn't change the odds
+    grid[known, :] = first[date_ids[known]][:, None]
+    sources = [[SOURCES[OBSERVED]] * len(GROUP_SIZES) if did in observed else row
+               for did, row in zip(date_ids.tolist(), no_data)]
+    return grid, comp_dates, sources
+
+
+def compute_grid(index, zone: str, permit_year: int) -> Dict[str, Any]:
+    dates = season_dates(index, permit_year)
+    odds_by_year: Dict[int, List[List[float]]] = {}
+    comp_dates_by_year: Dict[int, List[Optional[str]]] = {}
+    sources_by_year: Dict[int, List[List[Optional[str]]]] = {}
+    for dyear in index.years:
+        grid, comp_dates, sources = _year_grid(index.year(dyear), zone, dates)
+        odds_by_year[dyear] = grid.tolist()
+        comp_dates_by_year[dyear] = comp_dates
+        sources_by_year[dyear] = sources
+
+    return {
+        "zone": zone,
+        "permit_year": permit_year,
+        "years": index.years,
+        "group_sizes": GROUP_SIZES,
+        "dates": [d.strftime('%m-%d-%Y') for d in dates],
+        "odds_by_year": odds_by_year,
+        "comp_dates_by_year": comp_dates_by_year,
+        "sources_by_year": sources_by_year,
+    }
+
+
+def odds_grid(index, zone: str, permit_year: int, cache_dir: os.PathLike) -> Dict[str, Any]:
+    """
+    Season grid for `zone`, read from cache_dir when an up-to-date copy exists.
+    Raises UnknownZoneError if no loaded year has the zone.
+    """
+    index.catalog.check_zone(zone, index.years)
+
+    key_src = json.dumps({
+        "version": GRID_VERSION,
+        "zone": zone,
+        "permit_year": permit_year,
+        "dbs": {y: file_hash(index.year(y).path) for y in index.years},
+    }, sort_keys=True)
+    key = hashlib.sha256(key_src.encode("utf-8")).hexdigest()[:32]
+    path = os.path.join(cache_dir, f"grid_{key}.json")
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    grid = compute_grid(index, zone, permit_year)
+
+    # Write atomically so a concurrent reader never sees a partial file
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(grid, f)
+    os.replace(tmp, path)
+    return grid
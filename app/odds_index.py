@@ -0,0 +1,191 @@
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import span
+from .choice_match import matcher_for
+from .core_table import GROUP_SIZES, CoreOddsTable
+from .odds_catalog import OddsCatalog, YearCatalog
+from .odds_engine import interpolate_core_odds
+from .odds_files import connect_odds_db, find_odds_dbs, source_path
+from .odds_store import OddsStore, store_path
+
+# Number of leading (choicenum, zoneid1, dateid1, ...) columns the SQL
+# lookups filter on for each choice number
+KEY_WIDTH = {1: 3, 2: 5, 3: 7}
+
+
+class YearOdds:
+    """
+    Everything the engine reads from one odds_YYYY.db, held in memory.
+
+    wins rows are grouped by choicenum plus the zone/date ids that choice
+    number is queried on, e.g. (2, zoneid1, dateid1, zoneid2, dateid2); each
+    group keeps its (groupsize1, groupsize2, groupsize3, avgodds) rows in
+    table order, so lookups return rows in the same order as the SQL queries
+    in odds_engine. core_table holds the core zone's odds for every date and
+    group size 1-8, precomputed. row_ids, grouped like wins, holds each row's
+    position in the table; the ChoiceSetMatcher orders its candidates by it,
+    as the SQL joins order theirs by rowid.
+    """
+
+    def __init__(self, year: int, path: str, mtime: float, catalog: YearCatalog,
+                 wins: Dict[Tuple[int, ...], List[Tuple[int, int, int, float]]],
+                 row_ids: Optional[Dict[Tuple[int, ...], List[int]]] = None):
+        self.year = year
+        self.path = path
+        self.mtime = mtime
+        self.catalog = catalog
+        self.corezoneid = catalog.corezoneid
+        self.wins = wins
+        self.row_ids = row_ids
+        self.core_table = CoreOddsTable.build(wins, self.corezoneid, catalog.dates.values())
+
+    @classmethod
+    def load(cls, year: int, path: str) -> "YearOdds":
+        mtime = os.path.getmtime(path)
+        conn = connect_odds_db(path)
+        try:
+            cur = conn.cursor()
+            catalog = YearCatalog.load(year, cur)
+
+            cur.execute('''SELECT choicenum, zoneid1, dateid1, zoneid2, dateid2,
+                        zoneid3, dateid3, groupsize1, groupsize2, groupsize3, avgodds
+                        FROM wins
+                        ORDER BY rowid''')
+            wins: Dict[Tuple[int, ...], List[Tuple[int, int, int, float]]] = defaultdict(list)
+            row_ids: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+            for i, row in enumerate(cur.fetchall()):
+                key = row[:KEY_WIDTH.get(row[0], 7)]
+                wins[key].append(row[7:])
+                row_ids[key].append(i)
+        finally:
+            conn.close()
+
+        return cls(year, path, mtime, catalog, dict(wins), dict(row_ids))
+
+    @classmethod
+    def from_store(cls, year: int, path: str, store: OddsStore) -> "YearOdds":
+        """
+        The same snapshot built from the year's rows of a columnar store.
+        Zone ids are the store-wide ones, in both the catalog and the rows.
+        """
+        mtime = os.path.getmtime(path)
+        cols = store.year_rows(year)
+        keys = zip(*(cols[name].tolist() for name in
+                     ("choicenum", "zone1", "date1", "zone2", "date2", "zone3", "date3")))
+        values = zip(cols["group1"].tolist(), cols["group2"].tolist(), cols["group3"].tolist(),
+                     store.odds(cols["odds"]).tolist())
+        wins: Dict[Tuple[int, ...], List[Tuple[int, int, int, float]]] = defaultdict(list)
+        row_ids: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+        for i, (key, row) in enumerate(zip(keys, values)):
+            key = key[:KEY_WIDTH.get(key[0], 7)]
+            wins[key].append(row)
+            row_ids[key].append(i)
+        return cls(year, path, mtime, store.catalog(year), dict(wins), dict(row_ids))
+
+    # Convert zone name to zoneID
+    def zone_id(self, z: str) -> int:
+        return self.catalog.zone_id(z)
+
+    # Convert date string to dateID
+    def date_id(self, d: str) -> int:
+        return self.catalog.date_id(d)
+
+    # Fetch exact match; same rows as odds_engine.checkexact
+    def checkexact(self, cnum, z1, d1, g1, z2, d2, g2, z3, d3, g3):
+        key = (cnum, z1, d1, z2, d2, z3, d3)[:KEY_WIDTH[cnum]]
+
+        # Group size only matters for picks in the core zone
+        core = self.corezoneid
+        want = (g1 if z1 == core else None,
+                g2 if cnum >= 2 and z2 == core else None,
+                g3 if cnum == 3 and z3 == core else None)
+
+        return [(row[3],) for row in self.wins.get(key, ())
+                if all(w is None or w == gs for w, gs in zip(want, row))]
+
+    # 1st Choice
+    def fetchCore1(self, d, g):
+        rows = self.wins.get((1, self.corezoneid, d), ())
+        return [(row[0], row[3]) for row in rows]
+
+    # Find similar odds for Choice 1 Core zone; same value as odds_engine.coreodds1
+    def coreodds1(self, d, g):
+        if g in GROUP_SIZES:
+            with span("coreodds1"):
+                return self.core_table.odds(d, g)
+        rows = self.fetchCore1(d, g)
+        with span("coreodds1"):
+            return interpolate_core_odds(rows, g)
+
+    # Estimating Choice 2 odds; the candidate arrays are built on first use
+    def EstC2Odds(self, C2aC1odds, c1odds):
+        return matcher_for(self).est_c2_odds(C2aC1odds, c1odds)
+
+    # Estimating Choice 3 odds
+    def EstC3Odds(self, C3aC1odds, c2odds, c1odds):
+        return matcher_for(self).est_c3_odds(C3aC1odds, c2odds, c1odds)
+
+
+class OddsIndex:
+    """
+    In-memory snapshot of every odds_YYYY.db in a directory.
+
+    Each file is read once; call reload() after dropping a new year's file
+    into the directory (or replacing an existing one). Years that are up to
+    date in the directory's columnar store (see app.odds_store) are read from
+    its memory-mapped columns instead of SQLite.
+    """
+
+    def __init__(self, db_dir: str, load: bool = True):
+        self.db_dir = db_dir
+        self._years: Dict[int, YearOdds] = {}
+        self.catalog = OddsCatalog({})
+        self._lock = threading.Lock()
+        if load:
+            self.reload()
+
+    def reload(self, workers: int = 1) -> List[int]:
+        """
+        Re-scan db_dir, loading new or modified files and dropping removed ones.
+        With workers > 1 the years are read in parallel. Returns the list of
+        years that were (re)loaded.
+        """
+        with self._lock:
+            years: Dict[int, YearOdds] = {}
+            pending: Dict[int, str] = {}
+            store = OddsStore.open(store_path(self.db_dir))
+            for dyear, path in sorted(find_odds_dbs(self.db_dir).items()):
+                current = self._years.get(dyear)
+                if (current is not None and current.path == path
+                        and current.mtime == os.path.getmtime(path)):
+                    years[dyear] = current
+                else:
+                    pending[dyear] = path
+
+            def load(dyear: int) -> YearOdds:
+                path = pending[dyear]
+                if store is not None and store.has_fresh_year(dyear, source_path(path)):
+                    return YearOdds.from_store(dyear, path, store)
+                return YearOdds.load(dyear, path)
+
+            if workers > 1 and len(pending) > 1:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="odds-load") as pool:
+                    years.update(zip(pending, pool.map(load, pending)))
+            else:
+                years.update((dyear, load(dyear)) for dyear in pending)
+
+            # Swap in one assignment so readers never see a half-built index
+            self._years = dict(sorted(years.items()))
+            self.catalog = OddsCatalog({y: yo.catalog for y, yo in self._years.items()})
+            return list(pending)
+
+    def year(self, dyear: int) -> Optional[YearOdds]:
+        return self._years.get(dyear)
+
+    @property
+    def years(self) -> List[int]:
+        return sorted(self._years)
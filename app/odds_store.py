@@ -0,0 +1,209 @@
+"""
+Columnar, memory-mappable copy of every odds_YYYY.db in a folder.
+
+    python -m app.odds_store [DB_DIR] [--out DB_DIR/odds_store]
+
+The per-year files differ in schema (2021 adds wins_id and a REAL avgodds,
+2020 uses NUMERIC) and in zone numbering. The ingest normalizes all of them
+into one set of NumPy .npy columns, one row per wins row, years
+concatenated in order and rows in table order:
+
+    year        int16
+    choicenum   int8
+    zone1..3    int16   store-wide zone ids (0 = no choice)
+    date1..3    int16   the year's own date_id (0 = no choice)
+    group1..3   int8
+    odds        uint16  index into values.npy (float64, sorted distinct
+                        avgodds), which keeps the odds exact
+
+manifest.json holds the store-wide zone table and, per year, its row range,
+date table and the size/mtime of the source file, so a year whose
+odds_YYYY.db changed after the ingest is ignored until it is rebuilt.
+Columns open with np.load(mmap_mode="r"), so loading is zero-copy and one
+filter on the year column covers any set of years.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .odds_catalog import YearCatalog
+from .odds_files import ODDS_DB_PATTERN
+
+STORE_DIRNAME = "odds_store"
+STORE_VERSION = 1
+MANIFEST = "manifest.json"
+
+COLUMNS = {
+    "year": np.int16,
+    "choicenum": np.int8,
+    "zone1": np.int16, "zone2": np.int16, "zone3": np.int16,
+    "date1": np.int16, "date2": np.int16, "date3": np.int16,
+    "group1": np.int8, "group2": np.int8, "group3": np.int8,
+    "odds": np.uint16,
+}
+
+
+def store_path(db_dir: str) -> str:
+    return os.path.join(db_dir, STORE_DIRNAME)
+
+
+def _source_stamp(path: str) -> Dict[str, float]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def build_store(db_dir: str, out_dir: Optional[str] = None,
+                years: Optional[List[int]] = None) -> str:
+    """Ingest odds_YYYY.db files from db_dir into a store at out_dir."""
+    out_dir = out_dir or store_path(db_dir)
+    sources = {}
+    for name in sorted(os.listdir(db_dir)):
+        m = ODDS_DB_PATTERN.match(name)
+        if m and (not years or int(m.group(1)) in years):
+            sources[int(m.group(1))] = os.path.join(db_dir, name)
+
+    zone_ids: Dict[str, int] = {}
+    parts: Dict[str, list] = {name: [] for name in COLUMNS}
+    raw_odds = []
+    manifest_years = {}
+    start = 0
+
+    for year, path in sorted(sources.items()):
+        stamp = _source_stamp(path)
+        conn = sqlite3.connect(path)
+        try:
+            cur = conn.cursor()
+            catalog = YearCatalog.load(year, cur)
+            cur.execute('''SELECT choicenum, zoneid1, zoneid2, zoneid3, dateid1, dateid2, dateid3,
+                        groupsize1, groupsize2, groupsize3, avgodds
+                        FROM wins
+                        ORDER BY rowid''')
+            rows = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 11)
+        finally:
+            conn.close()
+
+        # Year-local zone ids -> store-wide ids by name; 0 stays "no choice"
+        local_to_global = np.zeros(max(catalog.zones.values(), default=0) + 1, dtype=np.int16)
+        for zname, zid in catalog.zones.items():
+            local_to_global[zid] = zone_ids.setdefault(zname, len(zone_ids) + 1)
+
+        n = len(rows)
+        parts["year"].append(np.full(n, year, dtype=np.int16))
+        parts["choicenum"].append(rows[:, 0].astype(np.int8))
+        for i, col in enumerate(("zone1", "zone2", "zone3"), start=1):
+            parts[col].append(local_to_global[rows[:, i].astype(np.int64)])
+        for i, col in enumerate(("date1", "date2", "date3"), start=4):
+            parts[col].append(rows[:, i].astype(np.int16))
+        for i, col in enumerate(("group1", "group2", "group3"), start=7):
+            parts[col].append(rows[:, i].astype(np.int8))
+        raw_odds.append(rows[:, 10])
+
+        manifest_years[str(year)] = {
+            "source": os.path.basename(path),
+            "source_size": stamp["size"],
+            "source_mtime": stamp["mtime"],
+            "rows": [start, start + n],
+            "zones": {zname: int(local_to_global[zid]) for zname, zid in catalog.zones.items()},
+            "dates": catalog.dates,
+        }
+        start += n
+
+    all_odds = np.concatenate(raw_odds) if raw_odds else np.zeros(0)
+    values = np.unique(all_odds)
+    parts["odds"] = [np.searchsorted(values, all_odds).astype(np.uint16)]
+
+    # Write next to the live store and swap directories, so readers never
+    # see a half-written set of columns
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, dtype in COLUMNS.items():
+        col = np.concatenate(parts[name]) if parts[name] else np.zeros(0)
+        np.save(os.path.join(tmp, f"{name}.npy"), col.astype(dtype, copy=False))
+    np.save(os.path.join(tmp, "values.npy"), values)
+    with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"version": STORE_VERSION, "zones": zone_ids, "years": manifest_years}, f)
+
+    old = out_dir + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old)
+    os.replace(tmp, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return out_dir
+
+
+class OddsStore:
+    """Read side of a store: memory-mapped columns plus the manifest."""
+
+    def __init__(self, path: str, manifest: dict, columns: Dict[str, np.ndarray],
+                 values: np.ndarray):
+        self.path = path
+        self.manifest = manifest
+        self.columns = columns
+        self.values = values
+        self.zones: Dict[str, int] = manifest["zones"]
+
+    @classmethod
+    def open(cls, path: str) -> Optional["OddsStore"]:
+        """The store at path, or None if there is none (or it is an older version)."""
+        try:
+            with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != STORE_VERSION:
+            return None
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                   for name in COLUMNS}
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        return cls(path, manifest, columns, values)
+
+    def has_fresh_year(self, year: int, source_path: str) -> bool:
+        """True if `year` was ingested from source_path as it is on disk now."""
+        entry = self.manifest["years"].get(str(year))
+        if entry is None or entry["source"] != os.path.basename(source_path):
+            return False
+        stamp = _source_stamp(source_path)
+        return entry["source_size"] == stamp["size"] and entry["source_mtime"] == stamp["mtime"]
+
+    def catalog(self, year: int) -> YearCatalog:
+        entry = self.manifest["years"][str(year)]
+        return YearCatalog(year, dict(entry["zones"]), dict(entry["dates"]))
+
+    def year_rows(self, year: int) -> Dict[str, np.ndarray]:
+        """Column views (no copy) of one year's rows, in table order."""
+        start, stop = self.manifest["years"][str(year)]["rows"]
+        return {name: col[start:stop] for name, col in self.columns.items()}
+
+    def odds(self, codes: np.ndarray) -> np.ndarray:
+        return self.values[codes]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("db_dir", nargs="?", default=os.getenv("ODDS_DB_DIR"),
+                        help="folder with odds_YYYY.db files (default: $ODDS_DB_DIR)")
+    parser.add_argument("--out", help=f"store folder (default: DB_DIR/{STORE_DIRNAME})")
+    parser.add_argument("--years", type=int, nargs="*", help="only these data years")
+    args = parser.parse_args(argv)
+    if not args.db_dir:
+        parser.error("db_dir is required when ODDS_DB_DIR is not set")
+
+    start = time.perf_counter()
+    out = build_store(args.db_dir, args.out, args.years)
+    store = OddsStore.open(out)
+    size = sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out))
+    print(f"wrote {out} in {time.perf_counter() - start:.2f}s: "
+          f"{len(store.columns['year'])} rows, {len(store.manifest['years'])} years, "
+          f"{len(store.zones)} zones, {size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Build indexed, read-only copies of the odds_YYYY.db files.
+
+    python -m app.optimize_odds_db [DB_DIR] [--years 2020 2021] [--page-size 4096]
+
+For every odds_YYYY.db in DB_DIR (default: $ODDS_DB_DIR) this writes
+odds_YYYY.opt.db next to it with covering indexes for the engine's lookups,
+ANALYZE statistics, journal_mode=DELETE and the requested page size. The
+engine reads the .opt.db copy whenever it is at least as new as the
+original. A before/after query plan and timing report is printed for every
+query shape in odds_engine.
+"""
+import argparse
+import os
+import sqlite3
+import time
+from typing import Callable, List, Optional, Tuple
+
+from .odds_catalog import YearCatalog
+from .odds_engine import (
+    EstC2Odds, EstC3Odds, OddsContext, checkexact, coreodds1, fetchCore1,
+)
+from .odds_files import ODDS_DB_PATTERN, connect_odds_db, optimized_path
+
+# checkexact and fetchCore1 order their rows by rowid, and EstC2Odds /
+# EstC3Odds put the rows they pick from in the un-indexed join's order, so covering
+# indexes with avgodds in the key don't change which row the engine picks.
+INDEXES = [
+    # checkexact (every choice number), fetchCore1/coreodds1
+    ("idx_wins_choice",
+     "wins (choicenum, zoneid1, dateid1, zoneid2, dateid2, zoneid3, dateid3)"),
+    # EstC2Odds/EstC3Odds: 1st-choice odds of a zone/date
+    ("idx_wins_first_odds",
+     "wins (choicenum, zoneid1, dateid1, avgodds)"),
+    # EstC2Odds/EstC3Odds: C1/C2 rows by 2nd choice zone/date
+    ("idx_wins_second",
+     "wins (choicenum, zoneid2, dateid2, zoneid1, dateid1, avgodds)"),
+    # EstC3Odds: C1/C2/C3 rows by 3rd choice zone/date
+    ("idx_wins_third",
+     "wins (zoneid3, dateid3, zoneid1, dateid1, zoneid2, dateid2, avgodds)"),
+]
+
+
+def build_optimized(src: str, dst: str, page_size: int = 4096) -> None:
+    """Write an indexed, analyzed, vacuumed copy of src to dst."""
+    tmp = dst + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    conn = sqlite3.connect(src)
+    try:
+        conn.execute("VACUUM INTO ?", (tmp,))
+    finally:
+        conn.close()
+
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute(f"PRAGMA page_size={int(page_size)}")
+        for name, spec in INDEXES:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {spec}")
+        conn.execute("ANALYZE")
+        conn.commit()
+        # Rewrites the file with the new page size and packed indexes
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(tmp, dst)
+
+
+class _Recorder:
+    """Captures the SQL statements the engine runs (with bound values)."""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    def __call__(self, sql: str) -> None:
+        if sql.lstrip().upper().startswith("SELECT"):
+            self.statements.append(sql)
+
+
+def _query_shapes(catalog: YearCatalog, cur: sqlite3.Cursor
+                  ) -> List[Tuple[str, Callable[[OddsContext], object]]]:
+    """One representative call for every query shape in odds_engine."""
+    core = catalog.corezoneid
+    # Prefer a zone/date with several C1 rows, where row order matters
+    cur.execute('''SELECT zoneid1, dateid1 FROM wins
+                WHERE choicenum = 1 AND zoneid1 != ?
+                GROUP BY zoneid1, dateid1
+                ORDER BY count(*) DESC LIMIT 1''', (core,))
+    z, d = cur.fetchone()
+    cur.execute('''SELECT zoneid1, dateid1, groupsize1, zoneid2, dateid2, groupsize2
+                FROM wins WHERE choicenum = 2 LIMIT 1''')
+    c2 = cur.fetchone()
+    cur.execute('''SELECT zoneid1, dateid1, groupsize1, zoneid2, dateid2, groupsize2,
+                zoneid3, dateid3, groupsize3
+                FROM wins WHERE choicenum = 3 LIMIT 1''')
+    c3 = cur.fetchone()
+    cur.execute('''SELECT dateid1 FROM wins
+                WHERE choicenum = 1 AND zoneid1 = ? LIMIT 1''', (core,))
+    core_date = cur.fetchone()[0]
+
+    return [
+        ("checkexact C1 core", lambda ctx: checkexact(ctx, 1, core, core_date, 4, 0, 0, 0, 0, 0, 0)),
+        ("checkexact C1", lambda ctx: checkexact(ctx, 1, z, d, 2, 0, 0, 0, 0, 0, 0)),
+        ("checkexact C2", lambda ctx: checkexact(ctx, 2, *c2, 0, 0, 0)),
+        ("checkexact C3", lambda ctx: checkexact(ctx, 3, *c3)),
+        ("fetchCore1", lambda ctx: fetchCore1(ctx, core_date, 4)),
+        ("coreodds1", lambda ctx: coreodds1(ctx, core_date, 3)),
+        ("EstC2Odds", lambda ctx: EstC2Odds(ctx, 0.05, 0.02)),
+        ("EstC3Odds", lambda ctx: EstC3Odds(ctx, 0.05, 0.01, 0.02)),
+    ]
+
+
+def _run_shape(path: str, corezoneid: Optional[int], fn, repeat: int):
+    conn = connect_odds_db(path)
+    try:
+        recorder = _Recorder()
+        conn.set_trace_callback(recorder)
+        ctx = OddsContext(cur=conn.cursor(), corezoneid=corezoneid)
+        result = fn(ctx)
+        conn.set_trace_callback(None)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(ctx)
+        elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+
+        # Widening passes re-run one statement with new bounds; show each plan once
+        plans = {}
+        for sql in recorder.statements:
+            plan = tuple(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+            plans.setdefault(plan, None)
+        return result, elapsed_ms, list(plans)
+    finally:
+        conn.close()
+
+
+def report(src: str, dst: str, repeat: int = 3) -> None:
+    """Print before/after query plans and timings for each engine query shape."""
+    conn = sqlite3.connect(src)
+    try:
+        cur = conn.cursor()
+        year = int(ODDS_DB_PATTERN.match(os.path.basename(src)).group(1))
+        catalog = YearCatalog.load(year, cur)
+        shapes = _query_shapes(catalog, cur)
+    finally:
+        conn.close()
+
+    print(f"== {os.path.basename(src)} -> {os.path.basename(dst)}")
+    for name, fn in shapes:
+        # The un-indexed joins take seconds each; time them once
+        n = 1 if name.startswith("Est") else repeat
+        before, before_ms, before_plans = _run_shape(src, catalog.corezoneid, fn, n)
+        after, after_ms, after_plans = _run_shape(dst, catalog.corezoneid, fn, n)
+        same = "same result" if before == after else f"RESULT CHANGED: {before!r} -> {after!r}"
+        print(f"-- {name}: {before_ms:.2f} ms -> {after_ms:.2f} ms ({same})")
+        for label, plans in (("before", before_plans), ("after", after_plans)):
+            for plan in plans:
+                print(f"   {label}: " + " | ".join(plan))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("db_dir", nargs="?", default=os.getenv("ODDS_DB_DIR"),
+                        help="folder with odds_YYYY.db files (default: $ODDS_DB_DIR)")
+    parser.add_argument("--years", type=int, nargs="*", help="only these data years")
+    parser.add_argument("--page-size", type=int, default=4096)
+    parser.add_argument("--no-report", action="store_true",
+                        help="skip the before/after query plan report")
+    args = parser.parse_args(argv)
+    if not args.db_dir:
+        parser.error("db_dir is required when ODDS_DB_DIR is not set")
+
+    for name in sorted(os.listdir(args.db_dir)):
+        m = ODDS_DB_PATTERN.match(name)
+        if not m or (args.years and int(m.group(1)) not in args.years):
+            continue
+        src = os.path.join(args.db_dir, name)
+        dst = optimized_path(src)
+        start = time.perf_counter()
+        build_optimized(src, dst, page_size=args.page_size)
+        print(f"wrote {dst} in {time.perf_counter() - start:.2f}s")
+        if not args.no_report:
+            report(src, dst)
+
+
+if __name__ == "__main__":
+    main()
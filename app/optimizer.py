@@ -0,0 +1,295 @@
+"""
+Search for the best ordered set of up to three choices.
+
+Given allowed zones, a window of permit dates and a group size, every
+(zone, date) pair is a candidate choice. A set's score is its chance of
+winning with any choice, averaged over the loaded data years: for each year
+the sequential odds of its choices summed (choice 2 given choice 1, choice 3
+given choices 1 and 2, exactly as /estimate_odds computes them in
+sequential mode) and capped at 1, as in the frontend's totals row. Adding a
+choice never lowers that, so sets of the largest allowed size are searched.
+
+The search is a depth-first branch and bound over choice 1, 2, 3 using the
+in-memory YearOdds and ChoiceSetMatcher of each year. Before a choice is
+fixed its odds are bounded from above: first-choice odds are exact, and the
+conditional odds of a choice in position 2 or 3 can be no higher than the
+best exact historical set with that choice there, or than anything the
+EstC2Odds/EstC3Odds window search could return for its first-choice odds
+(ChoiceSetMatcher.c2_upper_bound/c3_upper_bound). Branches whose bound
+cannot beat the current k-th best set are skipped, and the most promising
+branches are tried first, so if the time budget runs out the sets found so
+far are still good ones ("complete" tells whether the search finished).
+"""
+import datetime as dt
+import heapq
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .choice_match import matcher_for
+from .odds_engine import Choice, _choice_ids, first_choice_odds
+from .year_fanout import NOT_LOADED
+
+# Candidate choices (zones x dates) a single search may consider
+MAX_CANDIDATES = 2000
+
+_maxima_lock = threading.Lock()
+
+
+def _exact_maxima(year_odds) -> Tuple[Dict[Tuple[int, int], float], Dict[Tuple[int, int], float]]:
+    """
+    Highest odds of any historical choice set with (zone id, date id) as its
+    second / third choice, computed once per YearOdds.
+    """
+    maxima = getattr(year_odds, "_exact_maxima", None)
+    if maxima is None:
+        with _maxima_lock:
+            maxima = getattr(year_odds, "_exact_maxima", None)
+            if maxima is None:
+                second: Dict[Tuple[int, int], float] = {}
+                third: Dict[Tuple[int, int], float] = {}
+                for key, rows in year_odds.wins.items():
+                    if key[0] == 2:
+                        best, pick = second, key[3:5]
+                    elif key[0] == 3:
+                        best, pick = third, key[5:7]
+                    else:
+                        continue
+                    odds = max(row[3] for row in rows)
+                    if odds > best.get(pick, -1.0):
+                        best[pick] = odds
+                maxima = year_odds._exact_maxima = (second, third)
+    return maxima
+
+
+class _Year:
+    """One data year's odds for every candidate, with memoized estimates."""
+
+    def __init__(self, year_odds, catalog, dyear: int, permit_year: int, candidates: List[Choice]):
+        self.year_odds = year_odds
+        self.matcher = matcher_for(year_odds)
+        self.ids = [_choice_ids(catalog, dyear, permit_year, c) for c in candidates]
+        self.first: List[float] = []
+        self.comp_dates: List[Optional[str]] = []
+        for c in candidates:
+            odds: Dict[int, float] = {}
+            comp_dates: Dict[int, Optional[str]] = {}
+            first_choice_odds(year_odds, catalog, dyear, permit_year, c, odds, comp_dates)
+            self.first.append(odds[dyear])
+            self.comp_dates.append(comp_dates.get(dyear))
+
+        second, third = _exact_maxima(year_odds)
+        self.bound2 = np.zeros(len(candidates))
+        self.bound3 = np.zeros(len(candidates))
+        self.exact2 = np.zeros(len(candidates))
+        self.exact3 = np.zeros(len(candidates))
+        for i, ids in enumerate(self.ids):
+            if ids is None:
+                # conditional_odds gives such a choice 0 in positions 2 and 3
+                continue
+            f = self.first[i]
+            self.exact2[i] = second.get(ids[:2], 0.0)
+            self.exact3[i] = third.get(ids[:2], 0.0)
+            self.bound2[i] = max(self.exact2[i], self.matcher.c2_upper_bound(f))
+            self.bound3[i] = max(self.exact3[i], self.matcher.c3_upper_bound(f))
+        self._est2: Dict[Tuple[float, float], float] = {}
+        self._est3: Dict[Tuple[float, float, float], float] = {}
+
+    def _estimate(self, memo, key, fn) -> float:
+        value = memo.get(key)
+        if value is None:
+            try:
+                value = float(fn(*key))
+            except Exception:
+                # As in conditional_odds: no comparable sets means 0 for the year
+                value = 0.0
+            memo[key] = value
+        return value
+
+    def second(self, a: int, b: int, p1: float) -> float:
+        """Odds of candidate b as choice 2 after candidate a; conditional_odds' value."""
+        if self.ids[b] is None:
+            return 0.0
+        if self.ids[a] is not None:
+            r = self.year_odds.checkexact(2, *self.ids[a], *self.ids[b], 0, 0, 0)
+            if len(r) == 1:
+                return float(r[0][0])
+        return self._estimate(self._est2, (self.first[b], p1), self.year_odds.EstC2Odds)
+
+    def third(self, a: int, b: int, c: int, p1: float, p2: float) -> float:
+        """Odds of candidate c as choice 3 after a and b; conditional_odds' value."""
+        if self.ids[c] is None:
+            return 0.0
+        if self.ids[a] is not None and self.ids[b] is not None:
+            r = self.year_odds.checkexact(3, *self.ids[a], *self.ids[b], *self.ids[c])
+            if len(r) == 1:
+                return float(r[0][0])
+        return self._estimate(self._est3, (self.first[c], p2, p1), self.year_odds.EstC3Odds)
+
+
+def _score(totals: np.ndarray) -> float:
+    return float(np.minimum(totals, 1.0).mean())
+
+
+def season_window(permit_year: int, start: Tuple[int, int], end: Tuple[int, int]) -> List[dt.date]:
+    """Permit-year dates from (month, day) start to end, inclusive."""
+    first = dt.date(permit_year, *start)
+    last = dt.date(permit_year, *end)
+    return [first + dt.timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+def optimize(
+    index,
+    zones: Sequence[str],
+    dates: Sequence[dt.date],
+    group_size: int,
+    permit_year: int,
+    data_years: List[int],
+    max_choices: int = 3,
+    top_k: int = 5,
+    time_budget_s: float = 2.0,
+) -> Dict[str, Any]:
+    """
+    The top_k highest-scoring ordered sets of min(max_choices, candidates)
+    distinct choices from zones x dates. Raises UnknownZoneError for a zone
+    in no loaded data year and ValueError if there are more than
+    MAX_CANDIDATES candidates.
+    """
+    started = time.perf_counter()
+    for zone in zones:
+        index.catalog.check_zone(zone, data_years)
+    candidates = [Choice(zone, d.month, d.day, group_size) for zone in dict.fromkeys(zones)
+                  for d in dates]
+    if len(candidates) > MAX_CANDIDATES:
+        raise ValueError(f"{len(candidates)} candidate choices; at most {MAX_CANDIDATES} "
+                         f"(zones x dates) can be searched at once")
+
+    loaded = [dyear for dyear in data_years if index.year(dyear) is not None]
+    years = [_Year(index.year(dyear), index.catalog, dyear, permit_year, candidates)
+             for dyear in loaded]
+    size = min(max_choices, len(candidates))
+    # The budget is for the search; building a year's matcher on first use is not counted
+    deadline = time.perf_counter() + time_budget_s
+
+    first = np.array([y.first for y in years]).reshape(len(years), len(candidates))
+    bound2 = np.array([y.bound2 for y in years]).reshape(first.shape)
+    bound3 = np.array([y.bound3 for y in years]).reshape(first.shape)
+    exact2 = np.array([y.exact2 for y in years]).reshape(first.shape)
+    exact3 = np.array([y.exact3 for y in years]).reshape(first.shape)
+    best2 = bound2.max(axis=1, initial=0.0) if size >= 2 else np.zeros(len(years))
+    best3 = bound3.max(axis=1, initial=0.0) if size >= 3 else np.zeros(len(years))
+
+    # Min-heap of (score, -found order, picks, per-year odds per choice)
+    best: List[Tuple[float, int, Tuple[int, ...], List[np.ndarray]]] = []
+    found = 0
+    complete = True
+
+    def threshold() -> float:
+        return best[0][0] if len(best) >= top_k else -1.0
+
+    def record(picks: Tuple[int, ...], odds: List[np.ndarray]) -> None:
+        nonlocal found
+        found += 1
+        entry = (_score(sum(odds)), -found, picks, odds)
+        if len(best) < top_k:
+            heapq.heappush(best, entry)
+        elif entry[:2] > best[0][:2]:
+            heapq.heapreplace(best, entry)
+
+    def out_of_time() -> bool:
+        nonlocal complete
+        # Always finish at least one set
+        if found and time.perf_counter() > deadline:
+            complete = False
+        return not complete
+
+    if years and top_k > 0 and size > 0:
+        # Try likely choices first (high first-choice odds, or a high exact
+        # historical set with the choice in that position), so good sets turn
+        # up early and raise the bar for the rest
+        order = np.argsort(-first.mean(axis=0), kind="stable")
+        order2 = np.argsort(-np.maximum(first, exact2).mean(axis=0), kind="stable")
+        order3 = np.argsort(-np.maximum(first, exact3).mean(axis=0), kind="stable")
+        bounds1 = np.minimum(first + (best2 + best3)[:, None], 1.0).mean(axis=0)
+        for a in order[bounds1[order] > threshold()].tolist():
+            if bounds1[a] <= threshold():
+                continue
+            if out_of_time():
+                break
+            p1 = first[:, a]
+            if size == 1:
+                record((a,), [p1])
+                continue
+
+            bounds2 = np.minimum(p1[:, None] + bound2 + best3[:, None], 1.0).mean(axis=0)
+            bounds2[a] = -1.0
+            for b in order2[bounds2[order2] > threshold()].tolist():
+                if bounds2[b] <= threshold():
+                    continue
+                if out_of_time():
+                    break
+                p2 = np.array([y.second(a, b, p1[i]) for i, y in enumerate(years)])
+                if size == 2:
+                    record((a, b), [p1, p2])
+                    continue
+                if _score(p1 + p2 + best3) <= threshold():
+                    continue
+
+                bounds3 = np.minimum((p1 + p2)[:, None] + bound3, 1.0).mean(axis=0)
+                bounds3[[a, b]] = -1.0
+                for c in order3[bounds3[order3] > threshold()].tolist():
+                    if bounds3[c] <= threshold():
+                        continue
+                    if out_of_time():
+                        break
+                    p3 = np.array([y.third(a, b, c, p1[i], p2[i]) for i, y in enumerate(years)])
+                    record((a, b, c), [p1, p2, p3])
+                if not complete:
+                    break
+            if not complete:
+                break
+
+    sets = []
+    for rank, (score, _, picks, odds) in enumerate(sorted(best, reverse=True), start=1):
+        totals = np.minimum(sum(odds), 1.0)
+        choices = []
+        for position, (pick, choice_odds) in enumerate(zip(picks, odds), start=1):
+            c = candidates[pick]
+            by_year = dict(zip(loaded, choice_odds.tolist()))
+            choices.append({
+                "index": position,
+                "zone": c.zone,
+                "month": c.month,
+                "day": c.day,
+                "group_size": c.group_size,
+                "display_date": f"{c.month:02d}-{c.day:02d}-{permit_year}",
+                "odds_by_year": {dyear: by_year.get(dyear, 0.0) for dyear in data_years},
+                "first_choice_odds_by_year": {
+                    dyear: years[loaded.index(dyear)].first[pick] if dyear in by_year else 0.0
+                    for dyear in data_years},
+                "comp_dates_by_year": {
+                    dyear: years[loaded.index(dyear)].comp_dates[pick] if dyear in by_year else None
+                    for dyear in data_years},
+            })
+        sets.append({
+            "rank": rank,
+            "combined_odds": score,
+            "combined_odds_by_year": dict(zip(loaded, totals.tolist())),
+            "choices": choices,
+        })
+
+    return {
+        "permit_year": permit_year,
+        "years": data_years,
+        "group_size": group_size,
+        "sets": sets,
+        "search": {
+            "candidates": len(candidates),
+            "sets_evaluated": found,
+            "complete": complete,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+        "partial_years": {dyear: NOT_LOADED for dyear in data_years if dyear not in loaded},
+    }
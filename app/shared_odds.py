@@ -0,0 +1,364 @@
+"""
+Odds tables in shared memory, loaded once and attached by every worker.
+
+    python -m app.shared_odds [DB_DIR] [--pointer PATH] [--poll 30]
+                              [-- uvicorn app.main:app --workers 8]
+
+The publisher (this command) loads every data year with OddsIndex, builds
+each year's ChoiceSetMatcher, and copies the wins rows plus the matcher's
+candidate arrays into one multiprocessing.shared_memory segment. It then
+writes a small JSON pointer file naming the segment, the layout of its
+arrays and each year's zone/date tables. A command after `--` is started
+as its child with ODDS_SHARED_POINTER set; app.main then serves odds from
+a SharedOddsIndex, whose years are zero-copy, read-only NumPy views of the
+segment. Per-worker memory therefore stays flat as workers are added: the
+matcher arrays, by far the largest part, are never built in the workers.
+
+Every --poll seconds the publisher re-scans DB_DIR. When a year changes it
+publishes a new segment, swaps the pointer file with os.replace and
+unlinks the previous segment. Workers check the pointer at most once per
+second and attach the new generation in one assignment. Requests already
+running keep the old mapping until they finish.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .choice_match import ChoiceSetMatcher, matcher_for
+from .odds_catalog import OddsCatalog, YearCatalog
+from .odds_index import KEY_WIDTH, OddsIndex, YearOdds
+
+POINTER_NAME = "odds_shared.json"
+LAYOUT_VERSION = 1
+ALIGN = 64
+
+
+def pointer_path(db_dir: str) -> str:
+    return os.path.join(db_dir, POINTER_NAME)
+
+
+def _bits(zbits: int, dbits: int) -> List[int]:
+    """Bit widths of (choicenum, zone1, date1, zone2, date2, zone3, date3) in a packed key."""
+    return [2, zbits, dbits, zbits, dbits, zbits, dbits]
+
+
+def _pack(key: Sequence[int], bits: List[int]) -> int:
+    """A wins key tuple (any KEY_WIDTH prefix) as one int; missing fields are 0."""
+    packed = 0
+    for i, b in enumerate(bits):
+        packed = (packed << b) | (key[i] if i < len(key) else 0)
+    return packed
+
+
+def _unpack(packed: int, bits: List[int]) -> Tuple[int, ...]:
+    fields = []
+    for b in reversed(bits):
+        fields.append(packed & ((1 << b) - 1))
+        packed >>= b
+    fields.reverse()
+    return tuple(fields[:KEY_WIDTH.get(fields[0], 7)])
+
+
+class _SharedWins(Mapping):
+    """
+    Read-only YearOdds.wins over packed, sorted key and row arrays. Rows of
+    one key stay in table order (the sort is stable), so lookups return the
+    same lists as the dict they were exported from.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], bits: List[int]):
+        self._key = arrays["key"]
+        self._g1, self._g2, self._g3 = arrays["g1"], arrays["g2"], arrays["g3"]
+        self._odds = arrays["odds"]
+        self._bits = bits
+        self._len: Optional[int] = None
+
+    def get(self, key, default=None):
+        if any(v < 0 or v >> b for v, b in zip(key, self._bits)):
+            return default
+        packed = _pack(key, self._bits)
+        lo = int(np.searchsorted(self._key, packed, side="left"))
+        hi = int(np.searchsorted(self._key, packed, side="right"))
+        if lo == hi:
+            return default
+        return list(zip(self._g1[lo:hi].tolist(), self._g2[lo:hi].tolist(),
+                        self._g3[lo:hi].tolist(), self._odds[lo:hi].tolist()))
+
+    def __getitem__(self, key):
+        rows = self.get(key)
+        if rows is None:
+            raise KeyError(key)
+        return rows
+
+    def __iter__(self) -> Iterator[Tuple[int, ...]]:
+        for packed in np.unique(self._key).tolist():
+            yield _unpack(packed, self._bits)
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = len(np.unique(self._key))
+        return self._len
+
+
+def export_year(year_odds: YearOdds) -> Tuple[Dict[str, np.ndarray], dict]:
+    """(arrays, manifest entry) for one loaded year, matcher included."""
+    keys: List[Tuple[int, ...]] = []
+    rows: List[Tuple[int, int, int, float]] = []
+    for key, group in year_odds.wins.items():
+        keys.extend([key] * len(group))
+        rows.extend(group)
+
+    catalog = year_odds.catalog
+    # Wide enough for every id a lookup can ask for, not just the ones in wins
+    zone_ids = [z for k in keys for z in k[1::2]] + list(catalog.zones.values())
+    date_ids = [d for k in keys for d in k[2::2]] + list(catalog.dates.values())
+    zbits = max(zone_ids + [1]).bit_length()
+    dbits = max(date_ids + [1]).bit_length()
+    bits = _bits(zbits, dbits)
+    if sum(bits) > 63:
+        raise ValueError(f"{year_odds.year}: zone/date ids too large to pack into an int64 key")
+
+    packed = np.array([_pack(k, bits) for k in keys], dtype=np.int64)
+    order = np.argsort(packed, kind="stable")
+    cols = np.array(rows, dtype=np.float64).reshape(-1, 4)[order]
+    arrays = {
+        "wins/key": packed[order],
+        "wins/g1": cols[:, 0].astype(np.int8),
+        "wins/g2": cols[:, 1].astype(np.int8),
+        "wins/g3": cols[:, 2].astype(np.int8),
+        "wins/odds": cols[:, 3],
+    }
+    arrays.update((f"matcher/{k}", a) for k, a in matcher_for(year_odds).arrays().items())
+    meta = {
+        "path": year_odds.path,
+        "mtime": year_odds.mtime,
+        "zones": catalog.zones,
+        "dates": catalog.dates,
+        "zbits": zbits,
+        "dbits": dbits,
+    }
+    return arrays, meta
+
+
+class _Segment:
+    """An attached segment; closed once nothing refers to this generation any more."""
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+
+    def __del__(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # Arrays still in use keep the mapping alive until they are freed
+            self.shm._buf = self.shm._mmap = None
+
+
+class SharedYearOdds(YearOdds):
+    """YearOdds whose wins rows and ChoiceSetMatcher are views of a shared segment."""
+
+    def __init__(self, year: int, meta: dict, arrays: Dict[str, np.ndarray], segment: _Segment):
+        catalog = YearCatalog(year, dict(meta["zones"]), dict(meta["dates"]))
+        wins = _SharedWins({k[len("wins/"):]: a for k, a in arrays.items() if k.startswith("wins/")},
+                           _bits(meta["zbits"], meta["dbits"]))
+        super().__init__(year, meta["path"], meta["mtime"], catalog, wins)
+        self._matcher = ChoiceSetMatcher.from_arrays(
+            {k[len("matcher/"):]: a for k, a in arrays.items() if k.startswith("matcher/")})
+        self._segment = segment
+
+
+def publish(index: OddsIndex, pointer: str, generation: int) -> shared_memory.SharedMemory:
+    """Copy every loaded year into a new segment and point `pointer` at it."""
+    layout: Dict[str, list] = {}
+    years: Dict[str, dict] = {}
+    parts: List[Tuple[int, np.ndarray]] = []
+    offset = 0
+    for dyear in index.years:
+        arrays, meta = export_year(index.year(dyear))
+        years[str(dyear)] = meta
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a)
+            layout[f"{dyear}/{name}"] = [offset, a.dtype.str, list(a.shape)]
+            parts.append((offset, a))
+            offset += -(-a.nbytes // ALIGN) * ALIGN
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1),
+                                     name=f"odds_{os.getpid()}_{generation}")
+    for start, a in parts:
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf, offset=start)[...] = a
+
+    doc = {"version": LAYOUT_VERSION, "generation": generation, "segment": shm.name,
+           "size": shm.size, "arrays": layout, "years": years}
+    tmp = pointer + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f)
+    os.replace(tmp, pointer)
+    return shm
+
+
+def attach(pointer: str) -> Tuple[int, Dict[int, SharedYearOdds]]:
+    """(generation, {year: SharedYearOdds}) for the segment `pointer` names now."""
+    for attempt in range(3):
+        with open(pointer, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        if doc.get("version") != LAYOUT_VERSION:
+            raise RuntimeError(f"{pointer}: unsupported shared odds layout {doc.get('version')}")
+        try:
+            shm = shared_memory.SharedMemory(name=doc["segment"])
+            break
+        except FileNotFoundError:
+            # Swapped between reading the pointer and attaching; read it again
+            if attempt == 2:
+                raise
+            time.sleep(0.05)
+    # Attaching registers the segment with this process's resource tracker,
+    # which would unlink it when the worker exits; the publisher owns it
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+    segment = _Segment(shm)
+    by_year: Dict[str, Dict[str, np.ndarray]] = {}
+    for name, (offset, dtype, shape) in doc["arrays"].items():
+        dyear, _, rest = name.partition("/")
+        a = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        a.flags.writeable = False
+        by_year.setdefault(dyear, {})[rest] = a
+    years = {int(y): SharedYearOdds(int(y), meta, by_year.get(y, {}), segment)
+             for y, meta in doc["years"].items()}
+    return doc["generation"], years
+
+
+class SharedOddsIndex:
+    """
+    Worker-side stand-in for OddsIndex, reading the publisher's segment.
+    Picks up a newly published generation within check_s seconds.
+    """
+
+    def __init__(self, pointer: str, check_s: float = 1.0):
+        self.pointer = pointer
+        self.check_s = check_s
+        self.generation: Optional[int] = None
+        self._years: Dict[int, SharedYearOdds] = {}
+        self.catalog = OddsCatalog({})
+        self._lock = threading.Lock()
+        self._stamp: Optional[int] = None
+        self._next_check = 0.0
+
+    def reload(self, workers: int = 1) -> List[int]:
+        """Attach the current generation; returns the years whose data changed."""
+        with self._lock:
+            self._stamp = os.stat(self.pointer).st_mtime_ns
+            self._next_check = time.monotonic() + self.check_s
+            generation, years = attach(self.pointer)
+            changed = [y for y, yo in years.items()
+                       if y not in self._years
+                       or (self._years[y].path, self._years[y].mtime) != (yo.path, yo.mtime)]
+            # Swap in one assignment so readers never see a half-attached index
+            self._years = years
+            self.catalog = OddsCatalog({y: yo.catalog for y, yo in years.items()})
+            self.generation = generation
+            return changed
+
+    def _refresh(self) -> None:
+        if time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_s
+        try:
+            stamp = os.stat(self.pointer).st_mtime_ns
+        except OSError:
+            return
+        if stamp != self._stamp:
+            self.reload()
+
+    def year(self, dyear: int) -> Optional[YearOdds]:
+        self._refresh()
+        return self._years.get(dyear)
+
+    @property
+    def years(self) -> List[int]:
+        return sorted(self._years)
+
+
+def _build(index: OddsIndex) -> None:
+    for dyear in index.years:
+        matcher_for(index.year(dyear))
+
+
+def _drop_matchers(index: OddsIndex) -> None:
+    # The published copy is the one that is used; free the private one
+    for dyear in index.years:
+        index.year(dyear).__dict__.pop("_matcher", None)
+
+
+def main(argv=None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    command: List[str] = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, command = argv[:i], argv[i + 1:]
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("db_dir", nargs="?", default=os.getenv("ODDS_DB_DIR"),
+                        help="folder with odds_YYYY.db files (default: $ODDS_DB_DIR)")
+    parser.add_argument("--pointer", help=f"pointer file (default: DB_DIR/{POINTER_NAME})")
+    parser.add_argument("--poll", type=float, default=30.0,
+                        help="seconds between re-scans of DB_DIR for changed years")
+    args = parser.parse_args(argv)
+    if not args.db_dir:
+        parser.error("db_dir is required when ODDS_DB_DIR is not set")
+    pointer = os.path.abspath(args.pointer or pointer_path(args.db_dir))
+
+    start = time.perf_counter()
+    index = OddsIndex(args.db_dir, load=False)
+    index.reload(workers=4)
+    _build(index)
+    generation = 1
+    shm = publish(index, pointer, generation)
+    _drop_matchers(index)
+    print(f"published {index.years} to {shm.name} ({shm.size / 1e6:.1f} MB) "
+          f"in {time.perf_counter() - start:.1f}s; pointer {pointer}", flush=True)
+
+    child = None
+    if command:
+        child = subprocess.Popen(command, env=dict(os.environ, ODDS_SHARED_POINTER=pointer))
+    next_scan = time.monotonic() + args.poll
+    try:
+        while child is None or child.poll() is None:
+            time.sleep(min(1.0, args.poll))
+            if time.monotonic() < next_scan:
+                continue
+            next_scan = time.monotonic() + args.poll
+            if not index.reload(workers=4):
+                continue
+            _build(index)
+            generation += 1
+            old, shm = shm, publish(index, pointer, generation)
+            _drop_matchers(index)
+            old.close()
+            old.unlink()
+            print(f"published generation {generation}: {index.years} to {shm.name}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if child is not None and child.poll() is None:
+            child.terminate()
+            child.wait()
+        shm.close()
+        shm.unlink()
+        try:
+            os.remove(pointer)
+        except OSError:
+            pass
+    return child.returncode if child is not None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+Near a lottery deadline many users ask for the same popular choice set
+within the same second. SingleFlight.do(key, fn) runs fn() for the first
+request with a given key (the leader); requests with the same key that
+arrive while it is running (followers) wait for that result instead of
+running their own copy. Only the computation is shared: each request
+carries on with its own response and analytics row afterwards.
+
+The computation runs as its own task, so a leader whose client goes away
+does not cancel it for the followers. Everything happens on the event
+loop, so the in-flight table needs no lock.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from .metrics import REGISTRY
+
+SINGLE_FLIGHT = REGISTRY.counter(
+    "odds_single_flight_requests_total",
+    "Requests that ran a computation (leader) or shared one already in flight (follower)")
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    # Mark the exception retrieved even if every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """fn()'s result, shared with every other caller passing the same key meanwhile."""
+        task = self._calls.get(key)
+        if task is None:
+            SINGLE_FLIGHT.inc(name=self.name, role="leader")
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            task.add_done_callback(_retrieve)
+        else:
+            SINGLE_FLIGHT.inc(name=self.name, role="follower")
+        return await asyncio.shield(task)
+
+    def inflight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,88 @@
+"""
+Background warm-up run by the app's lifespan handler, reported by GET /ready.
+
+The server starts accepting connections right away; the odds data is loaded
+on a separate thread, and endpoints that need it wait for it (see
+main.require_odds). Each step's duration and the total cold-start time are
+kept for /ready and /metrics.
+"""
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+PENDING = "pending"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+class Warmup:
+    """Runs named steps in order on one thread and records how long each took."""
+
+    def __init__(self, budget_s: float):
+        self.budget_s = budget_s
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.steps: Dict[str, float] = {}
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, steps: List[Tuple[str, Callable[[], object]]],
+              started: Optional[float] = None) -> None:
+        """Run steps in the background; `started` (perf_counter) backdates the clock."""
+        self._started = started if started is not None else time.perf_counter()
+        self.state = WARMING
+        self._thread = threading.Thread(target=self._run, args=(steps,), name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self, steps) -> None:
+        try:
+            for name, step in steps:
+                t = time.perf_counter()
+                step()
+                self.steps[name] = round(time.perf_counter() - t, 4)
+            self.state = READY
+        except Exception:
+            self.error = traceback.format_exc(limit=3)
+            self.state = FAILED
+        finally:
+            self._finished = time.perf_counter()
+            self._done.set()
+            if self.state == READY and self.over_budget:
+                print(f"Warm-up took {self.startup_s:.2f}s, over the {self.budget_s:.2f}s budget")
+            elif self.state == FAILED:
+                print("Warm-up failed:", self.error)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """True once warm-up has finished successfully."""
+        self._done.wait(timeout)
+        return self.state == READY
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    @property
+    def startup_s(self) -> Optional[float]:
+        """Seconds from process start-up to the end of warm-up (so far, while warming)."""
+        if self._started is None:
+            return None
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return round(end - self._started, 4)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.startup_s is not None and self.startup_s > self.budget_s
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "status": self.state,
+            "startup_s": self.startup_s,
+            "budget_s": self.budget_s,
+            "over_budget": self.over_budget,
+            "steps": dict(self.steps),
+            "error": self.error,
+        }
@@ -0,0 +1,96 @@
+"""
+Bounded pool that runs one request's per-data-year odds work in parallel.
+
+estimate_odds_for_choice_set reads each data year from its own database or
+snapshot, independently of the others, so the years of a request are looked
+up side by side and merged back in data_years order. Every year has a
+timeout: one slow, missing or failing year is reported back as unavailable
+(and flagged in the response's partial_years) instead of holding up or
+failing the whole response. As with EngineExecutor, a timed-out year's
+thread cannot be interrupted and finishes in the background.
+
+The pool is shared by all requests, so concurrent requests queue for it
+rather than multiplying threads; a year still queued when its timeout runs
+out is cancelled.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from .metrics import REGISTRY
+
+# partial_years reasons
+NOT_LOADED = "missing"  # no odds database loaded for the year
+TIMED_OUT = "timeout"   # not done within the per-year timeout
+FAILED = "error"      # the year's lookups raised
+UNKNOWN = "unknown"   # a choice's zone or date is not in the year's tables
+
+YEAR_PARTIAL = REGISTRY.counter(
+    "odds_year_partial_total", "Data years left out of an odds result, by reason")
+
+
+class YearFanout:
+    def __init__(self, workers: int, timeout_s: Optional[float]):
+        self.workers = workers
+        self.timeout_s = timeout_s
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="odds-year")
+            return self._pool
+
+    def run(self, years: Iterable[int], fn: Callable[[int], Any]
+            ) -> Tuple[Dict[int, Any], Dict[int, str]]:
+        """
+        fn(year) for every year. Returns ({year: result}, {year: reason}) with
+        each year in exactly one of the two.
+        """
+        years = list(years)
+        if self.workers <= 1 or len(years) <= 1:
+            return run_inline(years, fn)
+
+        pool = self._executor()
+        # Copy the context per year so spans still land in the request's timings
+        futures = {pool.submit(contextvars.copy_context().run, fn, dyear): dyear
+                   for dyear in years}
+        done, not_done = wait(futures, timeout=self.timeout_s)
+        results: Dict[int, Any] = {}
+        failed: Dict[int, str] = {}
+        for future in not_done:
+            future.cancel()
+            failed[futures[future]] = TIMED_OUT
+        for future in done:
+            dyear = futures[future]
+            if future.exception() is not None:
+                failed[dyear] = FAILED
+            else:
+                results[dyear] = future.result()
+        for reason in failed.values():
+            YEAR_PARTIAL.inc(reason=reason)
+        return results, failed
+
+    def shutdown(self) -> None:
+        """Stop the pool; the next run() starts a fresh one."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_inline(years: Iterable[int], fn: Callable[[int], Any]
+               ) -> Tuple[Dict[int, Any], Dict[int, str]]:
+    """YearFanout.run on the calling thread, one year after another, without a timeout."""
+    results: Dict[int, Any] = {}
+    failed: Dict[int, str] = {}
+    for dyear in years:
+        try:
+            results[dyear] = fn(dyear)
+        except Exception:
+            failed[dyear] = FAILED
+            YEAR_PARTIAL.inc(reason=FAILED)
+    return results, failed
@@ -0,0 +1,122 @@
+"""Timing, percentile and baseline helpers shared by the benchmark scripts."""
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def time_calls(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> List[float]:
+    """Wall-clock seconds of `repeat` calls of fn, after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples: List[float], wall_s: Optional[float] = None) -> Dict[str, float]:
+    """Latency percentiles in ms; throughput over wall_s (or the summed samples)."""
+    ms = np.asarray(samples) * 1000
+    total = wall_s if wall_s is not None else float(np.sum(samples))
+    return {
+        "n": len(samples),
+        "mean_ms": round(float(ms.mean()), 5),
+        "min_ms": round(float(ms.min()), 5),
+        "p50_ms": round(float(np.percentile(ms, 50)), 5),
+        "p95_ms": round(float(np.percentile(ms, 95)), 5),
+        "p99_ms": round(float(np.percentile(ms, 99)), 5),
+        "max_ms": round(float(ms.max()), 5),
+        "throughput_per_s": round(len(samples) / total, 2) if total > 0 else None,
+    }
+
+
+def print_table(results: Dict[str, Dict[str, float]]) -> None:
+    width = max(len(name) for name in results) if results else 10
+    print(f"{'benchmark':<{width}}  {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'per s':>10}")
+    for name, r in results.items():
+        print(f"{name:<{width}}  {r['n']:>6} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} "
+              f"{r['p99_ms']:>10.3f} {r['throughput_per_s'] or 0:>10.1f}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(BASELINE_DIR), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_baseline(path: str, suite: str, params: Dict[str, Any],
+                  results: Dict[str, Dict[str, float]]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    doc = {
+        "suite": suite,
+        "created_utc": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"saved baseline to {path}")
+
+
+def compare_baseline(path: str, results: Dict[str, Dict[str, float]],
+                     threshold: float = 0.25, metric: str = "p50_ms") -> bool:
+    """
+    Print current vs baseline `metric` per benchmark. Returns False if any
+    benchmark got slower by more than `threshold` (0.25 = 25%).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"compared with {path} (commit {baseline.get('commit')}, {metric}):")
+    ok = True
+    for name, r in results.items():
+        old = baseline["results"].get(name)
+        if old is None or not old.get(metric):
+            print(f"  {name}: new")
+            continue
+        ratio = r[metric] / old[metric]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            ok = False
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"  {name}: {old[metric]:.3f} -> {r[metric]:.3f} ms ({ratio:.2f}x){flag}")
+    return ok
+
+
+def add_baseline_args(parser, suite: str) -> None:
+    default = os.path.join(BASELINE_DIR, f"{suite}.json")
+    parser.add_argument("--save", nargs="?", const=default, metavar="PATH",
+                        help=f"write results as a JSON baseline (default: {default})")
+    parser.add_argument("--compare", nargs="?", const=default, metavar="PATH",
+                        help="compare with a saved baseline and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown before --compare fails (default 0.25 = 25%%)")
+
+
+def handle_baseline_args(args, suite: str, params: Dict[str, Any],
+                         results: Dict[str, Dict[str, float]]) -> int:
+    status = 0
+    if args.compare:
+        if not compare_baseline(args.compare, results, args.threshold):
+            status = 1
+    if args.save:
+        save_baseline(args.save, suite, params, results)
+    return status
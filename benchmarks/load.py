@@ -0,0 +1,128 @@
+"""
+In-process load driver for POST /estimate_odds.
+
+    python -m benchmarks.load [DB_DIR] [--requests 2000] [--concurrency 8]
+                              [--distinct 200] [--url http://127.0.0.1:8000]
+                              [--save [PATH]] [--compare [PATH]]
+
+By default the app is driven through FastAPI's TestClient in this process
+(ODDS_DB_DIR is set to DB_DIR before the app is imported); with --url the
+requests go to a running server instead, e.g. a local
+`uvicorn app.main:app`. Request bodies are drawn from a fixed pool of
+`--distinct` random choice sets, so a small pool measures the warm/cached
+path and a large one the cold path.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from .common import add_baseline_args, handle_baseline_args, print_table, summarize
+
+ZONES = ["Core", "Colchuck", "Eightmile", "Snow", "Stuart", "Eightmile(stock)", "Stuart(stock)"]
+
+
+def request_pool(distinct: int, data_years: List[int], zones: List[str], seed: int
+                 ) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    pool = []
+    for i in range(distinct):
+        pool.append({
+            "permit_year": 2025,
+            "data_years": data_years,
+            "choices": [
+                {
+                    "zone": rng.choice(zones),
+                    "month": rng.randint(5, 10),
+                    "day": rng.randint(1, 28),
+                    "group_size": rng.randint(1, 8),
+                }
+                for _ in range(rng.randint(1, 3))
+            ],
+            "session_id": f"bench-{seed}",
+            "query_index": i,
+        })
+    return pool
+
+
+def make_client(args):
+    if args.url:
+        import httpx
+        return httpx.Client(base_url=args.url, timeout=60)
+
+    os.environ["ODDS_DB_DIR"] = args.db_dir
+    from fastapi.testclient import TestClient
+    from app.main import app
+    client = TestClient(app)
+    # Run the app's lifespan (schema migration and odds warm-up)
+    client.__enter__()
+    return client
+
+
+def run(client, pool: List[Dict[str, Any]], n_requests: int, concurrency: int,
+        warmup: int, seed: int) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(seed + 1)
+    bodies = [rng.choice(pool) for _ in range(n_requests)]
+
+    for body in pool[:warmup]:
+        client.post("/estimate_odds", json=body)
+
+    errors = 0
+
+    def one(body):
+        nonlocal errors
+        start = time.perf_counter()
+        r = client.post("/estimate_odds", json=body)
+        elapsed = time.perf_counter() - start
+        if r.status_code != 200:
+            errors += 1
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool_exec:
+        samples = list(pool_exec.map(one, bodies))
+    wall = time.perf_counter() - start
+
+    stats = summarize(samples, wall_s=wall)
+    stats["errors"] = errors
+    return {f"estimate_odds/c{concurrency}": stats}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("db_dir", nargs="?", default=os.getenv("ODDS_DB_DIR"),
+                        help="folder with odds_YYYY.db files (default: $ODDS_DB_DIR)")
+    parser.add_argument("--url", help="drive a running server instead of an in-process TestClient")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 8])
+    parser.add_argument("--distinct", type=int, default=200, help="size of the request body pool")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--data-years", type=int, nargs="*", default=[2020, 2021])
+    parser.add_argument("--zones", nargs="*", default=ZONES,
+                        help="zone names to draw from (e.g. 'Colchuck 7' for synthetic data)")
+    parser.add_argument("--seed", type=int, default=1)
+    add_baseline_args(parser, "load")
+    args = parser.parse_args(argv)
+    if not args.url and not args.db_dir:
+        parser.error("db_dir is required when ODDS_DB_DIR is not set")
+
+    client = make_client(args)
+    pool = request_pool(args.distinct, args.data_years, args.zones, args.seed)
+    results: Dict[str, Dict[str, float]] = {}
+    for concurrency in args.concurrency:
+        results.update(run(client, pool, args.requests, concurrency, args.warmup, args.seed))
+    print_table(results)
+    for name, r in results.items():
+        if r["errors"]:
+            print(f"{name}: {r['errors']} non-200 responses", file=sys.stderr)
+
+    params = {"url": args.url, "requests": args.requests, "distinct": args.distinct,
+              "data_years": args.data_years, "zones": args.zones, "seed": args.seed}
+    return handle_baseline_args(args, "load", params, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Microbenchmarks for the odds engine's lookups against real odds databases.
+
+    python -m benchmarks.micro [DB_DIR] [--years 2020 2021] [--repeat 200]
+                               [--save [PATH]] [--compare [PATH]]
+
+Each lookup is timed on the SQL path (OddsContext over odds_YYYY.db, or its
+.opt.db copy when present) and on the in-memory OddsIndex. Inputs are sampled
+from the database itself with a fixed seed, so runs are comparable. The
+serialize/* rows time building /estimate_odds response bytes from results.
+"""
+import argparse
+import datetime as dt
+import itertools
+import json
+import os
+import random
+import sys
+from typing import Callable, Dict, List, Tuple
+
+from app.odds_catalog import YearCatalog
+from app.odds_engine import (
+    Choice, EstC2Odds, EstC3Odds, OddsContext, checkexact, comp_date_strs, coreodds1,
+    estimate_odds_for_choice_set, find_comp_date,
+)
+from app.odds_files import connect_odds_db, odds_db_path
+from app.odds_index import OddsIndex
+
+from .common import add_baseline_args, handle_baseline_args, print_table, summarize, time_calls
+
+SAMPLES = 50
+
+
+def _cycle(fn: Callable, inputs: List[Tuple]) -> Callable[[], object]:
+    """A no-argument callable that feeds fn the next input on every call."""
+    it = itertools.cycle(inputs)
+    return lambda: fn(*next(it))
+
+
+def _sample_inputs(cur, catalog: YearCatalog, rng: random.Random) -> Dict[str, List[Tuple]]:
+    def rows(sql, *params):
+        found = cur.execute(sql, params).fetchall()
+        return rng.sample(found, min(SAMPLES, len(found)))
+
+    core = catalog.corezoneid
+    c1 = rows('''SELECT zoneid1, dateid1, groupsize1 FROM wins
+              WHERE choicenum = 1 AND zoneid1 != ?''', core)
+    c2 = rows('''SELECT zoneid1, dateid1, groupsize1, zoneid2, dateid2, groupsize2
+              FROM wins WHERE choicenum = 2''')
+    c3 = rows('''SELECT zoneid1, dateid1, groupsize1, zoneid2, dateid2, groupsize2,
+              zoneid3, dateid3, groupsize3 FROM wins WHERE choicenum = 3''')
+    core_dates = rows('SELECT DISTINCT dateid1 FROM wins WHERE choicenum = 1 AND zoneid1 = ?', core)
+    odds = [r[0] for r in rows('SELECT avgodds FROM wins WHERE choicenum = 1 AND avgodds > 0')]
+
+    return {
+        "checkexact_c1": [(1, z, d, g, 0, 0, 0, 0, 0, 0) for z, d, g in c1],
+        "checkexact_c2": [(2, *r, 0, 0, 0) for r in c2],
+        "checkexact_c3": [(3, *r) for r in c3],
+        "coreodds1": [(d, rng.randint(1, 8)) for (d,) in core_dates],
+        "EstC2Odds": [(a, b) for a, b in zip(odds, reversed(odds))],
+        "EstC3Odds": [(a, b, c) for a, b, c in zip(odds, reversed(odds), odds[1:])],
+    }
+
+
+def _season_choices(catalog: YearCatalog, permit_year: int, rng: random.Random) -> List[List[Choice]]:
+    zones = [z for z in catalog.zones if z != "None"]
+    sets = []
+    for _ in range(SAMPLES):
+        sets.append([
+            Choice(rng.choice(zones), rng.randint(5, 10), rng.randint(1, 28), rng.randint(1, 8))
+            for _ in range(rng.randint(1, 3))
+        ])
+    return sets
+
+
+def run(db_dir: str, years: List[int], repeat: int, est_repeat: int, seed: int
+        ) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    rng = random.Random(seed)
+
+    # find_comp_date and the memoized table don't touch the databases
+    dates = [dt.date(2025, 1, 1) + dt.timedelta(rng.randint(0, 364)) for _ in range(SAMPLES)]
+    results["find_comp_date"] = summarize(time_calls(
+        _cycle(find_comp_date, [(d, rng.choice(years)) for d in dates]), repeat))
+    results["comp_date_table"] = summarize(time_calls(
+        _cycle(lambda d, y: comp_date_strs(2025, y)[(d.month, d.day)],
+               [(d, rng.choice(years)) for d in dates]), repeat))
+
+    index = OddsIndex(db_dir)
+    for year in years:
+        path = odds_db_path(db_dir, year)
+        year_odds = index.year(year)
+        if path is None or year_odds is None:
+            print(f"skipping {year}: no odds_{year}.db in {db_dir}", file=sys.stderr)
+            continue
+
+        conn = connect_odds_db(path)
+        try:
+            cur = conn.cursor()
+            catalog = YearCatalog.load(year, cur)
+            inputs = _sample_inputs(cur, catalog, rng)
+            ctx = OddsContext(cur=conn.cursor(), corezoneid=catalog.corezoneid)
+
+            sql_fns = {
+                "checkexact_c1": lambda *a: checkexact(ctx, *a),
+                "checkexact_c2": lambda *a: checkexact(ctx, *a),
+                "checkexact_c3": lambda *a: checkexact(ctx, *a),
+                "coreodds1": lambda *a: coreodds1(ctx, *a),
+                "EstC2Odds": lambda *a: EstC2Odds(ctx, *a),
+                "EstC3Odds": lambda *a: EstC3Odds(ctx, *a),
+            }
+            mem_fns = {
+                "checkexact_c1": year_odds.checkexact,
+                "checkexact_c2": year_odds.checkexact,
+                "checkexact_c3": year_odds.checkexact,
+                "coreodds1": year_odds.coreodds1,
+                "EstC2Odds": year_odds.EstC2Odds,
+                "EstC3Odds": year_odds.EstC3Odds,
+            }
+            for name, fn in sql_fns.items():
+                # The un-indexed estimate joins take up to seconds each
+                n = est_repeat if name.startswith("Est") else repeat
+                results[f"{year}/sql/{name}"] = summarize(time_calls(_cycle(fn, inputs[name]), n))
+            for name, fn in mem_fns.items():
+                results[f"{year}/index/{name}"] = summarize(
+                    time_calls(_cycle(fn, inputs[name]), repeat))
+        finally:
+            conn.close()
+
+        choice_sets = _season_choices(catalog, 2025, rng)
+        results[f"{year}/sql/estimate_odds_for_choice_set"] = summarize(time_calls(
+            _cycle(lambda cs: estimate_odds_for_choice_set(2025, cs, [year], db_dir),
+                   [(cs,) for cs in choice_sets]), repeat))
+        results[f"{year}/index/estimate_odds_for_choice_set"] = summarize(time_calls(
+            _cycle(lambda cs: estimate_odds_for_choice_set(2025, cs, [year], db_dir, index),
+                   [(cs,) for cs in choice_sets]), repeat))
+
+    if index.years:
+        results.update(_serialization(index, db_dir, years, rng, repeat))
+    return results
+
+
+def _serialization(index: OddsIndex, db_dir: str, years: List[int], rng: random.Random,
+                   repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Cost of turning /estimate_odds results into response bytes: FastAPI's
+    generic jsonable_encoder path, the typed model's own JSON (reused for the
+    analytics results_json) and the columnar layout.
+    """
+    # Imported here: app.main builds the whole app on import
+    from fastapi.encoders import jsonable_encoder
+    from app.main import ColumnarOddsResponse, OddsResponse
+
+    loaded = [y for y in years if index.year(y) is not None]
+    catalog = index.year(loaded[0]).catalog
+    inputs = []
+    for cs in _season_choices(catalog, 2025, rng):
+        for mode in ("independent", "sequential"):
+            inputs.append((estimate_odds_for_choice_set(2025, cs, loaded, db_dir, index, mode=mode),))
+
+    def generic(result):
+        # What response_model=OddsResponse plus the separate log json.dumps did
+        return (json.dumps(jsonable_encoder(OddsResponse(**result))).encode(),
+                json.dumps(result))
+
+    def typed(result):
+        return OddsResponse.model_validate(result).to_json()
+
+    def columnar(result):
+        response = OddsResponse.model_validate(result)
+        return (response.to_json(),
+                ColumnarOddsResponse.from_response(response).model_dump_json(exclude_none=True))
+
+    return {f"serialize/{name}": summarize(time_calls(_cycle(fn, inputs), repeat))
+            for name, fn in (("generic", generic), ("typed", typed), ("columnar", columnar))}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("db_dir", nargs="?", default=os.getenv("ODDS_DB_DIR"),
+                        help="folder with odds_YYYY.db files (default: $ODDS_DB_DIR)")
+    parser.add_argument("--years", type=int, nargs="*", default=[2020, 2021])
+    parser.add_argument("--repeat", type=int, default=200, help="timed calls per benchmark")
+    parser.add_argument("--est-repeat", type=int, default=5,
+                        help="timed calls for the SQL EstC2Odds/EstC3Odds joins")
+    parser.add_argument("--seed", type=int, default=1)
+    add_baseline_args(parser, "micro")
+    args = parser.parse_args(argv)
+    if not args.db_dir:
+        parser.error("db_dir is required when ODDS_DB_DIR is not set")
+
+    results = run(args.db_dir, args.years, args.repeat, args.est_repeat, args.seed)
+    print_table(results)
+    params = {"db_dir": os.path.basename(os.path.normpath(args.db_dir)), "years": args.years,
+              "repeat": args.repeat, "est_repeat": args.est_repeat, "seed": args.seed}
+    return handle_baseline_args(args, "micro", params, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
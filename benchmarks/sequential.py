@@ -0,0 +1,76 @@
+"""
+Latency budget check for mode="sequential" odds.
+
+    python -m benchmarks.sequential [DB_DIR] [--requests 300] [--budget-ms 50]
+                                    [--save [PATH]] [--compare [PATH]]
+
+Times estimate_odds_for_choice_set(mode="sequential") on the in-memory
+OddsIndex for random three-choice sets (no result cache, so every request
+runs the C1/C2/C3 lookups and any EstC2Odds/EstC3Odds searches) and exits 1
+if the p99 latency is over the budget. The choice-set matchers are built
+before timing, as they are once per data year in the running app.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Dict
+
+from app.choice_match import matcher_for
+from app.odds_engine import SEQUENTIAL, Choice, estimate_odds_for_choice_set
+from app.odds_index import OddsIndex
+
+from .common import add_baseline_args, handle_baseline_args, print_table, summarize
+from .load import ZONES
+
+
+def run(db_dir: str, n_requests: int, data_years, seed: int) -> Dict[str, Dict[str, float]]:
+    index = OddsIndex(db_dir)
+    start = time.perf_counter()
+    for dyear in data_years:
+        if index.year(dyear) is not None:
+            matcher_for(index.year(dyear))
+    print(f"built choice-set matchers in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(n_requests):
+        choices = [
+            Choice(rng.choice(ZONES), rng.randint(5, 10), rng.randint(1, 28), rng.randint(1, 8))
+            for _ in range(3)
+        ]
+        start = time.perf_counter()
+        estimate_odds_for_choice_set(2025, choices, data_years, db_dir, index, mode=SEQUENTIAL)
+        samples.append(time.perf_counter() - start)
+    return {"sequential/3_choices": summarize(samples)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("db_dir", nargs="?", default=os.getenv("ODDS_DB_DIR"),
+                        help="folder with odds_YYYY.db files (default: $ODDS_DB_DIR)")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--data-years", type=int, nargs="*", default=[2020, 2021])
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="p99 latency budget")
+    parser.add_argument("--seed", type=int, default=1)
+    add_baseline_args(parser, "sequential")
+    args = parser.parse_args(argv)
+    if not args.db_dir:
+        parser.error("db_dir is required when ODDS_DB_DIR is not set")
+
+    results = run(args.db_dir, args.requests, args.data_years, args.seed)
+    print_table(results)
+    params = {"requests": args.requests, "data_years": args.data_years, "seed": args.seed}
+    status = handle_baseline_args(args, "sequential", params, results)
+
+    p99 = results["sequential/3_choices"]["p99_ms"]
+    if p99 > args.budget_ms:
+        print(f"FAIL: p99 {p99:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        return 1
+    print(f"ok: p99 {p99:.1f} ms within the {args.budget_ms:.0f} ms budget")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
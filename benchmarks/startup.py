@@ -0,0 +1,88 @@
+"""
+Cold-start budget check for the app.
+
+    python -m benchmarks.startup [DB_DIR] [--runs 5] [--budget-s 5]
+                                 [--save [PATH]] [--compare [PATH]]
+
+Each run starts a fresh Python process that imports app.main, runs its
+lifespan through a TestClient and polls GET /ready until the warm-up is
+done. Reports the import time, the time until the lifespan lets requests
+in, and the cold-start time /ready reports (process start to end of
+warm-up); exits 1 if the p99 cold start is over the budget.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+from .common import add_baseline_args, handle_baseline_args, print_table, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import app.main
+from fastapi.testclient import TestClient
+t1 = time.perf_counter()
+with TestClient(app.main.app) as client:
+    t2 = time.perf_counter()
+    while True:
+        r = client.get("/ready")
+        if r.status_code == 200 or r.json()["status"] == "failed":
+            break
+        time.sleep(0.005)
+print(json.dumps({"import_s": t1 - t0, "serving_s": t2 - t0, "ready": r.json()}))
+"""
+
+
+def one_run(db_dir: str, prewarm: bool) -> Dict:
+    env = dict(os.environ, ODDS_DB_DIR=db_dir, ODDS_PREWARM="1" if prewarm else "0")
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(db_dir: str, runs: int, prewarm: bool) -> Dict[str, Dict[str, float]]:
+    samples: Dict[str, List[float]] = {"startup/import": [], "startup/serving": [],
+                                       "startup/ready": []}
+    for _ in range(runs):
+        r = one_run(db_dir, prewarm)
+        if r["ready"]["status"] != "ready":
+            raise SystemExit(f"warm-up failed: {r['ready']['error']}")
+        samples["startup/import"].append(r["import_s"])
+        samples["startup/serving"].append(r["serving_s"])
+        samples["startup/ready"].append(r["ready"]["startup_s"])
+    return {name: summarize(s) for name, s in samples.items()}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("db_dir", nargs="?", default=os.getenv("ODDS_DB_DIR"),
+                        help="folder with odds_YYYY.db files (default: $ODDS_DB_DIR)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-prewarm", dest="prewarm", action="store_false",
+                        help="leave the choice-set matchers to the first request (ODDS_PREWARM=0)")
+    parser.add_argument("--budget-s", type=float, default=5.0, help="p99 cold-start budget")
+    add_baseline_args(parser, "startup")
+    args = parser.parse_args(argv)
+    if not args.db_dir:
+        parser.error("db_dir is required when ODDS_DB_DIR is not set")
+
+    results = run(os.path.abspath(args.db_dir), args.runs, args.prewarm)
+    print_table(results)
+    params = {"runs": args.runs, "prewarm": args.prewarm}
+    status = handle_baseline_args(args, "startup", params, results)
+
+    p99_s = results["startup/ready"]["p99_ms"] / 1000
+    if p99_s > args.budget_s:
+        print(f"FAIL: p99 cold start {p99_s:.2f} s is over the {args.budget_s:.1f} s budget")
+        return 1
+    print(f"ok: p99 cold start {p99_s:.2f} s within the {args.budget_s:.1f} s budget")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
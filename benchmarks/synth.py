@@ -0,0 +1,99 @@
+"""
+Build larger synthetic odds databases with the same schema as the real ones.
+
+    python -m benchmarks.synth SRC_DIR OUT_DIR --factor 10 [--years 2020 2021]
+
+Every odds_YYYY.db in SRC_DIR is copied to OUT_DIR with its zones repeated
+`factor` times ("Colchuck", "Colchuck 2", ...) and the wins table repeated
+once per copy with the zone ids remapped, so --factor 10 gives 10x the rows
+and 10x the zones. Copies after the first get their odds jittered by up to
++/-10% (capped at 1.0) so they are not exact duplicates. Only the original
+"Core" zone keeps core-zone (group-size dependent) behaviour.
+
+Point the micro or load benchmarks at OUT_DIR to measure scaling.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from app.odds_files import ODDS_DB_PATTERN
+
+ZONE_COLUMNS = ("zoneid1", "zoneid2", "zoneid3")
+
+
+def build_synthetic(src: str, dst: str, factor: int, seed: int = 1) -> int:
+    """Write the scaled copy of src to dst; returns the number of wins rows."""
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    conn = sqlite3.connect(src)
+    try:
+        conn.execute("VACUUM INTO ?", (dst,))
+    finally:
+        conn.close()
+
+    conn = sqlite3.connect(dst)
+    try:
+        cols = [row[1] for row in conn.execute("PRAGMA table_info(wins)")]
+        # wins_id (2021 schema) is an INTEGER PRIMARY KEY; let SQLite number the copies
+        copy_cols = [c for c in cols if c != "wins_id"]
+        offset = conn.execute("SELECT max(zone_id) FROM zone").fetchone()[0]
+        zones = conn.execute("SELECT zone_id, zonename FROM zone ORDER BY zone_id").fetchall()
+        conn.execute("CREATE TEMP TABLE base AS SELECT * FROM wins ORDER BY rowid")
+
+        # SQLite's random() can't be seeded; derive the jitter from rowid instead
+        for k in range(1, factor):
+            conn.executemany("INSERT INTO zone (zone_id, zonename) VALUES (?, ?)",
+                             [(zid + k * offset, f"{name} {k + 1}") for zid, name in zones])
+            select = []
+            for c in copy_cols:
+                if c in ZONE_COLUMNS:
+                    select.append(f"CASE WHEN {c} = 0 THEN 0 ELSE {c} + {k * offset} END")
+                elif c == "avgodds":
+                    select.append(
+                        "min(1.0, avgodds * (0.9 + 0.2 * (((rowid * 2654435761 + ?) % 1000) / 999.0)))")
+                else:
+                    select.append(c)
+            conn.execute(
+                f"INSERT INTO wins ({', '.join(copy_cols)}) "
+                f"SELECT {', '.join(select)} FROM base ORDER BY rowid",
+                (seed * 7919 + k,),
+            )
+        conn.execute("DROP TABLE base")
+        conn.commit()
+        conn.execute("VACUUM")
+        return conn.execute("SELECT count(*) FROM wins").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("src_dir", help="folder with the real odds_YYYY.db files")
+    parser.add_argument("out_dir", help="where to write the synthetic odds_YYYY.db files")
+    parser.add_argument("--factor", type=int, default=10, help="row and zone multiplier")
+    parser.add_argument("--years", type=int, nargs="*", help="only these data years")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.factor < 1:
+        parser.error("--factor must be at least 1")
+    if os.path.abspath(args.src_dir) == os.path.abspath(args.out_dir):
+        parser.error("out_dir must differ from src_dir")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name in sorted(os.listdir(args.src_dir)):
+        m = ODDS_DB_PATTERN.match(name)
+        if not m or (args.years and int(m.group(1)) not in args.years):
+            continue
+        start = time.perf_counter()
+        rows = build_synthetic(os.path.join(args.src_dir, name),
+                               os.path.join(args.out_dir, name), args.factor, args.seed)
+        print(f"wrote {os.path.join(args.out_dir, name)}: {rows} wins rows "
+              f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Migrations leave the rows already in query_events to run_backfills, which
+folds them in id-ranged batches, once each, however many workers run it.
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from app import analytics_choices, analytics_rollups, main
+from app.analytics_choices import read_events
+from app.analytics_rollups import EXPORT_COLUMNS
+from app.analytics_schema import MIGRATIONS, migrate, pending_backfills, run_backfills
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schema.sql"
+ROLLUP_TABLES = ("rollup_zone_date_hour", "rollup_choice_sets", "rollup_latency")
+EVENTS = 95
+
+
+def _event(i):
+    choices = [{"zone": ["Core", "Colchuck", "Snow"][(i + k) % 3], "month": 7, "day": 1 + i % 5,
+                "group_size": 2} for k in range(1 + i % 3)]
+    inputs = {"permit_year": 2025, "data_years": [2021], "choices": choices}
+    results = "{}"
+    if i % 2:
+        # As logged once /estimate_odds recorded the mode and its response
+        inputs = {"permit_year": 2025, "data_years": [2021], "mode": "independent", "choices": choices}
+        results = main.OddsResponse.model_validate({"years": [2021], "choices": [
+            {"index": k, **c, "display_date": f"07-{c['day']:02d}-2025",
+             "odds_by_year": {2021: 0.01 * i}, "comp_dates_by_year": {2021: None}}
+            for k, c in enumerate(choices, start=1)]}).to_json().decode()
+    return ("s%d" % (i % 4), None, f"2025-07-0{1 + i % 3}T1{i % 10}:00:00+00:00", "get_table",
+            None, None, "desktop", "firefox", "linux", None, "v1.0.0", i,
+            json.dumps(inputs), results, None, "success", i * 7)
+
+
+@pytest.fixture
+def old_db(tmp_path):
+    """An analytics.db at schema version 2 with EVENTS rows logged."""
+    path = tmp_path / "analytics.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, "
+                 "description TEXT NOT NULL, applied_utc TEXT NOT NULL)")
+    for version, description, apply in MIGRATIONS[:2]:
+        apply(conn, SCHEMA_PATH)
+        conn.execute("INSERT INTO schema_version VALUES (?, ?, ?)",
+                     (version, description, datetime.now(timezone.utc).isoformat()))
+    conn.executemany(
+        """INSERT INTO query_events (session_id, user_id, event_time_utc, event_type, country,
+               region, device_type, browser, os, referrer, sim_version, query_index_in_session,
+               inputs_json, results_json, latency_ms, status, server_latency_ms)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        [_event(i) for i in range(EVENTS)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _rollups(conn):
+    return {t: sorted(conn.execute(f"SELECT * FROM {t}").fetchall()) for t in ROLLUP_TABLES}
+
+
+def _expected():
+    conn = sqlite3.connect(":memory:")
+    for statement in analytics_rollups.ROLLUP_SCHEMA:
+        conn.execute(statement)
+    analytics_rollups.apply_rows(conn, ((e[2], e[3], e[12], e[16]) for e in map(_event, range(EVENTS))))
+    return _rollups(conn)
+
+
+def test_migration_only_queues_the_backfill(old_db):
+    migrate(old_db, SCHEMA_PATH)
+    conn = sqlite3.connect(old_db)
+    assert pending_backfills(conn) == {"rollups": {"last_id": 0, "end_id": EVENTS},
+                                       "choices": {"last_id": 0, "end_id": EVENTS}}
+    assert all(rows == [] for rows in _rollups(conn).values())
+
+    assert run_backfills(old_db, batch_size=10, pause=0) == {"rollups": EVENTS, "choices": EVENTS}
+    assert pending_backfills(conn) == {}
+    assert _rollups(conn) == _expected()
+    # Nothing left to do on the next start
+    assert run_backfills(old_db, pause=0) == {}
+
+
+def test_concurrent_and_interrupted_backfills(old_db):
+    migrate(old_db, SCHEMA_PATH)
+
+    class StopAfterOneBatch(threading.Event):
+        def wait(self, timeout=None):
+            self.set()
+
+    # Stopped after one batch: the next run resumes after it
+    assert run_backfills(old_db, batch_size=10, pause=0, stop=StopAfterOneBatch()) == {"rollups": 10}
+    assert pending_backfills(sqlite3.connect(old_db))["rollups"]["last_id"] == 10
+
+    threads = [threading.Thread(target=run_backfills, args=(old_db,),
+                                kwargs={"batch_size": 7, "pause": 0}) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert _rollups(sqlite3.connect(old_db)) == _expected()
+
+
+def test_choices_backfill_stores_old_rows_like_new_ones(old_db):
+    migrate(old_db, SCHEMA_PATH)
+    run_backfills(old_db, batch_size=10, pause=0)
+    conn = sqlite3.connect(old_db)
+    assert read_events(conn, EXPORT_COLUMNS) == [(i + 1, *_event(i)) for i in range(EVENTS)]
+    stored = conn.execute("""SELECT id, inputs_json = '', session_id, browser, mode
+                             FROM query_events ORDER BY id""").fetchall()
+    assert stored == [(i + 1, i % 2, "", None, "independent" if i % 2 else None) for i in range(EVENTS)]
+    assert conn.execute("SELECT COUNT(*) FROM query_choices").fetchone()[0] == \
+        sum(1 + i % 3 for i in range(EVENTS))
+
+    # Running a range again changes nothing
+    before = conn.execute("SELECT * FROM query_events ORDER BY id").fetchall()
+    with conn:
+        analytics_choices.backfill(conn, 0, EVENTS)
+    assert conn.execute("SELECT * FROM query_events ORDER BY id").fetchall() == before
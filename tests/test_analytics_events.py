@@ -0,0 +1,97 @@
+"""
+/estimate_odds events are stored as normalized rows and dictionary keys
+only, and read back (debug endpoint, export) exactly as they were logged.
+"""
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from app import main
+from app.analytics_choices import read_events
+from app.analytics_rollups import EXPORT_COLUMNS, export_events
+from app.analytics_schema import migrate
+from app.analytics_writer import AnalyticsWriter
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schema.sql"
+
+
+def _odds_body(mode, choices, years, partial):
+    entries = []
+    for i, (zone, month, day, group_size) in enumerate(choices, start=1):
+        entry = {"index": i, "zone": zone, "month": month, "day": day, "group_size": group_size,
+                 "display_date": f"{month:02d}-{day:02d}-2025",
+                 "odds_by_year": {y: round(0.013 * i * (y - 2017), 3) for y in years},
+                 "comp_dates_by_year": {y: None if y in partial else f"{month:02d}-{day:02d}-{y}"
+                                        for y in years}}
+        if mode == "sequential":
+            entry["first_choice_odds_by_year"] = {y: 0.5 / i for y in years}
+        entries.append(entry)
+    return main.OddsResponse.model_validate(
+        {"years": years, "mode": mode, "choices": entries, "partial_years": partial}).to_json()
+
+
+def _log_odds_event(mode, choices, years, partial, **meta):
+    inputs = {"permit_year": 2025, "data_years": years, "mode": mode,
+              "choices": [dict(zip(("zone", "month", "day", "group_size"), c)) for c in choices]}
+    main.log_query_event(inputs=inputs, results=_odds_body(mode, choices, years, partial), **meta)
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    path = tmp_path / "analytics.db"
+    migrate(path, SCHEMA_PATH)
+    writer = AnalyticsWriter(path)
+    submitted = []
+    submit = writer.submit
+
+    def recording_submit(row):
+        submitted.append(row)
+        return submit(row)
+
+    monkeypatch.setattr(writer, "submit", recording_submit)
+    monkeypatch.setattr(main, "analytics_writer", writer)
+    monkeypatch.setattr(main, "ANALYTICS_DB_PATH", path)
+    writer.start()
+    yield writer, path, submitted
+    writer.close()
+
+
+def test_events_round_trip(writer):
+    writer, path, submitted = writer
+    _log_odds_event("independent", [("Colchuck", 7, 5, 2), ("Core", 8, 1, 4)], [2021, 2020, 2019],
+                    {2019: "missing"}, session_id="abc", browser="firefox", device_type="mobile",
+                    os_name="android", query_index_in_session=3, latency_ms=120)
+    _log_odds_event("sequential", [("Snow", 6, 30, 1), ("Colchuck", 7, 5, 2), ("Core", 7, 5, 2)],
+                    [2020, 2021], {}, session_id="abc", browser="firefox")
+    # Logged before "mode" was recorded: kept as JSON
+    main.log_query_event(inputs={"permit_year": 2025, "data_years": [2021],
+                                 "choices": [{"zone": "Core", "month": 7, "day": 1, "group_size": 2}]},
+                         results=_odds_body("independent", [("Core", 7, 1, 2)], [2021], {}))
+    main.log_query_event(inputs={"permit_year": 2025, "data_years": [2021], "choice_sets": []},
+                         results={"choice_sets": 0, "errors": 0}, event_type="get_table_batch",
+                         session_id="xyz", browser="safari")
+    assert main.debug_log_test()["ok"]
+
+    conn = sqlite3.connect(path)
+    stored = conn.execute("""SELECT inputs_json = '', results_json = '', session_id, browser, os,
+                                    permit_year, mode, data_years FROM query_events ORDER BY id""").fetchall()
+    assert stored == [
+        (1, 1, "", None, None, 2025, "independent", "2021,2020,2019"),
+        (1, 1, "", None, None, 2025, "sequential", "2020,2021"),
+        (0, 0, "", None, None, 2025, None, "2021"),
+        (0, 0, "", None, None, None, None, None),
+        (0, 0, "", None, None, None, None, None),
+    ]
+    assert conn.execute("SELECT * FROM query_partial_years").fetchall() == [(1, 2019, "missing")]
+
+    expected = [(i, *row) for i, row in enumerate(submitted, start=1)]
+    assert read_events(conn, EXPORT_COLUMNS) == expected
+    assert read_events(conn, EXPORT_COLUMNS, order="id DESC", limit=2) == expected[:-3:-1]
+    exported = [json.loads(line) for line in "".join(export_events(conn, chunk_rows=2)).splitlines()]
+    assert exported == [dict(zip(EXPORT_COLUMNS, row)) for row in expected]
+
+    debug = main.debug_analytics(limit=10)["rows"]
+    assert [(r["id"], r["session_id"], r["browser"], r["inputs_json"], r["results_json"])
+            for r in debug] == [(row[0], row[1], row[8], row[13], row[14]) for row in expected[::-1]]
@@ -0,0 +1,71 @@
+"""
+POST /estimate_odds/batch streams each chunk of choice sets as soon as the
+engine executor has scored it, with the same results as one big batch.
+"""
+import asyncio
+import json
+import os
+import random
+
+import pytest
+from starlette.requests import Request
+
+from app import main
+from app.odds_engine import Choice, estimate_odds_for_choice_sets
+
+DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "odds_databases")
+YEARS = [2020, 2021]
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(DB_DIR), reason="no odds_databases folder")
+
+
+@pytest.fixture(scope="module")
+def loaded():
+    if not main.warmup.ready:
+        main.warmup.start(main.warmup_steps())
+    assert main.warmup.wait(60)
+
+
+def _choice_sets(n, seed=1):
+    rng = random.Random(seed)
+    zones = ["Core", "Colchuck", "Snow", "Stuart", "Eightmile", "Nowhere"]
+    return [[{"zone": rng.choice(zones), "month": rng.randint(5, 10), "day": rng.randint(1, 28),
+              "group_size": rng.randint(1, 8)} for _ in range(rng.randint(1, 3))]
+            for _ in range(n)]
+
+
+def test_batch_streams_chunks(loaded, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_CHUNK_SETS", 7)
+    runs = []
+    run = main.engine_executor.run
+
+    async def counting_run(fn, *args):
+        runs.append(len(args[0]))
+        return await run(fn, *args)
+
+    monkeypatch.setattr(main.engine_executor, "run", counting_run)
+    sets = _choice_sets(30)
+    payload = main.BatchOddsRequest(data_years=YEARS, choice_sets=sets)
+    request = Request({"type": "http", "method": "POST", "path": "/estimate_odds/batch",
+                       "headers": []})
+
+    async def stream():
+        response = await main.estimate_odds_batch(payload, request)
+        lines = []
+        async for line in response.body_iterator:
+            # Each chunk is run only once the lines before it are sent
+            lines.append((json.loads(line), len(runs)))
+        return lines
+
+    lines = asyncio.run(stream())
+    assert runs == [7, 7, 7, 7, 2]
+    assert [line["index"] for line, _ in lines] == list(range(30))
+    assert [seen for _, seen in lines] == [1 + i // 7 for i in range(30)]
+
+    choice_sets = [[Choice(**c) for c in s] for s in sets]
+    expected = estimate_odds_for_choice_sets(2025, choice_sets, YEARS, DB_DIR, main.odds_index)
+    for (line, _), r in zip(lines, expected):
+        if isinstance(r, Exception):
+            assert line == {"index": line["index"], "error": str(r)}
+        else:
+            assert line == json.loads(json.dumps({"index": line["index"], **r}))
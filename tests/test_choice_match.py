@@ -0,0 +1,71 @@
+"""
+YearOdds.EstC2Odds/EstC3Odds (the in-memory ChoiceSetMatcher) return what
+the SQL EstC2Odds/EstC3Odds return, for sampled inputs in every year.
+"""
+import os
+import random
+import sqlite3
+
+import pytest
+
+from app.odds_engine import EstC2Odds, EstC3Odds, OddsContext
+from app.odds_index import YearOdds
+from app.optimize_odds_db import build_optimized
+
+DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "odds_databases")
+YEARS = [2020, 2021]
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(DB_DIR), reason="no odds_databases folder")
+
+
+def _db(year):
+    return os.path.join(DB_DIR, f"odds_{year}.db")
+
+
+@pytest.fixture(scope="module", params=YEARS)
+def year(request, tmp_path_factory):
+    """The year's YearOdds and an OddsContext over an optimized copy of its file
+    (same results as the original, see optimize_odds_db; EstC3Odds is far faster)."""
+    year_odds = YearOdds.load(request.param, _db(request.param))
+    opt = str(tmp_path_factory.mktemp("opt") / f"odds_{request.param}.opt.db")
+    build_optimized(_db(request.param), opt)
+    conn = sqlite3.connect(opt)
+    yield year_odds, OddsContext(cur=conn.cursor(), corezoneid=year_odds.corezoneid)
+    conn.close()
+
+
+def _inputs(year_odds, n, size, seed):
+    # Odds that occur in wins, so ties between candidates are common
+    odds = sorted({row[3] for rows in year_odds.wins.values() for row in rows})
+    rng = random.Random(seed)
+    return [tuple(rng.choice(odds) for _ in range(size)) for _ in range(n)]
+
+
+def _result(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return type(e)
+
+
+def test_c2_matches_sql(year):
+    year_odds, ctx = year
+    for args in _inputs(year_odds, 150, 2, seed=1):
+        assert year_odds.EstC2Odds(*args) == _result(EstC2Odds, ctx, *args), args
+
+
+def test_c3_matches_sql(year):
+    year_odds, ctx = year
+    for args in _inputs(year_odds, 25, 3, seed=2):
+        assert year_odds.EstC3Odds(*args) == _result(EstC3Odds, ctx, *args), args
+
+
+def test_c3_tie_against_original_file():
+    # Several candidates share the minimum error; the first in join order wins
+    year_odds = YearOdds.load(2021, _db(2021))
+    conn = sqlite3.connect(_db(2021))
+    try:
+        ctx = OddsContext(cur=conn.cursor(), corezoneid=year_odds.corezoneid)
+        assert year_odds.EstC3Odds(0.183, 0.0, 0.089) == EstC3Odds(ctx, 0.183, 0.0, 0.089) == 0.108
+    finally:
+        conn.close()
@@ -0,0 +1,47 @@
+"""
+The memoized comparable-date tables match find_comp_date for every day of
+the permit year, including leap permit and data years.
+"""
+import datetime as dt
+import os
+
+import pytest
+
+from app.odds_engine import comp_date_strs, comp_date_table, find_comp_date
+from app.odds_index import OddsIndex
+
+DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "odds_databases")
+
+# 2024 and 2028 are leap permit years, 2020 and 2024 leap data years
+PERMIT_YEARS = [2023, 2024, 2025, 2028]
+DATA_YEARS = [2019, 2020, 2021, 2024]
+
+
+def _days(year):
+    day = dt.date(year, 1, 1)
+    while day.year == year:
+        yield day
+        day += dt.timedelta(1)
+
+
+@pytest.mark.parametrize("permit_year", PERMIT_YEARS)
+@pytest.mark.parametrize("data_year", DATA_YEARS)
+def test_comp_date_strs_match_find_comp_date(permit_year, data_year):
+    table = comp_date_strs(permit_year, data_year)
+    expected = {(d.month, d.day): find_comp_date(d, data_year).strftime('%m-%d-%Y')
+                for d in _days(permit_year)}
+    assert table == expected
+    assert ((2, 29) in table) == (permit_year % 4 == 0)
+
+
+@pytest.mark.skipif(not os.path.isdir(DB_DIR), reason="no odds_databases folder")
+@pytest.mark.parametrize("permit_year", PERMIT_YEARS)
+def test_comp_date_table_matches_find_comp_date(permit_year):
+    index = OddsIndex(DB_DIR)
+    for data_year in index.years:
+        catalog = index.year(data_year).catalog
+        table = comp_date_table(permit_year, catalog)
+        assert len(table) == len(list(_days(permit_year)))
+        for d in _days(permit_year):
+            date_str = find_comp_date(d, data_year).strftime('%m-%d-%Y')
+            assert table[(d.month, d.day)] == (date_str, catalog.dates.get(date_str))
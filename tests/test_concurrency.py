@@ -0,0 +1,85 @@
+"""
+Concurrent estimate_odds_for_choice_set calls return exactly what serial
+calls do, on both the SQL path (one OddsContext per choice and year) and
+the in-memory OddsIndex path.
+"""
+import os
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.odds_engine import SEQUENTIAL, Choice, estimate_odds_for_choice_set
+from app.odds_index import OddsIndex
+from app.optimize_odds_db import build_optimized
+
+DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "odds_databases")
+YEARS = [2020, 2021]
+THREADS = 8
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(DB_DIR), reason="no odds_databases folder")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return OddsIndex(DB_DIR)
+
+
+def _choice_sets(index, n, seed=1):
+    rng = random.Random(seed)
+    zones = sorted({z for y in index.years for z in index.year(y).catalog.zones if z != "None"})
+    return [[Choice(rng.choice(zones), rng.randint(5, 10), rng.randint(1, 28), rng.randint(1, 8))
+             for _ in range(rng.randint(1, 3))]
+            for _ in range(n)]
+
+
+def _serial_and_threaded(fn, choice_sets, rounds=3):
+    serial = [fn(cs) for cs in choice_sets]
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        threaded = list(pool.map(fn, choice_sets * rounds))
+    return serial * rounds, threaded
+
+
+def test_sql_path_matches_serial(index):
+    choice_sets = _choice_sets(index, 40)
+    serial, threaded = _serial_and_threaded(
+        lambda cs: estimate_odds_for_choice_set(2025, cs, YEARS, DB_DIR), choice_sets)
+    assert threaded == serial
+
+
+@pytest.mark.parametrize("mode", ["independent", "sequential"])
+def test_index_path_matches_serial(index, mode):
+    choice_sets = _choice_sets(index, 100, seed=2)
+    serial, threaded = _serial_and_threaded(
+        lambda cs: estimate_odds_for_choice_set(2025, cs, YEARS, DB_DIR, index, mode=mode),
+        choice_sets)
+    assert threaded == serial
+
+
+def test_sql_and_index_paths_agree(index):
+    choice_sets = _choice_sets(index, 40, seed=3)
+    sql = [estimate_odds_for_choice_set(2025, cs, YEARS, DB_DIR) for cs in choice_sets]
+    mem = [estimate_odds_for_choice_set(2025, cs, YEARS, DB_DIR, index) for cs in choice_sets]
+    assert mem == sql
+
+
+@pytest.fixture(scope="module")
+def optimized_dir(tmp_path_factory):
+    """A copy of DB_DIR with optimized copies next to the originals, as the SQL path prefers."""
+    path = tmp_path_factory.mktemp("odds")
+    for dyear in YEARS:
+        src = os.path.join(DB_DIR, f"odds_{dyear}.db")
+        shutil.copy2(src, path / f"odds_{dyear}.db")
+        build_optimized(src, str(path / f"odds_{dyear}.opt.db"))
+    return str(path)
+
+
+def test_sql_and_index_paths_agree_sequential(index, optimized_dir):
+    # EstC2Odds/EstC3Odds on SQLite against the ChoiceSetMatcher
+    choice_sets = [cs for cs in _choice_sets(index, 40, seed=4) if len(cs) > 1][:15]
+    sql = [estimate_odds_for_choice_set(2025, cs, YEARS, optimized_dir, mode=SEQUENTIAL)
+           for cs in choice_sets]
+    mem = [estimate_odds_for_choice_set(2025, cs, YEARS, optimized_dir, index, mode=SEQUENTIAL)
+           for cs in choice_sets]
+    assert mem == sql
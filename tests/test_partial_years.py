@@ -0,0 +1,50 @@
+"""
+partial_years flags the data years a choice's zone or date is missing from;
+other lookup errors are not turned into 0.0 odds.
+"""
+import os
+
+import pytest
+
+from app.odds_engine import Choice, estimate_odds_for_choice_set, first_choice_odds
+from app.odds_index import OddsIndex
+
+DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "odds_databases")
+YEARS = [2020, 2021]
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(DB_DIR), reason="no odds_databases folder")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return OddsIndex(DB_DIR)
+
+
+def test_zone_missing_from_a_year(index):
+    # Stock zones only exist in the 2021 data
+    result = estimate_odds_for_choice_set(2025, [Choice("Eightmile(stock)", 7, 5, 2)], YEARS,
+                                          DB_DIR, index)
+    assert result["partial_years"] == {2020: "unknown"}
+    assert result["choices"][0]["odds_by_year"][2020] == 0.0
+
+
+def test_date_outside_the_season(index):
+    result = estimate_odds_for_choice_set(
+        2025, [Choice("Colchuck", 1, 5, 2), Choice("Colchuck", 7, 5, 2)], YEARS, DB_DIR, index)
+    assert result["partial_years"] == {2020: "unknown", 2021: "unknown"}
+    assert result["choices"][0]["odds_by_year"] == {2020: 0.0, 2021: 0.0}
+    assert result["choices"][1]["odds_by_year"][2021] > 0
+
+
+def test_other_errors_propagate(index, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("broken lookup")
+
+    year_odds = index.year(2021)
+    monkeypatch.setattr(year_odds, "checkexact", broken)
+    choice = Choice("Colchuck", 7, 5, 2)
+    with pytest.raises(RuntimeError):
+        first_choice_odds(year_odds, index.catalog, 2021, 2025, choice, {}, {})
+
+    result = estimate_odds_for_choice_set(2025, [choice], YEARS, DB_DIR, index)
+    assert result["partial_years"] == {2021: "error"}
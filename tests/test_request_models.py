@@ -0,0 +1,21 @@
+"""
+/estimate_odds request bodies are limited to three choices per set.
+"""
+import pytest
+from pydantic import ValidationError
+
+from app.main import BatchOddsRequest, OddsRequest
+
+CHOICE = {"zone": "Core", "month": 7, "day": 1, "group_size": 2}
+
+
+def test_odds_request_takes_up_to_three_choices():
+    assert len(OddsRequest(choices=[CHOICE] * 3).choices) == 3
+    with pytest.raises(ValidationError):
+        OddsRequest(choices=[CHOICE] * 4)
+
+
+def test_batch_request_takes_up_to_three_choices_per_set():
+    assert len(BatchOddsRequest(choice_sets=[[CHOICE] * 3, [CHOICE]]).choice_sets) == 2
+    with pytest.raises(ValidationError):
+        BatchOddsRequest(choice_sets=[[CHOICE], [CHOICE] * 4])
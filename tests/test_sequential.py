@@ -0,0 +1,84 @@
+"""
+mode="sequential" odds: the exact-match rule of fetchCore2/fetchCore3, and
+the latency budget of a POST /estimate_odds request on the app's default
+path (warm-up, OddsIndex, result cache, year fan-out, engine executor).
+"""
+import asyncio
+import os
+import random
+
+import numpy as np
+import pytest
+from starlette.requests import Request
+
+from app import main
+from app.analytics_schema import migrate
+from app.analytics_writer import AnalyticsWriter
+from app.odds_catalog import OddsCatalog
+from app.odds_engine import Choice, conditional_odds
+from app.odds_index import YearOdds
+from app.optimizer import _Year
+
+DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "odds_databases")
+BUDGET_MS = 50.0
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(DB_DIR), reason="no odds_databases folder")
+
+
+@pytest.fixture(scope="module")
+def year_odds():
+    return YearOdds.load(2021, os.path.join(DB_DIR, "odds_2021.db"))
+
+
+def _two_exact_rows(n, *args):
+    return [(0.9,), (0.8,)]
+
+
+def test_exact_match_needs_a_single_row(year_odds, monkeypatch):
+    # fetchCore2/fetchCore3 take the exact match only when it is the only row
+    zones = [z for z in year_odds.catalog.zones if z != "None"][:2]
+    candidates = [Choice(zones[0], 7, 10, 2), Choice(zones[1], 8, 3, 2)]
+    year = _Year(year_odds, OddsCatalog({2021: year_odds.catalog}), 2021, 2025, candidates)
+    assert None not in year.ids
+    monkeypatch.setattr(year_odds, "checkexact", _two_exact_rows)
+
+    estimate = year_odds.EstC2Odds(year.first[1], year.first[0])
+    assert conditional_odds(year_odds, year.ids, year.first) == [year.first[0], estimate]
+    assert year.second(0, 1, year.first[0]) == estimate
+
+
+def test_sequential_request_latency(tmp_path, monkeypatch):
+    # Every request is timed, the first one included: the default warm-up
+    # builds the choice-set matchers, so no request waits for one
+    monkeypatch.setattr(main, "ANALYTICS_DB_PATH", tmp_path / "analytics.db")
+    monkeypatch.setattr(main, "analytics_writer", AnalyticsWriter(tmp_path / "analytics.db"))
+    migrate(main.ANALYTICS_DB_PATH, main.SCHEMA_PATH)
+    main.analytics_writer.start()
+    main.warmup.start(main.warmup_steps())
+
+    assert main.warmup.wait(60)
+    index = main.odds_index
+    zones = sorted({z for y in index.years for z in index.year(y).catalog.zones if z != "None"})
+    rng = random.Random(1)
+    request = Request({"type": "http", "method": "POST", "path": "/estimate_odds", "headers": []})
+
+    async def run():
+        samples = []
+        for _ in range(200):
+            payload = main.OddsRequest(
+                data_years=[2020, 2021], mode="sequential",
+                choices=[{"zone": rng.choice(zones), "month": rng.randint(5, 10),
+                          "day": rng.randint(1, 28), "group_size": rng.randint(1, 8)}
+                         for _ in range(3)])
+            start = asyncio.get_running_loop().time()
+            response = await main.estimate_odds(payload, request)
+            samples.append(asyncio.get_running_loop().time() - start)
+            assert response.status_code == 200
+        return samples
+
+    try:
+        samples = asyncio.run(run())
+    finally:
+        main.analytics_writer.close()
+    p99 = float(np.percentile(samples, 99)) * 1000
+    assert p99 < BUDGET_MS, f"p99 {p99:.1f} ms"